@@ -0,0 +1,281 @@
+# app/ai_intent.py
+# Caminho rápido (regras locais) para extração de intents antes de chamar o LLM.
+from __future__ import annotations
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+INTENT_FIELDS = ("local", "data", "pagamento", "fora_do_perfil")
+
+# mensagens maiores que isso vão direto pro LLM (contexto demais pra regra)
+MAX_FAST_WORDS = 25
+
+_STOPWORDS = {
+    "a", "o", "as", "os", "e", "de", "da", "do", "das", "dos", "em", "no", "na", "nos", "nas",
+    "com", "sem", "como", "para", "pra", "por", "um", "uma", "sexo", "proprio", "propria",
+    "parceiros", "parceiras", "selecionados", "leve", "suave",
+}
+
+# frases/tokens que sozinhos não carregam intent nenhuma
+_SMALLTALK_PHRASES = ("bom dia", "boa tarde", "boa noite", "tudo bem", "tudo bom", "ta bom")
+_FILLER_TOKENS = {
+    "oi", "oii", "ola", "opa", "e", "ai", "voce", "vc", "ok", "okay", "blz", "beleza", "sim", "nao",
+    "ta", "certo", "combinado", "show", "perfeito", "otimo", "obrigado", "obrigada", "valeu", "vlw",
+    "quanto", "qual", "o", "a", "valor", "preco", "cobra", "hora", "fica", "gata", "linda", "amor",
+    "top", "massa", "entendi", "hum", "humm", "kk", "kkk", "kkkk", "rs", "haha", "tchau", "bjs", "beijo",
+}
+
+# marcadores de pedido: sem nenhum campo reconhecido, o LLM decide
+_REQUEST_MARKERS = re.compile(r"\b(rola|faz|fazer|topa|curte|libera|aceita|pode|posso|quero)\b")
+
+# negação perto de um campo ("não posso hoje", "nem pix", "sem motel") inverte o sentido: LLM decide
+_NEGATIONS = {"nao", "nem", "sem", "nunca", "jamais"}
+NEGATION_WINDOW = 4  # palavras antes do trecho reconhecido (e 1 logo depois: "pix não")
+
+# formas de pagamento conhecidas -> apelidos (texto normalizado)
+_PAYMENT_ALIASES = {
+    "pix": r"pix",
+    "dinheiro": r"dinheiro|especie|cash|em maos",
+    "cartao": r"cartao|credito|debito|maquininha",
+    "transferencia": r"transferencia|\bted\b|\bdoc\b",
+}
+
+# apelidos extras para tabus comuns (chave = radical que aparece no tabu)
+_TABU_ALIASES = {
+    "prese": ["camisinha", "sem capa", "no pelo", "sem protecao"],
+    "grava": ["gravar", "filmar", "filmagem", "video", "foto"],
+    "viole": ["bater", "agredir", "enforcar", "tapa na cara"],
+}
+
+# locais genéricos e a categoria que precisa constar nos locais da persona
+_PLACE_NOUNS = {
+    "motel": r"motel|moteis",
+    "hotel": r"hotel|hoteis",
+    "apartamento": r"apartamento|apto|ape|\bap\b|flat",
+    "casa": r"casa|residencia|domicilio",
+}
+
+_DATE_PATTERNS = [
+    r"\bdepois de amanha\b",
+    r"\b(hoje|hj|amanha|agora|mais tarde)\b",
+    r"\b(essa|esta|nessa|nesta|amanha a|hoje a)\s*(noite|tarde|manha|madrugada)\b",
+    r"\b(de|a|pela|na|no|durante a)\s+(manha|tarde|noite|madrugada)\b",
+    r"\b((na|no|nessa|nesse|proxima|proximo)\s+)?(segunda|terca|quarta|quinta|sexta)(-feira| feira)?\b",
+    r"\b((no|nesse|proximo)\s+)?(sabado|domingo|fim de semana|fds)\b",
+    r"\b((as|a partir das|umas|por volta das|la pelas)\s+)?\d{1,2}\s*(h|hs|hrs|horas)(\s*\d{2})?\b",
+    r"\b((as|a partir das|umas|por volta das)\s+)?\d{1,2}:\d{2}\b",
+    r"\bdia\s+\d{1,2}\b",
+    r"\b\d{1,2}/\d{1,2}(/\d{2,4})?\b",
+]
+
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acento, preservando o tamanho (índices batem com o texto original)."""
+    out = []
+    for c in text:
+        base = unicodedata.normalize("NFD", c)[0].lower()
+        out.append(base if len(base) == 1 else c)
+    return "".join(out)
+
+
+def _stems(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", normalize(text))
+    return [w[:5] if len(w) > 5 else w for w in words if w not in _STOPWORDS and len(w) >= 4]
+
+
+def _alternation(parts: List[str]) -> Optional[re.Pattern]:
+    parts = sorted({p for p in parts if p}, key=len, reverse=True)
+    if not parts:
+        return None
+    return re.compile(r"\b(" + "|".join(parts) + r")")
+
+
+def _merge_spans(spans: List[Tuple[int, int]], text: str) -> List[str]:
+    """Junta trechos vizinhos ("amanhã" + "às 20h" -> "amanhã às 20h")."""
+    merged: List[List[int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + 2 and not text[merged[-1][1]:start].strip(" ,"):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [text[s:e].strip() for s, e in merged]
+
+
+def _negated(norm: str, start: int, end: int, window: int = NEGATION_WINDOW) -> bool:
+    before = re.findall(r"[a-z]+", norm[:start])[-window:]
+    after = re.findall(r"[a-z]+", norm[end:])[:1]
+    return any(w in _NEGATIONS for w in before + after)
+
+
+class FastPathStats:
+    """Contadores do caminho rápido: quantas mensagens foram resolvidas sem LLM e por quê."""
+
+    def __init__(self):
+        self.total = 0
+        self.fast = 0
+        self.escalated = 0
+        self.reasons: Dict[str, int] = {}
+        self.fast_time = 0.0
+        self._lock = threading.Lock()  # o orquestrador chama match() de vários threads
+
+    def record(self, resolved: bool, reason: str, elapsed: float):
+        with self._lock:
+            self.total += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            if resolved:
+                self.fast += 1
+                self.fast_time += elapsed
+            else:
+                self.escalated += 1
+
+    @property
+    def hit_rate(self) -> float:
+        return self.fast / self.total if self.total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._as_dict()
+
+    def _as_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "fast": self.fast,
+            "escalated": self.escalated,
+            "hit_rate": round(self.hit_rate, 3),
+            "avg_fast_us": round(self.fast_time / self.fast * 1e6, 1) if self.fast else None,
+            "reasons": dict(self.reasons),
+        }
+
+
+class IntentMatcher:
+    """
+    Regras pré-compiladas por persona (locais, tabus, formas de pagamento, serviços) +
+    expressões de data/hora em português. `match()` devolve {"intents": {...}} quando o
+    caso é óbvio ou None quando a mensagem precisa ir pro LLM.
+    """
+
+    def __init__(self, garota: Dict[str, Any], stats: Optional[FastPathStats] = None):
+        self.persona_id = garota.get("id")
+        self.stats = stats or FastPathStats()
+        localizacao = garota.get("localizacao", {})
+        personalidade = garota.get("personalidade", {})
+        profissional = garota.get("profissional", {})
+
+        locais = localizacao.get("locais_atendimento", [])
+        locais_norm = normalize(" ".join(locais))
+        # nomes próprios citados nos locais (Pinheiros, Love Story) + bairro
+        proper = re.findall(r"[A-ZÀ-Ý][\wÀ-ÿ]+(?:\s+[A-ZÀ-Ý][\wÀ-ÿ]+)*", " ".join(locais))
+        if localizacao.get("bairro"):
+            proper.append(localizacao["bairro"])
+        self._local_names = _alternation([re.escape(normalize(p)) for p in proper])
+        self._places: List[Tuple[re.Pattern, bool]] = []
+        for category, pattern in _PLACE_NOUNS.items():
+            accepted = bool(re.search(pattern, locais_norm)) or category in locais_norm
+            self._places.append((re.compile(
+                r"\b((no|na|num|numa|em|seu|sua|meu|minha)\s+)?(" + pattern + r")\b"), accepted))
+
+        accepted_payments = normalize(" ".join(profissional.get("formas_pagamento", [])))
+        self._payment_labels = {normalize(p): p for p in profissional.get("formas_pagamento", [])}
+        self._payments: List[Tuple[re.Pattern, Optional[str]]] = []
+        for canon, pattern in _PAYMENT_ALIASES.items():
+            label = None
+            if re.search(pattern, accepted_payments):
+                label = next((v for k, v in self._payment_labels.items() if re.search(pattern, k)), canon)
+            self._payments.append((re.compile(r"\b(" + pattern + r")\b"), label))
+
+        tabu_parts: List[str] = []
+        for tabu in personalidade.get("tabus", []):
+            for stem in _stems(tabu):
+                tabu_parts.append(re.escape(stem))
+                tabu_parts.extend(re.escape(normalize(a)) for a in _TABU_ALIASES.get(stem, []))
+        self._tabus = _alternation(tabu_parts)
+
+        servicos = list(profissional.get("servicos_inclusos", []))
+        servicos += [e.get("nome", "") for e in profissional.get("extras", [])]
+        servicos += personalidade.get("fetiches", [])
+        self._services = _alternation([re.escape(s) for item in servicos for s in _stems(item)])
+
+        self._dates = [re.compile(p) for p in _DATE_PATTERNS]
+
+    def _is_smalltalk(self, norm: str) -> bool:
+        for phrase in _SMALLTALK_PHRASES:
+            norm = norm.replace(phrase, " ")
+        tokens = re.findall(r"[a-z0-9]+", norm)
+        return all(t in _FILLER_TOKENS for t in tokens)
+
+    def _classify(self, message: str) -> Tuple[Optional[Dict[str, str]], str]:
+        norm = normalize(message)
+        if len(norm.split()) > MAX_FAST_WORDS:
+            return None, "longa"
+        if self._tabus and self._tabus.search(norm):
+            return None, "tabu"
+        if self._is_smalltalk(norm):
+            return dict.fromkeys(INTENT_FIELDS, ""), "smalltalk"
+
+        intents = dict.fromkeys(INTENT_FIELDS, "")
+
+        for pattern, label in self._payments:
+            m = pattern.search(norm)
+            if m:
+                if _negated(norm, *m.span()):
+                    return None, "negacao"
+                if label is None:
+                    return None, "pagamento_nao_aceito"
+                intents["pagamento"] = label
+                break
+
+        local_spans: List[Tuple[int, int]] = []
+        for pattern, accepted in self._places:
+            m = pattern.search(norm)
+            if m:
+                if _negated(norm, m.start(3), m.end()):
+                    return None, "negacao"
+                if not accepted:
+                    return None, "local_fora"
+                end = m.end()
+                # "motel Love Story": estende com nomes próprios logo em seguida
+                tail = re.match(r"(\s+[A-ZÀ-Ý][\wÀ-ÿ]+)+", message[end:])
+                local_spans.append((m.start(3), end + (tail.end() if tail else 0)))
+        if self._local_names:
+            local_spans.extend(m.span() for m in self._local_names.finditer(norm))
+        if any(_negated(norm, start, end) for start, end in local_spans):
+            return None, "negacao"
+        if local_spans:
+            intents["local"] = " ".join(_merge_spans(local_spans, message))
+
+        date_spans = [m.span() for p in self._dates for m in p.finditer(norm)]
+        if any(_negated(norm, start, end) for start, end in date_spans):
+            return None, "negacao"
+        if date_spans:
+            intents["data"] = " ".join(_merge_spans(date_spans, message))
+
+        matched = any(intents.values())
+        if self._services and self._services.search(norm):
+            return None, "servico"
+        if not matched:
+            if _REQUEST_MARKERS.search(norm):
+                return None, "pedido"
+            return None, "desconhecido"
+        return intents, "regra"
+
+    def match(self, message: str) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        intents, reason = self._classify(message)
+        self.stats.record(intents is not None, reason, time.perf_counter() - start)
+        return {"intents": intents} if intents is not None else None
+
+
+_matchers: Dict[Any, IntentMatcher] = {}
+_matchers_lock = threading.Lock()
+
+
+def get_matcher(garota: Dict[str, Any], stats: Optional[FastPathStats] = None) -> IntentMatcher:
+    """Matcher compilado uma vez por persona (chave = id)."""
+    key = garota.get("id") or id(garota)
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is None:
+            matcher = _matchers[key] = IntentMatcher(garota, stats)
+        return matcher
@@ -0,0 +1,299 @@
+# app/ai_provider.py
+# Cliente único para o provider de chat (OpenAI-compatible), com pool de conexões keep-alive.
+from __future__ import annotations
+import json
+import re
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app import metrics
+from configs.config_loader import ConfigError, ProviderSettings, get_provider_config
+
+DEFAULT_REFERER = "https://github.com/macklee251/whatsapp-autoresponder"
+DEFAULT_TITLE = "whatsapp-autoresponder"
+
+
+@dataclass
+class StreamStats:
+    """Latência de uma resposta em streaming: time-to-first-token e tokens/s."""
+    model: str = ""
+    started_at: float = field(default_factory=time.perf_counter)
+    first_token_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    chunks: int = 0
+    completion_tokens: Optional[int] = None  # vem do bloco "usage" quando o provider manda
+    prompt_tokens: Optional[int] = None
+
+    def mark_chunk(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.chunks += 1
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def total(self) -> Optional[float]:
+        return None if self.finished_at is None else self.finished_at - self.started_at
+
+    @property
+    def tokens(self) -> int:
+        # sem "usage", cada delta SSE conta como ~1 token
+        return self.completion_tokens if self.completion_tokens is not None else self.chunks
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        gen_time = self.finished_at - self.first_token_at
+        return self.tokens / gen_time if gen_time > 0 else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "ttft_s": self.ttft,
+            "total_s": self.total,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+        }
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+class SentenceBuffer:
+    """Acumula deltas e libera frases completas assim que terminam (., !, ?, …)."""
+
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buf += text
+        parts = _SENTENCE_END.split(self._buf)
+        self._buf = parts.pop()
+        return [p.strip() for p in parts if p.strip()]
+
+    def flush(self) -> Optional[str]:
+        rest, self._buf = self._buf.strip(), ""
+        return rest or None
+
+
+class StreamCancel:
+    """
+    Cancela um chat_stream de outra thread: fecha a resposta HTTP aberta, então o stream
+    para mesmo se ainda estiver esperando o primeiro byte do corpo.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response: Optional[requests.Response] = None
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            response = self._response
+        if response is not None:
+            self._abort(response)
+
+    def attach(self, response: requests.Response):
+        with self._lock:
+            self._response = response
+            cancelled = self._event.is_set()
+        if cancelled:
+            self._abort(response)
+
+    @staticmethod
+    def _abort(response: requests.Response):
+        # shutdown acorda a thread bloqueada no recv; response.close() ficaria esperando por ela
+        connection = getattr(response.raw, "connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # já fechada
+
+
+class ProviderClient:
+    """
+    Resolve endpoint/headers/modelos uma única vez a partir do config_loader e reaproveita
+    as conexões HTTP (TCP/TLS) entre chamadas através de uma requests.Session.
+    """
+
+    def __init__(self, provider: Optional[str] = None, pool_size: int = 10, timeout: float = 60,
+                 settings: Optional[ProviderSettings] = None):
+        if settings is not None:
+            self.provider, self.settings = settings.name, settings
+        else:
+            self.provider, self.settings = get_provider_config(provider)
+        if not self.settings.endpoint:
+            raise ConfigError(f'Provider "{self.provider}" sem endpoint de chat configurado.')
+        self.endpoint = self.settings.endpoint
+        self.timeout = timeout
+        self.headers = dict(self.settings.headers)
+        self.headers["Authorization"] = f"Bearer {self.settings.api_key}"
+        self.headers.setdefault("Content-Type", "application/json")
+        self.headers.setdefault("HTTP-Referer", self.settings.get("referer", DEFAULT_REFERER))
+        self.headers.setdefault("X-Title", self.settings.get("app_title", DEFAULT_TITLE))
+        self.models = dict(self.settings.models)
+        self.default_model = self.settings.default_model
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(self.headers)
+
+    def _record(self, call: Dict[str, str], started: float, status: str, tokens_in: Optional[int] = None,
+                tokens_out: Optional[int] = None, error: Optional[BaseException] = None):
+        """Latência, status, tokens e erros da chamada (persona/operação vêm do metrics.labels)."""
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, status=status, **call)
+        metrics.REQUESTS.inc(status=status, **call)
+        if tokens_in:
+            metrics.TOKENS.inc(tokens_in, direction="in", **call)
+        if tokens_out:
+            metrics.TOKENS.inc(tokens_out, direction="out", **call)
+        if error is not None:
+            metrics.ERRORS.inc(error=status, **call)
+
+    def chat_completion(self, payload: Dict[str, Any], title: Optional[str] = None,
+                        timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Envia o payload como está e devolve o JSON bruto da resposta."""
+        payload = dict(payload)
+        payload.setdefault("model", self.default_model)
+        headers = {"X-Title": title} if title else None
+        call = {"provider": self.provider, "model": str(payload["model"])}
+        started = time.perf_counter()
+        with metrics.TRACER.span("llm.chat_completion", **call) as span:
+            try:
+                resp = self.session.post(self.endpoint, json=payload, headers=headers,
+                                         timeout=timeout or self.timeout)
+                resp.raise_for_status()
+                data = resp.json()
+            except Exception as e:
+                self._record(call, started, metrics.status_of(e), error=e)
+                raise
+            usage = data.get("usage") or {}
+            self._record(call, started, str(resp.status_code), usage.get("prompt_tokens"),
+                         usage.get("completion_tokens"))
+            span.set(status_code=resp.status_code, tokens_in=usage.get("prompt_tokens"),
+                     tokens_out=usage.get("completion_tokens"))
+        return data
+
+    def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+             title: Optional[str] = None, timeout: Optional[float] = None, **params: Any) -> str:
+        """Atalho: monta o payload e devolve só o texto da primeira escolha."""
+        payload = {"model": model or self.default_model, "messages": messages, **params}
+        data = self.chat_completion(payload, title=title, timeout=timeout)
+        return data["choices"][0]["message"]["content"]
+
+    def chat_stream(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                    title: Optional[str] = None, timeout: Optional[float] = None,
+                    stats: Optional[StreamStats] = None, cancel: Optional[StreamCancel] = None,
+                    **params: Any) -> Iterator[str]:
+        """
+        Streaming SSE (OpenAI-compatible): devolve os deltas de texto conforme chegam.
+        Se `stats` for informado, registra TTFT, duração e tokens da resposta. Com `cancel`,
+        outra thread pode interromper a chamada: o stream só termina (status "cancelled").
+        """
+        payload = {
+            "model": model or self.default_model,
+            "messages": messages,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **params,
+        }
+        stats = stats if stats is not None else StreamStats()
+        stats.model = payload["model"]
+        stats.started_at = time.perf_counter()
+        headers = {"X-Title": title} if title else None
+        call = {"provider": self.provider, "model": str(payload["model"])}
+        status, error = "200", None
+        with metrics.TRACER.span("llm.chat_stream", **call) as span:
+            try:
+                with self.session.post(self.endpoint, json=payload, headers=headers,
+                                       timeout=timeout or self.timeout, stream=True) as resp:
+                    resp.raise_for_status()
+                    status = str(resp.status_code)
+                    if cancel is not None:
+                        cancel.attach(resp)
+                    for raw in resp.iter_lines():
+                        if cancel is not None and cancel.is_set():
+                            break
+                        line = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+                        if not line or not line.startswith("data:"):
+                            continue  # keep-alive / comentários SSE
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+                        usage = chunk.get("usage")
+                        if usage:
+                            stats.completion_tokens = usage.get("completion_tokens")
+                            stats.prompt_tokens = usage.get("prompt_tokens")
+                        for choice in chunk.get("choices") or []:
+                            text = (choice.get("delta") or {}).get("content")
+                            if text:
+                                if stats.first_token_at is None:
+                                    metrics.TTFT.observe(time.perf_counter() - stats.started_at, **call)
+                                stats.mark_chunk()
+                                yield text
+            except GeneratorExit:
+                status = "cancelled"  # quem consumia parou (hedge perdedor, mensagem superada...)
+                raise
+            except Exception as e:
+                if cancel is not None and cancel.is_set():
+                    return  # a leitura falhou porque a resposta foi fechada por quem cancelou
+                status, error = metrics.status_of(e), e
+                raise
+            finally:
+                if cancel is not None and cancel.is_set():
+                    status, error = "cancelled", None
+                stats.finished_at = time.perf_counter()
+                span.set(status=status, ttft_s=stats.ttft, tokens_out=stats.tokens)
+                self._record(call, stats.started_at, status, stats.prompt_tokens, stats.tokens or None, error)
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[Optional[str], ProviderClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider: Optional[str] = None) -> ProviderClient:
+    """
+    Cliente compartilhado por processo (um por provider). Se o config.json mudar, o
+    config_loader devolve outro objeto de settings e o cliente é recriado.
+    """
+    _, settings = get_provider_config(provider)
+    stale = None
+    with _clients_lock:
+        current = _clients.get(provider)
+        if current is None or current.settings is not settings:
+            stale = current
+            current = _clients[provider] = ProviderClient(settings=settings)
+    if stale is not None:
+        stale.close()  # libera o pool de conexões do cliente antigo (chamadas em curso terminam normalmente)
+    return current
@@ -0,0 +1,334 @@
+# app/analytics.py
+# Log de eventos append-only (registros binários de tamanho fixo) + rollup incremental do analytics_daily.
+from __future__ import annotations
+import bisect
+import os
+import sqlite3
+import struct
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+ANALYTICS_DIR = PROJECT_ROOT / "data" / "analytics"
+TIMEZONE = "America/Sao_Paulo"  # o "dia" do painel é o dia local das garotas
+CHECKPOINT_EVERY = 5000  # eventos entre gravações do snapshot no SQLite
+READ_CHUNK = 4096  # registros por leitura no replay
+
+MESSAGE_IN = 1
+MESSAGE_OUT = 2
+BOOKING = 3
+PAYMENT = 4  # receita (centavos) entra por aqui; BOOKING também pode trazer o valor
+KINDS = {MESSAGE_IN: "messages_in", MESSAGE_OUT: "messages_out", BOOKING: "bookings", PAYMENT: "revenue"}
+
+# ts (epoch s), tipo, creator (índice na tabela de ids), valor em centavos: 20 bytes por evento
+_RECORD = struct.Struct("<dBxHq")
+
+
+class EventLog:
+    """
+    Arquivo só de append com registros de tamanho fixo; os ids de creator ficam numa tabela
+    à parte (`.creators`, um por linha) e o registro guarda só o índice. Offset em bytes serve
+    de checkpoint: o rollup sabe de onde continuar. Rabo cortado (queda no meio da escrita) é
+    descartado na abertura.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.creators_path = self.path.with_suffix(".creators")
+        self._lock = threading.Lock()
+        self.creators: List[str] = []
+        if self.creators_path.exists():
+            self.creators = [line for line in self.creators_path.read_text(encoding="utf-8").splitlines() if line]
+        self._index = {cid: i for i, cid in enumerate(self.creators)}
+        self._file = open(self.path, "ab")
+        tail = self._file.tell() % _RECORD.size
+        if tail:
+            self._file.truncate(self._file.tell() - tail)
+        self._creators_file = open(self.creators_path, "a", encoding="utf-8")
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._file.tell()
+
+    def _creator_index(self, creator_id: str) -> int:
+        idx = self._index.get(creator_id)
+        if idx is None:
+            idx = self._index[creator_id] = len(self.creators)
+            self.creators.append(creator_id)
+            # a tabela vai pro disco antes do primeiro evento que a usa
+            self._creators_file.write(creator_id + "\n")
+            self._creators_file.flush()
+        return idx
+
+    def append(self, kind: int, creator_id: str, amount: int = 0, ts: Optional[float] = None) -> int:
+        """Grava um evento; devolve o offset logo depois dele."""
+        return self.append_many([(kind, creator_id, amount, ts)])
+
+    def append_many(self, events: List[Tuple[int, str, int, Optional[float]]]) -> int:
+        now = time.time()
+        with self._lock:
+            data = b"".join(_RECORD.pack(ts if ts is not None else now, kind, self._creator_index(cid), amount)
+                            for kind, cid, amount, ts in events)
+            self._file.write(data)
+            self._file.flush()
+            return self._file.tell()
+
+    def read(self, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[float, int, str, int]]:
+        """Eventos a partir de `offset` numa passada só, lendo em blocos (memória constante)."""
+        end = self.size if end is None else end
+        creators = list(self.creators)
+        chunk = _RECORD.size * READ_CHUNK
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            pos = offset
+            while pos < end:
+                data = f.read(min(chunk, end - pos))
+                if not data:
+                    break
+                data = data[:len(data) - len(data) % _RECORD.size]
+                pos += len(data)
+                for ts, kind, idx, amount in _RECORD.iter_unpack(data):
+                    yield ts, kind, creators[idx], amount
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._creators_file.close()
+
+
+class DayClock:
+    """ts -> dia local; guarda o intervalo do último dia visto (eventos chegam quase em ordem)."""
+
+    def __init__(self, tz: str = TIMEZONE):
+        self.tz = ZoneInfo(tz)
+        self._start = self._end = 0.0
+        self._day = ""
+
+    def day(self, ts: float) -> str:
+        if self._start <= ts < self._end:
+            return self._day
+        local = datetime.fromtimestamp(ts, self.tz).date()
+        # meia-noite a meia-noite no fuso (dia de horário de verão pode ter 23 ou 25h)
+        self._start = datetime.combine(local, dtime(), self.tz).timestamp()
+        self._end = datetime.combine(local + timedelta(days=1), dtime(), self.tz).timestamp()
+        self._day = local.isoformat()
+        return self._day
+
+
+class DailyRollup:
+    """
+    Contadores por dia e por (dia, creator), atualizados evento a evento. As consultas de
+    intervalo usam a lista ordenada de dias (bisect) e nunca tocam nos eventos brutos.
+    """
+
+    def __init__(self, tz: str = TIMEZONE):
+        self.clock = DayClock(tz)
+        self.days: Dict[str, List[int]] = {}
+        self.by_creator: Dict[str, Dict[str, List[int]]] = {}
+        self._sorted: List[str] = []
+        self._sorted_creator: Dict[str, List[str]] = {}
+        self.dirty: set = set()  # (dia, creator) alterados desde o último snapshot
+        self.events = 0
+
+    def apply(self, ts: float, kind: int, creator_id: str, amount: int = 0):
+        day = self.clock.day(ts)
+        totals = self.days.get(day)
+        if totals is None:
+            totals = self.days[day] = [0, 0, 0, 0]
+            bisect.insort(self._sorted, day)
+        per_day = self.by_creator.get(creator_id)
+        if per_day is None:
+            per_day = self.by_creator[creator_id] = {}
+            self._sorted_creator[creator_id] = []
+        row = per_day.get(day)
+        if row is None:
+            row = per_day[day] = [0, 0, 0, 0]
+            bisect.insort(self._sorted_creator[creator_id], day)
+        if kind == PAYMENT:
+            totals[3] += amount
+            row[3] += amount
+        else:
+            totals[kind - 1] += 1
+            row[kind - 1] += 1
+            if kind == BOOKING and amount:
+                totals[3] += amount
+                row[3] += amount
+        self.dirty.add((day, creator_id))
+        self.events += 1
+
+    def load_row(self, day: str, creator_id: str, values: List[int]):
+        """Linha vinda do snapshot (não conta como alterada)."""
+        per_day = self.by_creator.setdefault(creator_id, {})
+        days = self._sorted_creator.setdefault(creator_id, [])
+        if day not in per_day:
+            bisect.insort(days, day)
+        per_day[day] = list(values)
+        totals = self.days.get(day)
+        if totals is None:
+            totals = self.days[day] = [0, 0, 0, 0]
+            bisect.insort(self._sorted, day)
+        for i, v in enumerate(values):
+            totals[i] += v
+
+    def query(self, start: str, end: str, creator_id: Optional[str] = None) -> Dict[str, Any]:
+        """Totais e linhas diárias de start..end (inclusive, "AAAA-MM-DD")."""
+        if creator_id is None:
+            days, rows = self._sorted, self.days
+        else:
+            days, rows = self._sorted_creator.get(creator_id, []), self.by_creator.get(creator_id, {})
+        lo, hi = bisect.bisect_left(days, start), bisect.bisect_right(days, end)
+        daily = [_as_row(day, rows[day]) for day in days[lo:hi]]
+        totals = [sum(r[f] for r in daily) for f in ("messages_in", "messages_out", "bookings")]
+        revenue = sum(rows[day][3] for day in days[lo:hi])
+        return {"start": start, "end": end, "creator": creator_id, "days": daily,
+                "totals": {"messages_in": totals[0], "messages_out": totals[1], "bookings": totals[2],
+                           "revenue": revenue / 100}}
+
+
+def _as_row(day: str, values: List[int]) -> Dict[str, Any]:
+    return {"day": day, "messages_in": values[0], "messages_out": values[1], "bookings": values[2],
+            "revenue": values[3] / 100}
+
+
+class AnalyticsStore:
+    """
+    Log + rollup + snapshot em SQLite (analytics_daily e analytics_daily_creator do
+    architecture.yaml, com o offset do log já aplicado). Ao abrir, carrega o snapshot e
+    reaplica só o trecho do log depois do offset; rebuild() refaz tudo numa passada.
+    """
+
+    def __init__(self, directory: Path = ANALYTICS_DIR, tz: str = TIMEZONE,
+                 checkpoint_every: int = CHECKPOINT_EVERY):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.tz = tz
+        self.checkpoint_every = checkpoint_every
+        self.log = EventLog(directory / "events.log")
+        self._db = sqlite3.connect(str(directory / "analytics.sqlite3"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS analytics_daily (
+                day TEXT PRIMARY KEY, messages_in INTEGER, messages_out INTEGER, bookings INTEGER,
+                revenue NUMERIC);
+            CREATE TABLE IF NOT EXISTS analytics_daily_creator (
+                day TEXT, creator_id TEXT, messages_in INTEGER, messages_out INTEGER, bookings INTEGER,
+                revenue_cents INTEGER, PRIMARY KEY (day, creator_id));
+            CREATE TABLE IF NOT EXISTS analytics_checkpoint (id INTEGER PRIMARY KEY CHECK (id = 1), offset INTEGER);
+        """)
+        self._lock = threading.Lock()
+        self.rollup = DailyRollup(tz)
+        self.offset = 0
+        self._since_checkpoint = 0
+        self.replayed = self._load()
+
+    def _load(self) -> int:
+        """Snapshot + eventos do log depois dele; devolve quantos eventos foram reaplicados."""
+        row = self._db.execute("SELECT offset FROM analytics_checkpoint WHERE id = 1").fetchone()
+        offset = row[0] if row else 0
+        if offset == 0 or offset > self.log.size:
+            # sem snapshot, ou log menor que ele (trocaram o arquivo): refaz do zero
+            offset = 0
+            self._clear_snapshot()
+        else:
+            for day, cid, *values in self._db.execute(
+                    "SELECT day, creator_id, messages_in, messages_out, bookings, revenue_cents "
+                    "FROM analytics_daily_creator"):
+                self.rollup.load_row(day, cid, values)
+        replayed = 0
+        end = self.log.size
+        for ts, kind, cid, amount in self.log.read(offset, end):
+            self.rollup.apply(ts, kind, cid, amount)
+            replayed += 1
+        self.offset = end
+        if replayed:
+            self.checkpoint()
+        return replayed
+
+    def record(self, kind: int, creator_id: str, amount: int = 0, ts: Optional[float] = None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self.offset = self.log.append(kind, creator_id, amount, ts)
+            self.rollup.apply(ts, kind, creator_id, amount)
+            self._since_checkpoint += 1
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._checkpoint()
+
+    def message_in(self, creator_id: str, count: int = 1, ts: Optional[float] = None):
+        for _ in range(count):
+            self.record(MESSAGE_IN, creator_id, ts=ts)
+
+    def message_out(self, creator_id: str, ts: Optional[float] = None):
+        self.record(MESSAGE_OUT, creator_id, ts=ts)
+
+    def booking(self, creator_id: str, revenue: float = 0.0, ts: Optional[float] = None):
+        """revenue em reais (valor combinado do agendamento)."""
+        self.record(BOOKING, creator_id, int(round(revenue * 100)), ts)
+
+    def payment(self, creator_id: str, amount: float, ts: Optional[float] = None):
+        self.record(PAYMENT, creator_id, int(round(amount * 100)), ts)
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Grava só os (dia, creator) alterados + o offset, numa transação."""
+        rollup = self.rollup
+        dirty = rollup.dirty
+        rollup.dirty = set()
+        days = {day for day, _ in dirty}
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO analytics_daily_creator VALUES (?, ?, ?, ?, ?, ?)",
+                [(day, cid, *rollup.by_creator[cid][day]) for day, cid in dirty])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO analytics_daily VALUES (?, ?, ?, ?, ?)",
+                [(day, *rollup.days[day][:3], rollup.days[day][3] / 100) for day in days])
+            self._db.execute("INSERT OR REPLACE INTO analytics_checkpoint VALUES (1, ?)", (self.offset,))
+        self._since_checkpoint = 0
+
+    def _clear_snapshot(self):
+        with self._db:
+            self._db.execute("DELETE FROM analytics_daily_creator")
+            self._db.execute("DELETE FROM analytics_daily")
+            self._db.execute("DELETE FROM analytics_checkpoint")
+
+    def rebuild(self) -> int:
+        """Recalcula tudo a partir do log (uma passada) e regrava o snapshot."""
+        with self._lock:
+            self.rollup = DailyRollup(self.tz)
+            end = self.log.size
+            for ts, kind, cid, amount in self.log.read(0, end):
+                self.rollup.apply(ts, kind, cid, amount)
+            self.offset = end
+            self._clear_snapshot()
+            self._checkpoint()
+            return self.rollup.events
+
+    def query(self, start: str, end: str, creator_id: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            return self.rollup.query(start, end, creator_id)
+
+    def today(self) -> str:
+        return datetime.now(ZoneInfo(self.tz)).date().isoformat()
+
+    def close(self):
+        self.checkpoint()
+        self.log.close()
+        self._db.close()
+
+
+def day_range(days: int, end: Optional[date] = None, tz: str = TIMEZONE) -> Tuple[str, str]:
+    """(início, fim) dos últimos `days` dias locais, pro painel."""
+    end = end or datetime.now(ZoneInfo(tz)).date()
+    return (end - timedelta(days=days - 1)).isoformat(), end.isoformat()
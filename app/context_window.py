@@ -0,0 +1,142 @@
+# app/context_window.py
+# Janela de contexto da IA 1 limitada por orçamento de tokens (em vez de "últimas 5 mensagens").
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # sem tiktoken: estimativa por caracteres
+    tiktoken = None
+
+# overhead aproximado do formato chat (por mensagem e para o priming da resposta)
+TOKENS_PER_MESSAGE = 4
+TOKENS_REPLY_PRIMING = 3
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    name = model.split("/")[-1]
+    try:
+        return tiktoken.encoding_for_model(name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base" if "4o" in name else "cl100k_base")
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, model: str = "openai/gpt-4o") -> int:
+    enc = _encoding(model)
+    if enc is None:
+        # português fica em ~3.5 caracteres por token nos tokenizadores BPE comuns
+        return max(1, int(len(text) / 3.5) + 1)
+    return len(enc.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "openai/gpt-4o") -> int:
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m.get("content", ""), model) for m in messages) + TOKENS_REPLY_PRIMING
+
+
+def extractive_summary(turns: List[Dict[str, str]], max_chars: int = 140) -> List[str]:
+    """Resumo local (sem LLM): primeira frase de cada turno, encurtada."""
+    lines = []
+    for t in turns:
+        text = " ".join(t.get("content", "").split())
+        first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        if len(first) > max_chars:
+            first = first[:max_chars - 1].rstrip() + "…"
+        who = "Cliente" if t.get("role") == "user" else "Você"
+        lines.append(f"{who}: {first}")
+    return lines
+
+
+class ContextWindow:
+    """
+    Monta as mensagens de uma conversa dentro de `budget` tokens de prompt: system + resumo
+    opcional + turnos mais recentes (de trás pra frente) + mensagem nova. O histórico
+    escolhido sempre começa num turno do cliente e alterna user/assistant. Turnos que saem
+    da janela podem ser dobrados num resumo rolante limitado a `summary_budget` tokens.
+    """
+
+    def __init__(self, budget: int = 1200, model: str = "openai/gpt-4o", summarize: bool = True,
+                 summary_budget: int = 200,
+                 summarizer: Optional[Callable[[List[Dict[str, str]]], List[str]]] = None):
+        self.budget = budget
+        self.model = model
+        self.summarize = summarize
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer or extractive_summary
+        self.summary_lines: List[str] = []
+        self._folded = 0  # quantos turnos do histórico já entraram no resumo
+        self.last_prompt_tokens = 0
+        self.last_turns_used = 0
+
+    @staticmethod
+    def _alternating(history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Junta turnos seguidos do mesmo papel e descarta papéis estranhos."""
+        out: List[Dict[str, str]] = []
+        for m in history:
+            if m.get("role") not in ("user", "assistant"):
+                continue
+            if out and out[-1]["role"] == m["role"]:
+                out[-1] = {"role": m["role"], "content": out[-1]["content"] + "\n" + m["content"]}
+            else:
+                out.append({"role": m["role"], "content": m["content"]})
+        return out
+
+    def _summary_message(self) -> Optional[Dict[str, str]]:
+        if not self.summary_lines:
+            return None
+        return {"role": "system", "content": "Resumo da conversa até aqui:\n" + "\n".join(self.summary_lines)}
+
+    def _fold(self, turns: List[Dict[str, str]]):
+        self.summary_lines.extend(self.summarizer(turns))
+        # mantém o resumo dentro do orçamento descartando as linhas mais antigas
+        while len(self.summary_lines) > 1 and \
+                count_tokens("\n".join(self.summary_lines), self.model) > self.summary_budget:
+            self.summary_lines.pop(0)
+
+    def build(self, system_prompt: str, history: List[Dict[str, str]], new_message: str) -> List[Dict[str, str]]:
+        turns = self._alternating(history)
+        # a mensagem nova é do cliente: o histórico precisa terminar na resposta da garota
+        if turns and turns[-1]["role"] == "user":
+            turns = turns[:-1]
+
+        head = [{"role": "system", "content": system_prompt}]
+        tail = [{"role": "user", "content": new_message}]
+        reserved = count_message_tokens(head + tail, self.model)
+        if self.summarize:
+            reserved += TOKENS_PER_MESSAGE + self.summary_budget
+
+        available = self.budget - reserved
+        start = len(turns)
+        used = 0
+        while start > 0:
+            cost = TOKENS_PER_MESSAGE + count_tokens(turns[start - 1]["content"], self.model)
+            if used + cost > available:
+                break
+            used += cost
+            start -= 1
+        # começa sempre num turno do cliente
+        while start < len(turns) and turns[start]["role"] != "user":
+            start += 1
+
+        if self.summarize and start > self._folded:
+            self._fold(turns[self._folded:start])
+            self._folded = start
+
+        summary = self._summary_message() if self.summarize else None
+        messages = head + ([summary] if summary else []) + turns[start:] + tail
+        self.last_turns_used = len(turns) - start
+        self.last_prompt_tokens = count_message_tokens(messages, self.model)
+        return messages
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.last_prompt_tokens,
+            "turns_used": self.last_turns_used,
+            "summary_lines": len(self.summary_lines),
+            "budget": self.budget,
+        }
@@ -0,0 +1,251 @@
+# app/conversation_state.py
+# Estado compacto por conversa (slots de intents + timestamps), com backend plugável.
+from __future__ import annotations
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from app.ai_intent import INTENT_FIELDS
+
+STATE_KEY = "conv:{id}:state"  # chave planejada em configs/architecture.yaml (cache.keys)
+STATE_TTL = 24 * 3600  # conversa parada há mais que isso é descartada
+MAX_CONVERSATIONS = 10000
+SWEEP_EVERY = 1000  # LocalRedis varre as chaves vencidas a cada N escritas
+
+_BIT = {field: 1 << i for i, field in enumerate(INTENT_FIELDS)}
+BOOKING_MASK = _BIT["local"] | _BIT["data"] | _BIT["pagamento"]
+
+
+def state_key(conversation_id: str) -> str:
+    return STATE_KEY.format(id=conversation_id)
+
+
+class ConversationState:
+    """
+    Slots de intents de uma conversa. `mask` marca os campos preenchidos, então checar
+    agendamento completo é uma operação de bits, sem olhar os textos.
+    """
+
+    __slots__ = ("conversation_id", "persona_id", "intents", "updated", "mask", "created", "touched")
+
+    def __init__(self, conversation_id: str, persona_id: str = ""):
+        now = time.time()
+        self.conversation_id = conversation_id
+        self.persona_id = persona_id
+        self.intents: Dict[str, str] = {k: "" for k in INTENT_FIELDS}
+        self.updated: Dict[str, float] = {}
+        self.mask = 0
+        self.created = now
+        self.touched = now
+
+    def merge(self, intents: Dict[str, Any], now: Optional[float] = None) -> List[str]:
+        """Preenche os slots com os campos não vazios; devolve os campos que mudaram."""
+        now = now if now is not None else time.time()
+        changed = []
+        for k in INTENT_FIELDS:
+            value = intents.get(k)
+            if value and value != self.intents[k]:
+                self.intents[k] = value
+                self.updated[k] = now
+                self.mask |= _BIT[k]
+                changed.append(k)
+        self.touched = now
+        return changed
+
+    def booking_complete(self) -> bool:
+        return self.mask & BOOKING_MASK == BOOKING_MASK
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"c": self.conversation_id, "p": self.persona_id, "i": {k: v for k, v in self.intents.items() if v},
+                "u": self.updated, "m": self.mask, "cr": self.created, "t": self.touched}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationState":
+        state = cls(data["c"], data.get("p", ""))
+        state.intents.update(data.get("i") or {})
+        state.updated = dict(data.get("u") or {})
+        state.mask = int(data.get("m") or 0)
+        state.created = data.get("cr", state.created)
+        state.touched = data.get("t", state.touched)
+        return state
+
+
+class StateBackend(Protocol):
+    def get(self, key: str) -> Optional[ConversationState]: ...
+    def set(self, key: str, state: ConversationState, ttl: float) -> None: ...
+    def delete(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    """LRU + TTL em processo; guarda os objetos direto (sem serializar)."""
+
+    def __init__(self, max_entries: int = MAX_CONVERSATIONS):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Tuple[ConversationState, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[ConversationState]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            state, expires = item
+            if time.time() > expires:
+                del self._items[key]
+                self.expired += 1
+                return None
+            self._items.move_to_end(key)
+            return state
+
+    def set(self, key: str, state: ConversationState, ttl: float):
+        with self._lock:
+            self._items[key] = (state, time.time() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class LocalRedis:
+    """
+    Substituto local do Redis com o subconjunto usado aqui (get/set com ex/delete), pra
+    rodar o RedisBackend sem servidor. Valores ficam como bytes, igual ao redis-py.
+    Chaves vencidas saem na leitura ou numa varredura a cada `sweep_every` escritas
+    (o Redis de verdade também expira chaves que ninguém lê).
+    """
+
+    def __init__(self, sweep_every: int = SWEEP_EVERY):
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self.expired = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and time.time() > expires:
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None):
+        data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+        with self._lock:
+            now = time.time()
+            self._data[key] = (data, now + ex if ex else None)
+            self._writes += 1
+            if self.sweep_every and self._writes % self.sweep_every == 0:
+                self._sweep(now)
+        return True
+
+    def _sweep(self, now: float):
+        """Remove as chaves vencidas (chamado com o lock adquirido)."""
+        dead = [k for k, (_, expires) in self._data.items() if expires is not None and now > expires]
+        for k in dead:
+            del self._data[k]
+        self.expired += len(dead)
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    def dbsize(self) -> int:
+        return len(self._data)
+
+
+class RedisBackend:
+    """Estado serializado em JSON numa instância Redis (redis-py ou LocalRedis); TTL via EX."""
+
+    def __init__(self, client: Any = None, url: Optional[str] = None):
+        if client is None:
+            try:
+                import redis  # opcional
+            except ImportError as e:
+                raise RuntimeError("Pacote 'redis' não instalado; use LocalRedis() ou MemoryBackend.") from e
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+
+    def get(self, key: str) -> Optional[ConversationState]:
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        return ConversationState.from_dict(json.loads(raw))
+
+    def set(self, key: str, state: ConversationState, ttl: float):
+        self.client.set(key, json.dumps(state.to_dict(), ensure_ascii=False, separators=(",", ":")),
+                        ex=max(1, int(ttl)))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+
+class ConversationStateStore:
+    """
+    Estado de intents por conversa, chave conv:{id}:state. Cada mensagem faz um get + um set
+    do slot da conversa (O(1)); o TTL é renovado a cada escrita, então só conversas paradas
+    expiram, e o backend em memória ainda limita o total por LRU.
+    """
+
+    def __init__(self, backend: Optional[StateBackend] = None, ttl: float = STATE_TTL):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id: str) -> Optional[ConversationState]:
+        state = self.backend.get(state_key(conversation_id))
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return state
+
+    def load(self, conversation_id: str, persona_id: str = "") -> ConversationState:
+        """Estado existente ou um novo (ainda não gravado)."""
+        return self.get(conversation_id) or ConversationState(conversation_id, persona_id)
+
+    def save(self, state: ConversationState):
+        self.backend.set(state_key(state.conversation_id), state, self.ttl)
+
+    def merge(self, conversation_id: str, intents: Dict[str, Any],
+              persona_id: str = "") -> Tuple[ConversationState, List[str], bool]:
+        """
+        Junta os intents de uma mensagem. Devolve (estado, campos alterados, completou_agora),
+        onde completou_agora só é True na mensagem que fechou local + data + pagamento.
+        """
+        state = self.load(conversation_id, persona_id)
+        was_complete = state.booking_complete()
+        changed = state.merge(intents)
+        self.save(state)
+        return state, changed, state.booking_complete() and not was_complete
+
+    def booking_complete(self, conversation_id: str) -> bool:
+        state = self.get(conversation_id)
+        return state is not None and state.booking_complete()
+
+    def delete(self, conversation_id: str):
+        self.backend.delete(state_key(conversation_id))
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"hits": self.hits, "misses": self.misses}
+        for name in ("evictions", "expired"):
+            if hasattr(self.backend, name):
+                out[name] = getattr(self.backend, name)
+        if hasattr(self.backend, "__len__"):
+            out["conversations"] = len(self.backend)
+        return out
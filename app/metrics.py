@@ -0,0 +1,295 @@
+# app/metrics.py
+# Métricas (formato texto do Prometheus) e spans de trace das chamadas aos providers.
+from __future__ import annotations
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+LOGS_DIR = PROJECT_ROOT / "logs"  # monitoring.logs_dir do architecture.yaml
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TTFT_BUCKETS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 2.0, 5.0)
+
+# labels da requisição atual (persona, operação...), herdados por quem chama o provider
+_labels: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("metric_labels", default={})
+
+
+@contextmanager
+def labels(**values: Any) -> Iterator[None]:
+    """Define labels (ex.: persona="gp001", operation="ia1") para as chamadas feitas dentro do bloco."""
+    token = _labels.set({**_labels.get(), **{k: str(v) for k, v in values.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _reset(_labels, token)
+
+
+def _reset(var: contextvars.ContextVar, token: contextvars.Token):
+    # gerador fechado em outro contexto (ex.: stream abandonado): o valor some com o contexto
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+
+def current_labels() -> Dict[str, str]:
+    return _labels.get()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, values: Dict[str, Any]) -> Tuple[str, ...]:
+        ctx = _labels.get()
+        return tuple(str(values.get(n, ctx.get(n, ""))) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        """Labels não informados vêm do contexto (metrics.labels) ou ficam vazios."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # contagens por bucket + [soma, total]
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+                    break
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, data):
+                    cumulative += count
+                    le = 'le="%s"' % format(bound, "g")
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative:g}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {data[-1]:g}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {data[-2]:.6f}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {data[-1]:g}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> Any:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+    def write_textfile(self, path: Path):
+        """Grava atomicamente (pro textfile collector do node_exporter ou inspeção manual)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Endpoint local GET /metrics numa thread daemon."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = Registry()
+
+_CALL = ("provider", "model", "persona", "operation")
+REQUEST_LATENCY = REGISTRY.histogram("llm_request_duration_seconds", "Duração das chamadas ao provider.",
+                                     _CALL + ("status",))
+TTFT = REGISTRY.histogram("llm_time_to_first_token_seconds", "Tempo até o primeiro token (streaming).",
+                          _CALL, TTFT_BUCKETS)
+REQUESTS = REGISTRY.counter("llm_requests_total", "Chamadas ao provider por status.", _CALL + ("status",))
+TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens de entrada (in) e saída (out).", _CALL + ("direction",))
+ERRORS = REGISTRY.counter("llm_errors_total", "Erros nas chamadas ao provider.", _CALL + ("error",))
+RETRIES = REGISTRY.counter("llm_retries_total", "Novas tentativas depois de erro.", _CALL)
+FALLBACKS = REGISTRY.counter("llm_fallbacks_total", "Fallbacks (failover, hedge, diálogo padrão...).",
+                             _CALL + ("kind",))
+ROUTE_DECISIONS = REGISTRY.counter("llm_route_decisions_total", "Escolhas do roteador de modelos (pequeno/grande).",
+                                   ("operation", "tier", "model"))
+
+
+def status_of(error: BaseException) -> str:
+    code = getattr(getattr(error, "response", None), "status_code", None)
+    return str(code) if code else type(error).__name__
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start", "duration", "status")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+
+    def set(self, **attrs: Any):
+        self.attrs.update(attrs)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                "parent_id": self.parent_id, "start": self.start, "duration_s": self.duration,
+                "status": self.status, "attrs": self.attrs}
+
+
+class _NoopSpan:
+    def set(self, **attrs: Any):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Spans por requisição gravados em JSONL (logs/traces.jsonl). Desligado = custo ~zero."""
+
+    def __init__(self, path: Path = LOGS_DIR / "traces.jsonl", enabled: bool = False):
+        self.path = Path(path)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._file = None
+
+    def enable(self, path: Optional[Path] = None):
+        with self._lock:
+            if path is not None:
+                self.path = Path(path)
+            self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Any]:
+        if not self.enabled:
+            yield _NOOP
+            return
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+                    parent.span_id if parent else None, {**_labels.get(), **attrs})
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = status_of(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _reset(_current_span, token)
+            self._write(span)
+
+    def _write(self, span: Span):
+        line = json.dumps(span.as_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+TRACER = Tracer()
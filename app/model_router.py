@@ -0,0 +1,226 @@
+# app/model_router.py
+# Escolha do modelo por turno: o pequeno/rápido pro rotineiro, o grande só quando o turno pede.
+from __future__ import annotations
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from app import metrics
+from app.ai_intent import INTENT_FIELDS, MAX_FAST_WORDS, normalize
+
+SMALL = "small"
+LARGE = "large"
+WINDOW = 1000  # latências guardadas por rota pro relatório
+
+# US$ por 1M tokens (entrada, saída), aproximado da tabela do OpenRouter; sobrescreva em config "routing.prices"
+PRICES: Dict[str, Tuple[float, float]] = {
+    "openai/gpt-4o": (2.50, 10.00),
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "meta-llama/llama-3-8b-instruct": (0.03, 0.06),
+    "meta-llama/llama-3.1-70b-instruct": (0.12, 0.30),
+    "qwen/qwen-2.5-7b-instruct": (0.04, 0.10),
+}
+
+# negociação, objeção, segurança, limites: turnos em que uma resposta ruim custa o cliente
+ESCALATE_TERMS = (
+    r"desconto", r"mais barat", r"\bcaro\b", r"negoci", r"faz por", r"abaix",
+    r"golpe", r"fake", r"\bfalsa?\b", r"seguranca", r"policia", r"reclam", r"cancel", r"desist",
+    r"sem camisinha", r"sem preservativo", r"no pelo", r"sem capa", r"gravar", r"filmar",
+    r"\bidade\b", r"\bmenor\b", r"casad", r"sigilo", r"discri",
+)
+# sem nenhuma palavra fora daqui o turno é conversa fiada (o modelo pequeno dá conta)
+ROUTINE_TOKENS = {
+    "oi", "oii", "ola", "opa", "e", "ai", "tudo", "bem", "bom", "boa", "dia", "tarde", "noite", "ok", "blz",
+    "beleza", "sim", "nao", "ta", "certo", "combinado", "show", "perfeito", "otimo", "obrigado", "obrigada",
+    "valeu", "vlw", "kk", "kkk", "kkkk", "rs", "haha", "tchau", "bjs", "beijo", "entendi", "hum", "top",
+    "quanto", "qual", "o", "a", "valor", "preco", "cobra", "hora", "fica", "voce", "vc", "gata", "linda",
+}
+
+
+@dataclass
+class RoutingPolicy:
+    """
+    Quando um turno sobe pro modelo grande. O padrão é o pequeno; qualquer regra que
+    disparar escala (e entra nos motivos da decisão).
+    """
+    max_words: int = MAX_FAST_WORDS  # mais palavras que isso = turno complexo (mesmo corte do caminho rápido)
+    max_questions: int = 1  # várias perguntas num turno só
+    escalate_terms: Sequence[str] = ESCALATE_TERMS
+    high_value_fields: int = 3  # local+data+pagamento já informados: confirmação/fechamento vai pro grande
+    escalate_out_of_profile: bool = True  # cliente já pediu algo fora do perfil
+    escalate_first_turn: bool = False  # primeira impressão com o modelo grande
+    enabled: bool = True  # False: sempre o pequeno
+    _pattern: Optional[re.Pattern] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self._pattern = re.compile("|".join(f"(?:{t})" for t in self.escalate_terms)) if self.escalate_terms else None
+
+    @classmethod
+    def from_dict(cls, block: Mapping[str, Any], base: Optional["RoutingPolicy"] = None) -> "RoutingPolicy":
+        base = base or cls()
+        values = {k: getattr(base, k) for k in ("max_words", "max_questions", "escalate_terms", "high_value_fields",
+                                                "escalate_out_of_profile", "escalate_first_turn", "enabled")}
+        values.update({k: v for k, v in block.items() if k in values})
+        values["escalate_terms"] = tuple(values["escalate_terms"]) + tuple(block.get("extra_terms") or ())
+        return cls(**values)
+
+    def reasons(self, message: str, intents: Optional[Mapping[str, str]] = None, turn: int = 0) -> List[str]:
+        if not self.enabled:
+            return []
+        norm = normalize(message)
+        words = re.findall(r"[a-z0-9]+", norm)
+        out = []
+        if len(words) > self.max_words and not all(w in ROUTINE_TOKENS for w in words):
+            out.append("long")
+        if message.count("?") > self.max_questions:
+            out.append("questions")
+        if self._pattern is not None and self._pattern.search(norm):
+            out.append("sensitive")
+        intents = intents or {}
+        if self.high_value_fields and sum(1 for k in INTENT_FIELDS[:3] if intents.get(k)) >= self.high_value_fields:
+            out.append("high_value")
+        if self.escalate_out_of_profile and intents.get("fora_do_perfil"):
+            out.append("out_of_profile")
+        if self.escalate_first_turn and turn == 0:
+            out.append("first_turn")
+        return out
+
+
+# IA 1: regras acima. IA 2: extração é rotineira; só mensagem longa ou cheia de perguntas escala.
+DEFAULT_POLICIES = {
+    "ia1": RoutingPolicy(),
+    "ia2": RoutingPolicy(max_words=40, max_questions=3, escalate_terms=(), high_value_fields=0,
+                         escalate_out_of_profile=False),
+}
+
+
+@dataclass
+class RouteDecision:
+    operation: str
+    tier: str
+    model: str
+    reasons: Tuple[str, ...] = ()
+
+
+class _RouteStats:
+    __slots__ = ("count", "errors", "cancelled", "latencies", "ttfts", "tokens_in", "tokens_out", "cost")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.latencies: Deque[float] = deque(maxlen=WINDOW)
+        self.ttfts: Deque[float] = deque(maxlen=WINDOW)
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cost = 0.0
+
+
+def _percentile(values: Sequence[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class ModelRouter:
+    """
+    Escolhe entre o modelo pequeno (default_model_ia2) e o grande (default_model_ia1) a cada
+    chamada, com features locais baratas (tamanho, perguntas, termos sensíveis, progresso do
+    agendamento). record() acumula latência, tokens e custo por operação e modelo, pra calibrar
+    as políticas com dados reais.
+    """
+
+    def __init__(self, small: str, large: str, policies: Optional[Mapping[str, RoutingPolicy]] = None,
+                 prices: Optional[Mapping[str, Tuple[float, float]]] = None):
+        self.models = {SMALL: small, LARGE: large}
+        self.policies = {**DEFAULT_POLICIES, **(policies or {})}
+        self.prices = {**PRICES, **{k: tuple(v) for k, v in (prices or {}).items()}}
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], _RouteStats] = {}
+        self.reason_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_client(cls, client: Any, config: Optional[Mapping[str, Any]] = None) -> "ModelRouter":
+        """Modelos do provider (ia1 = grande, ia2 = pequeno) + bloco opcional "routing" da config."""
+        config = config or {}
+        models = getattr(client, "models", None) or {}
+        large = config.get("large_model") or models.get("ia1") or client.default_model
+        small = config.get("small_model") or models.get("ia2") or large
+        policies = {op: RoutingPolicy.from_dict(block, DEFAULT_POLICIES.get(op))
+                    for op, block in (config.get("policies") or {}).items()}
+        return cls(small, large, policies, config.get("prices"))
+
+    def choose(self, operation: str, message: str, intents: Optional[Mapping[str, str]] = None,
+               turn: int = 0) -> RouteDecision:
+        policy = self.policies.get(operation)
+        reasons = tuple(policy.reasons(message, intents, turn)) if policy else ()
+        tier = LARGE if reasons else SMALL
+        with self._lock:
+            for reason in reasons or ("routine",):
+                self.reason_counts[reason] = self.reason_counts.get(reason, 0) + 1
+        metrics.ROUTE_DECISIONS.inc(operation=operation, tier=tier, model=self.models[tier])
+        return RouteDecision(operation, tier, self.models[tier], reasons)
+
+    def cost(self, model: str, tokens_in: int, tokens_out: int) -> float:
+        price_in, price_out = self.prices.get(model, (0.0, 0.0))
+        return (tokens_in * price_in + tokens_out * price_out) / 1e6
+
+    def record(self, decision: RouteDecision, latency: float, tokens_in: Optional[int] = None,
+               tokens_out: Optional[int] = None, ttft: Optional[float] = None, error: bool = False,
+               cancelled: bool = False):
+        """cancelled: stream interrompido no meio — sem amostra de latência, mas os tokens já gastos contam."""
+        key = (decision.operation, decision.model)
+        with self._lock:
+            s = self._stats.get(key)
+            if s is None:
+                s = self._stats[key] = _RouteStats()
+            s.count += 1
+            if error:
+                s.errors += 1
+                return
+            if cancelled:
+                s.cancelled += 1
+            else:
+                s.latencies.append(latency)
+            if ttft is not None:
+                s.ttfts.append(ttft)
+            s.tokens_in += tokens_in or 0
+            s.tokens_out += tokens_out or 0
+            s.cost += self.cost(decision.model, tokens_in or 0, tokens_out or 0)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            items = sorted(self._stats.items())
+            reasons = dict(self.reason_counts)
+        routes = []
+        for (operation, model), s in items:
+            routes.append({
+                "operation": operation,
+                "model": model,
+                "tier": LARGE if model == self.models[LARGE] else SMALL,
+                "count": s.count,
+                "errors": s.errors,
+                "cancelled": s.cancelled,
+                "latency_p50_s": _percentile(s.latencies, 50),
+                "latency_p95_s": _percentile(s.latencies, 95),
+                "ttft_p50_s": _percentile(s.ttfts, 50),
+                "tokens_in": s.tokens_in,
+                "tokens_out": s.tokens_out,
+                "cost_usd": round(s.cost, 6),
+            })
+        total = sum(r["count"] for r in routes)
+        large = sum(r["count"] for r in routes if r["tier"] == LARGE)
+        cost = sum(r["cost_usd"] for r in routes)
+        # quanto teria custado mandar tudo pro grande, com os mesmos tokens
+        all_large = sum(self.cost(self.models[LARGE], r["tokens_in"], r["tokens_out"]) for r in routes)
+        return {
+            "models": dict(self.models),
+            "routes": routes,
+            "reasons": reasons,
+            "large_share": large / total if total else None,
+            "cost_usd": round(cost, 6),
+            "cost_all_large_usd": round(all_large, 6),
+        }
@@ -0,0 +1,268 @@
+# app/notifications.py
+# Fila de notificações (e-mail) fora do caminho da conversa: coalesce, dedup, lote e retry.
+from __future__ import annotations
+import hashlib
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+BATCH_SIZE = 20
+COALESCE_WINDOW = 2.0  # espera antes de enviar: atualizações seguidas da mesma conversa viram uma só (s)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+SENT_MEMORY = 10000  # quantas notificações já enviadas lembramos pra não repetir
+
+
+def intent_notifications(garota: Dict[str, Any], intents: Dict[str, str],
+                         telefone: str) -> List[Tuple[str, str, str]]:
+    """(tipo, assunto, corpo) das notificações que os intents atuais pedem (ex-simulate_email)."""
+    out = []
+    if intents.get("local") and intents.get("data") and intents.get("pagamento"):
+        out.append(("agendamento", "Confirmação de agendamento", (
+            f"O cliente de número de telefone {telefone} quer marcar com você no {intents['local']}, "
+            f"{intents['data']}, e o pagamento será {intents['pagamento']}. "
+            f"Por favor, entre em contato e confirme o agendamento."
+        )))
+    elif intents.get("fora_do_perfil"):
+        out.append(("fora_do_perfil", "Solicitação fora do perfil", (
+            f"O cliente de número de telefone {telefone} está interessado em {intents['fora_do_perfil']}. "
+            f"Por favor, entre em contato e finalize o atendimento."
+        )))
+    return out
+
+
+@dataclass
+class Notification:
+    conversation_id: str
+    kind: str
+    to: str
+    subject: str
+    body: str
+    created: float = field(default_factory=time.monotonic)
+    ready_at: float = 0.0
+    attempts: int = 0
+    merged: int = 0  # quantas atualizações foram coalescidas nesta
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.conversation_id, self.kind
+
+    @property
+    def digest(self) -> str:
+        return hashlib.sha1(f"{self.to}\0{self.subject}\0{self.body}".encode("utf-8")).hexdigest()
+
+
+class SmtpSender:
+    """Uma conexão SMTP reaproveitada entre envios; reconecta quando o servidor derruba."""
+
+    def __init__(self, server: str, port: int, user: Optional[str] = None, password: Optional[str] = None,
+                 starttls: Optional[bool] = None, timeout: float = 10, from_addr: Optional[str] = None):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = (port == 587) if starttls is None else starttls
+        self.timeout = timeout
+        self.from_addr = from_addr or user or "noreply@localhost"
+        self._smtp: Optional[smtplib.SMTP] = None
+        self.connections = 0
+
+    @classmethod
+    def from_config(cls, email_cfg: Mapping[str, Any]) -> "SmtpSender":
+        return cls(email_cfg["server"], email_cfg["port"], email_cfg["user"], email_cfg["pass"])
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.user and self.password:
+            smtp.login(self.user, self.password)
+        self.connections += 1
+        return smtp
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._drop()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _drop(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.close()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def build(self, n: Notification) -> EmailMessage:
+        msg = EmailMessage()
+        msg["From"] = self.from_addr
+        msg["To"] = n.to
+        msg["Subject"] = n.subject
+        msg.set_content(n.body)
+        return msg
+
+    def send_batch(self, batch: List[Notification]) -> List[Optional[Exception]]:
+        """Envia o lote na mesma conexão; devolve o erro de cada item (None = enviado)."""
+        results: List[Optional[Exception]] = []
+        for n in batch:
+            try:
+                self._connection().send_message(self.build(n))
+                results.append(None)
+            except smtplib.SMTPResponseException as e:
+                # recusa do servidor (ex.: 451): a conexão continua boa
+                if e.smtp_code == 421:
+                    self._drop()
+                results.append(e)
+            except (smtplib.SMTPException, OSError) as e:
+                # SMTPException é OSError; desconexão/timeout -> próximo item abre conexão nova
+                self._drop()
+                results.append(e)
+        return results
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class NotificationDispatcher:
+    """
+    Fila em background: notify() só enfileira e volta na hora. Notificações da mesma conversa e
+    tipo dentro de `coalesce_window` viram uma só (vale a mais recente); conteúdo idêntico ao já
+    enviado é descartado. O worker envia em lotes pela mesma conexão e reagenda falhas com
+    backoff exponencial até `max_retries`.
+    """
+
+    def __init__(self, sender: SmtpSender, batch_size: int = BATCH_SIZE,
+                 coalesce_window: float = COALESCE_WINDOW, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, default_to: Optional[str] = None):
+        self.sender = sender
+        self.default_to = default_to or sender.from_addr
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._pending: "OrderedDict[Tuple[str, str], Notification]" = OrderedDict()
+        self._sent: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._inflight = 0
+        self.stats: Dict[str, int] = {"queued": 0, "coalesced": 0, "duplicates": 0, "sent": 0,
+                                      "retries": 0, "failed": 0, "batches": 0}
+        self.failed: List[Notification] = []
+        self._worker = threading.Thread(target=self._run, name="notifications", daemon=True)
+        self._worker.start()
+
+    def notify(self, conversation_id: str, kind: str, to: str, subject: str, body: str) -> bool:
+        """Enfileira; False se é repetição do que já foi enviado."""
+        n = Notification(conversation_id, kind, to, subject, body)
+        with self._cond:
+            if self._sent.get(n.key) == n.digest:
+                self.stats["duplicates"] += 1
+                return False
+            current = self._pending.get(n.key)
+            if current is not None:
+                if current.digest == n.digest:
+                    self.stats["duplicates"] += 1
+                    return False
+                # mantém a janela original: rajada de updates não adia o envio pra sempre
+                n.ready_at, n.created, n.merged = current.ready_at, current.created, current.merged + 1
+                n.attempts = current.attempts
+                self.stats["coalesced"] += 1
+            else:
+                n.ready_at = n.created + self.coalesce_window
+                self.stats["queued"] += 1
+            self._pending[n.key] = n
+            self._cond.notify()
+        return True
+
+    def notify_intents(self, conversation_id: str, garota: Dict[str, Any], intents: Dict[str, str],
+                       telefone: Optional[str] = None) -> int:
+        """Enfileira o que os intents atuais pedem; chamar a cada mensagem é seguro (dedup/coalesce)."""
+        to = garota.get("email") or self.default_to
+        return sum(self.notify(conversation_id, kind, to, subject, body)
+                   for kind, subject, body in intent_notifications(garota, intents, telefone or conversation_id))
+
+    def _take_ready(self) -> List[Notification]:
+        now = time.monotonic()
+        batch = []
+        for key in list(self._pending):
+            n = self._pending[key]
+            if n.ready_at <= now or self._closing:
+                batch.append(self._pending.pop(key))
+                if len(batch) >= self.batch_size:
+                    break
+        return batch
+
+    def _next_wakeup(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(0.0, min(n.ready_at for n in self._pending.values()) - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._take_ready()
+                while not batch:
+                    if self._closing and not self._pending:
+                        return
+                    self._cond.wait(self._next_wakeup())
+                    batch = self._take_ready()
+                self._inflight = len(batch)
+            results = self.sender.send_batch(batch)
+            with self._cond:
+                self.stats["batches"] += 1
+                for n, error in zip(batch, results):
+                    if error is None:
+                        self.stats["sent"] += 1
+                        self._sent[n.key] = n.digest
+                        self._sent.move_to_end(n.key)
+                        while len(self._sent) > SENT_MEMORY:
+                            self._sent.popitem(last=False)
+                        continue
+                    n.attempts += 1
+                    if n.attempts > self.max_retries or (self._closing and n.attempts > 1):
+                        self.stats["failed"] += 1
+                        self.failed.append(n)
+                        continue
+                    self.stats["retries"] += 1
+                    n.ready_at = time.monotonic() + self.backoff_base * 2 ** (n.attempts - 1)
+                    # uma versão mais nova pode ter chegado enquanto enviávamos
+                    self._pending.setdefault(n.key, n)
+                self._inflight = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Envia já o que está pendente (ignora a janela) e espera a fila esvaziar."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            for n in self._pending.values():
+                n.ready_at = min(n.ready_at, time.monotonic())
+            self._cond.notify_all()
+            while self._pending or self._inflight:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def close(self, timeout: Optional[float] = 30):
+        """Manda o que restou (sem novos retries com backoff) e fecha a conexão SMTP."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        self.sender.close()
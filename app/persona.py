@@ -0,0 +1,247 @@
+# app/persona.py
+# Índice de personas por id (gp001...) com leitura sob demanda e cache dos system prompts.
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+PERSONAS_FILE = PROJECT_ROOT / "data" / "personas" / "personas_gp.json"
+
+
+class PersonaNotFound(KeyError):
+    pass
+
+
+def build_ia1_prompt(garota: Dict[str, Any]) -> str:
+    """System prompt da IA 1 (respostas no papel da garota)."""
+    return (
+        f"Você é {garota['nome']}, {garota['idade']} anos, de {garota['localizacao']['cidade']}, {garota['localizacao']['bairro']}. "
+        f"Descrição: {garota['personalidade']['descricao']}. "
+        f"Limites: {', '.join(garota['personalidade']['tabus'])}. "
+        f"Preço: {garota['profissional']['preco_base']['valor']} BRL/h. "
+        f"Gostos: {', '.join(garota['personalidade']['gostos'])}. "
+        f"Fetiches: {', '.join(garota['personalidade']['fetiches'])}. "
+        f"Características físicas: {', '.join(garota['aparencia']['corpo']['caracteristicas'])}. "
+        f"Locais de atendimento: {', '.join(garota['localizacao']['locais_atendimento'])}. "
+        "Responda como ela, em português do Brasil, de forma realista e fiel ao perfil, usando tom definido pela descrição. "
+        "Seja breve, direto e use gírias ou tom sofisticado conforme a personalidade. "
+        "Respeite os limites estritamente, negando pedidos fora deles com charme. "
+        "Se explícito, use linguagem quente (pra garotas safadas) ou sensual (pra elegantes) após consentimento. "
+        "Inclua referências a São Paulo (ex: bairro, motel) se fizer sentido. "
+        "Responda só a mensagem, sem emojis ou texto extra."
+    )
+
+
+def build_ia2_prompt(garota: Dict[str, Any]) -> str:
+    """System prompt da IA 2 (análise de intents das mensagens do cliente)."""
+    return (
+        f"Você é uma IA que analisa mensagens de um cliente para uma acompanhante chamada {garota['nome']}. "
+        f"Limites da garota: {', '.join(garota['personalidade']['tabus'])}. "
+        f"Locais de atendimento: {', '.join(garota['localizacao']['locais_atendimento'])}. "
+        f"Detecte nas mensagens: "
+        f"- Local (ex.: 'motel X', 'Pinheiros'). "
+        f"- Data (ex.: 'amanhã às 20h', 'hoje à noite'). "
+        f"- Forma de pagamento (ex.: 'Pix', 'dinheiro'). "
+        f"- Pedidos fora do perfil (ex.: algo nos tabus ou não listado em locais/serviços). "
+        f"Responda com um JSON estrito contendo: "
+        f"{{\"intents\": {{\"local\": \"\", \"data\": \"\", \"pagamento\": \"\", \"fora_do_perfil\": \"\"}}}}. "
+        f"Se nada for detectado, deixe os campos vazios. Responda só o JSON."
+    )
+
+
+def build_ia2_batch_prompt(garotas: List[Dict[str, Any]]) -> str:
+    """System prompt da IA 2 em lote: várias mensagens (de garotas diferentes) numa chamada só."""
+    perfis = "\n".join(
+        f"- {g['id']} ({g['nome']}): limites: {', '.join(g['personalidade']['tabus'])}; "
+        f"locais de atendimento: {', '.join(g['localizacao']['locais_atendimento'])}."
+        for g in garotas
+    )
+    return (
+        f"Você é uma IA que analisa lotes de mensagens de clientes para acompanhantes. "
+        f"Perfis das garotas deste lote:\n{perfis}\n"
+        f"A entrada é uma lista JSON de itens {{\"id\", \"garota\", \"mensagem\"}}. Para cada item, detecte: "
+        f"- Local (ex.: 'motel X', 'Pinheiros'). "
+        f"- Data (ex.: 'amanhã às 20h', 'hoje à noite'). "
+        f"- Forma de pagamento (ex.: 'Pix', 'dinheiro'). "
+        f"- Pedidos fora do perfil da garota do item (ex.: algo nos tabus ou não listado em locais/serviços). "
+        f"Responda com uma lista JSON estrita, um objeto por item, na mesma ordem: "
+        f"[{{\"id\": \"<id do item>\", \"intents\": {{\"local\": \"\", \"data\": \"\", \"pagamento\": \"\", \"fora_do_perfil\": \"\"}}}}]. "
+        f"Se nada for detectado, deixe os campos vazios. Responda só o JSON."
+    )
+
+
+PROMPT_BUILDERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "ia1": build_ia1_prompt,
+    "ia2": build_ia2_prompt,
+}
+
+
+def scan_offsets(path: Path, chunk_size: int = 1 << 16) -> List[Tuple[int, int]]:
+    """
+    Varre o arquivo em blocos e devolve (início, fim) em bytes de cada objeto que está dentro
+    de uma lista no primeiro nível ({"garotas": [...]}) ou na lista raiz ([...]).
+    Não monta os objetos: memória constante independente do tamanho do arquivo.
+    """
+    spans: List[Tuple[int, int]] = []
+    stack: List[int] = []  # b"{" ou b"[" de cada container aberto
+    in_string = escape = False
+    start = -1
+    pos = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            for i, byte in enumerate(chunk):
+                if in_string:
+                    if escape:
+                        escape = False
+                    elif byte == 0x5C:  # \
+                        escape = True
+                    elif byte == 0x22:  # "
+                        in_string = False
+                    continue
+                if byte == 0x22:
+                    in_string = True
+                elif byte in (0x7B, 0x5B):  # { [
+                    if byte == 0x7B and stack and stack[-1] == 0x5B and len(stack) <= 2:
+                        start = pos + i
+                    stack.append(byte)
+                elif byte in (0x7D, 0x5D):  # } ]
+                    stack.pop()
+                    if byte == 0x7D and start >= 0 and stack and stack[-1] == 0x5B and len(stack) <= 2:
+                        spans.append((start, pos + i + 1))
+                        start = -1
+            pos += len(chunk)
+    return spans
+
+
+class PersonaStore:
+    """
+    Personas indexadas por `id`. O índice (id -> faixa de bytes) fica num arquivo ao lado
+    do JSON e só é refeito quando o arquivo muda; cada persona é lida sob demanda com
+    seek e mantida num LRU pequeno, assim como os system prompts renderizados.
+    """
+
+    def __init__(self, path: Path = PERSONAS_FILE, cache_size: int = 256, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(".index.json")
+        self.cache_size = cache_size
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._order: List[str] = []
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._prompts: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._refresh(force=True)
+
+    def _file_signature(self) -> Tuple[int, int]:
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            self._load_index(signature)
+            self._records.clear()
+            self._prompts.clear()
+            self._signature = signature
+
+    def _load_index(self, signature: Tuple[int, int]):
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    idx = json.load(f)
+                if tuple(idx.get("signature", ())) == signature:
+                    self._order = idx["order"]
+                    self._offsets = {k: tuple(v) for k, v in idx["offsets"].items()}
+                    return
+            except (json.JSONDecodeError, KeyError, OSError):
+                pass
+        offsets: Dict[str, Tuple[int, int]] = {}
+        order: List[str] = []
+        with open(self.path, "rb") as f:
+            for start, end in scan_offsets(self.path):
+                f.seek(start)
+                record = json.loads(f.read(end - start))
+                pid = record.get("id")
+                if pid and pid not in offsets:
+                    offsets[pid] = (start, end)
+                    order.append(pid)
+        self._offsets, self._order = offsets, order
+        try:
+            with open(self.index_path, "w", encoding="utf-8") as f:
+                json.dump({"signature": list(signature), "order": order, "offsets": offsets}, f)
+        except OSError:
+            pass  # sem permissão de escrita: segue com o índice em memória
+
+    def ids(self) -> List[str]:
+        self._refresh()
+        return list(self._order)
+
+    def __len__(self) -> int:
+        return len(self.ids())
+
+    def get(self, persona_id: str) -> Dict[str, Any]:
+        self._refresh()
+        with self._lock:
+            if persona_id in self._records:
+                self._records.move_to_end(persona_id)
+                return self._records[persona_id]
+            if persona_id not in self._offsets:
+                raise PersonaNotFound(f"Persona '{persona_id}' não encontrada em {self.path}")
+            start, end = self._offsets[persona_id]
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                record = json.loads(f.read(end - start))
+            self._records[persona_id] = record
+            while len(self._records) > self.cache_size:
+                self._records.popitem(last=False)
+            return record
+
+    def resolve(self, choice: str) -> str:
+        """Aceita o id ("gp003") ou a posição no arquivo ("3", 1-based)."""
+        choice = choice.strip()
+        ids = self.ids()
+        if choice in self._offsets:
+            return choice
+        if choice.isdigit() and 1 <= int(choice) <= len(ids):
+            return ids[int(choice) - 1]
+        raise PersonaNotFound(f"Persona '{choice}' não encontrada (use um id ou número de 1 a {len(ids)}).")
+
+    def prompt(self, persona_id: str, kind: str = "ia1") -> str:
+        self._refresh()
+        key = (persona_id, kind)
+        with self._lock:
+            if key in self._prompts:
+                self._prompts.move_to_end(key)
+                return self._prompts[key]
+        rendered = PROMPT_BUILDERS[kind](self.get(persona_id))
+        with self._lock:
+            self._prompts[key] = rendered
+            while len(self._prompts) > self.cache_size * len(PROMPT_BUILDERS):
+                self._prompts.popitem(last=False)
+        return rendered
+
+
+_stores: Dict[Path, PersonaStore] = {}
+
+
+def get_store(path: Path = PERSONAS_FILE) -> PersonaStore:
+    path = Path(path)
+    if path not in _stores:
+        _stores[path] = PersonaStore(path)
+    return _stores[path]
@@ -0,0 +1,381 @@
+# app/provider_router.py
+# Roteamento entre providers: requisição "hedged" quando o primeiro demora, failover e circuit breaker.
+from __future__ import annotations
+import contextvars
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app import metrics
+from app.ai_provider import ProviderClient, StreamCancel, StreamStats
+from configs.config_loader import ConfigError
+
+HEDGE_PERCENTILE = 95.0  # dispara a cópia quando o primeiro passa do p95 recente dele
+HEDGE_DELAY = 1.0  # atraso usado enquanto não há amostras suficientes (s)
+MIN_SAMPLES = 20
+WINDOW = 200
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+
+class CircuitBreaker:
+    """Fecha -> abre após N falhas seguidas; depois de `reset_timeout` deixa passar uma tentativa."""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial:
+                self._trial = True  # só uma tentativa por vez enquanto meio-aberto
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release(self):
+        """A tentativa de teste foi cancelada (perdeu o hedge): não prova nada, libera pra próxima."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class _Latencies:
+    def __init__(self, window: int = WINDOW):
+        self._values: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._values)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+class Route:
+    """Um provider (e opcionalmente um modelo específico dele) dentro do roteador."""
+
+    def __init__(self, client: ProviderClient, model: Optional[str] = None, name: Optional[str] = None,
+                 breaker: Optional[CircuitBreaker] = None, window: int = WINDOW):
+        self.client = client
+        self.model = model
+        self.name = name or (f"{client.provider}:{model}" if model else client.provider)
+        self.breaker = breaker or CircuitBreaker()
+        self.ttft = _Latencies(window)
+        self.total = _Latencies(window)
+
+
+class _Attempt:
+    def __init__(self, route: Route, hedge: bool, started: float):
+        self.route = route
+        self.hedge = hedge
+        self.started = started
+        self.cancel = StreamCancel()  # set() fecha a conexão HTTP, mesmo antes do primeiro byte
+        self.finished = threading.Event()  # _consume terminou (sucesso, erro ou cancelada)
+        self.parts: List[str] = []
+        self.stats = StreamStats()
+        self.done = False
+        self.failed = False
+
+
+class ProviderRouter:
+    """
+    Mesma interface do ProviderClient (chat_completion/chat/chat_stream) sobre várias rotas.
+    Cada chamada começa na primeira rota com circuito fechado; se ela passar do p`hedge_percentile`
+    recente dela (TTFT no streaming, tempo total no resto) sem responder, dispara uma cópia na
+    próxima rota. Vence quem responde primeiro — no streaming, o primeiro token; senão, a
+    resposta completa — e a outra tentativa é cancelada fechando o stream HTTP. Erro numa rota
+    conta pro circuit breaker dela e passa pra próxima na hora (failover).
+    As tentativas usam SSE por baixo justamente pra poderem ser interrompidas no meio.
+    """
+
+    def __init__(self, routes: Sequence[Route], hedge_percentile: float = HEDGE_PERCENTILE,
+                 hedge_delay: float = HEDGE_DELAY, min_samples: int = MIN_SAMPLES, hedge: bool = True,
+                 measure_losers: bool = False, workers: int = 32):
+        if not routes:
+            raise ConfigError("ProviderRouter precisa de pelo menos uma rota.")
+        self.routes = list(routes)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self.hedge = hedge
+        # True: a perdedora termina em background só pra medir quanto o hedge economizou
+        self.measure_losers = measure_losers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="router")
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0,
+                                      "errors": 0, "cancelled": 0, "breaker_skips": 0, "wins": {}}
+        self.saved: List[float] = []  # segundos economizados quando a cópia venceu (measure_losers)
+
+    # --- interface do ProviderClient -------------------------------------------------------
+    @property
+    def provider(self) -> str:
+        return self.routes[0].client.provider
+
+    @property
+    def default_model(self) -> Optional[str]:
+        return self.routes[0].model or self.routes[0].client.default_model
+
+    @property
+    def models(self) -> Dict[str, Optional[str]]:
+        return self.routes[0].client.models
+
+    def chat_completion(self, payload: Dict[str, Any], title: Optional[str] = None,
+                        timeout: Optional[float] = None) -> Dict[str, Any]:
+        params = {k: v for k, v in payload.items() if k not in ("messages", "model", "stream", "stream_options")}
+        attempt = self._run(payload["messages"], payload.get("model"), title, timeout, params, first_token=False)
+        return {
+            "object": "chat.completion",
+            "model": attempt.stats.model,
+            "provider": attempt.route.name,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(attempt.parts)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": attempt.stats.prompt_tokens, "completion_tokens": attempt.stats.completion_tokens},
+        }
+
+    def chat(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+             title: Optional[str] = None, timeout: Optional[float] = None, **params: Any) -> str:
+        data = self.chat_completion({"model": model, "messages": messages, **params}, title=title, timeout=timeout)
+        return data["choices"][0]["message"]["content"]
+
+    def chat_stream(self, messages: List[Dict[str, str]], model: Optional[str] = None,
+                    title: Optional[str] = None, timeout: Optional[float] = None,
+                    stats: Optional[StreamStats] = None, **params: Any) -> Iterator[str]:
+        events: "queue.Queue[Tuple[str, _Attempt, Any]]" = queue.Queue()
+        started = time.perf_counter()
+        winner = self._race(messages, model, title, timeout, params, first_token=True, events=events)
+        if stats is not None:
+            stats.model = winner.stats.model
+            stats.started_at = started  # TTFT da requisição, não da cópia que venceu
+        try:
+            # o primeiro delta decidiu a corrida; o resto ainda está (ou vai estar) na fila
+            if stats is not None:
+                stats.mark_chunk()
+            yield winner.parts[0]
+            while True:
+                kind, attempt, value = events.get()
+                if attempt is not winner:
+                    continue
+                if kind == "delta":
+                    if stats is not None:
+                        stats.mark_chunk()
+                    yield value
+                elif kind == "done":
+                    break
+                else:
+                    raise value
+        finally:
+            if not winner.done:
+                winner.cancel.set()  # quem consome parou no meio
+        if stats is not None:
+            stats.completion_tokens = winner.stats.completion_tokens
+            stats.prompt_tokens = winner.stats.prompt_tokens
+            stats.finished_at = time.perf_counter()
+
+    # --- corrida entre rotas ---------------------------------------------------------------
+    def _available(self, exclude: List[Route]) -> Optional[Route]:
+        for route in self.routes:
+            if route in exclude:
+                continue
+            if route.breaker.allow():
+                return route
+            self._count("breaker_skips")
+        return None
+
+    def _hedge_after(self, route: Route, first_token: bool) -> float:
+        samples = route.ttft if first_token else route.total
+        if len(samples) < self.min_samples:
+            return self.hedge_delay
+        return samples.percentile(self.hedge_percentile) or self.hedge_delay
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self.stats[name] += n
+
+    def _start(self, route: Route, messages, model, title, timeout, params, hedge: bool,
+               events: "queue.Queue") -> _Attempt:
+        attempt = _Attempt(route, hedge, time.perf_counter())
+        # a rota com modelo próprio ignora o modelo pedido (nome de modelo muda entre providers)
+        route_model = route.model or (model if route is self.routes[0] else None) or route.client.default_model
+        # cópia do contexto: labels (persona/operação) e span atual seguem pra thread do pool
+        ctx = contextvars.copy_context()
+        self._pool.submit(ctx.run, self._consume, attempt, messages, route_model, title, timeout, params, events)
+        return attempt
+
+    def _consume(self, attempt: _Attempt, messages, model, title, timeout, params, events: "queue.Queue"):
+        stream = attempt.route.client.chat_stream(messages, model=model, title=title, timeout=timeout,
+                                                  stats=attempt.stats, cancel=attempt.cancel, **params)
+        try:
+            for text in stream:
+                if attempt.cancel.is_set():
+                    break
+                attempt.parts.append(text)
+                events.put(("delta", attempt, text))
+            if attempt.cancel.is_set():
+                # perdeu a corrida (ou quem consumia parou): nem sucesso nem falha da rota
+                attempt.route.breaker.release()
+                return
+            attempt.done = True
+        except Exception as e:
+            attempt.failed = True
+            attempt.route.breaker.record_failure()
+            events.put(("error", attempt, e))
+            return
+        finally:
+            stream.close()  # sai do `with` do requests e devolve/derruba a conexão
+            attempt.finished.set()
+        attempt.route.breaker.record_success()
+        if attempt.stats.ttft is not None:
+            attempt.route.ttft.add(attempt.stats.ttft)
+        attempt.route.total.add(time.perf_counter() - attempt.started)
+        events.put(("done", attempt, None))
+
+    def _race(self, messages, model, title, timeout, params, first_token: bool,
+              events: "queue.Queue") -> _Attempt:
+        """Devolve a tentativa vencedora (as demais já foram canceladas)."""
+        self._count("requests")
+        started = time.perf_counter()
+        tried: List[Route] = []
+        route = self._available(tried)
+        if route is None:
+            self._count("errors")
+            raise ConfigError("Nenhuma rota disponível: todos os circuitos estão abertos.")
+        tried.append(route)
+        live = [self._start(route, messages, model, title, timeout, params, False, events)]
+        hedge_at = started + self._hedge_after(route, first_token) if self.hedge else None
+        last_error: Optional[Exception] = None
+
+        while True:
+            wait = None if hedge_at is None else max(0.0, hedge_at - time.perf_counter())
+            try:
+                kind, attempt, value = events.get(timeout=wait)
+            except queue.Empty:
+                hedge_at = None
+                nxt = self._available(tried)
+                if nxt is not None:
+                    tried.append(nxt)
+                    live.append(self._start(nxt, messages, model, title, timeout, params, True, events))
+                    self._count("hedges")
+                    metrics.FALLBACKS.inc(kind="hedge", provider=nxt.name, model=nxt.model or "")
+                continue
+            if attempt not in live:
+                continue
+            if kind == "error":
+                last_error = value
+                live.remove(attempt)
+                if not live:
+                    nxt = self._available(tried)
+                    if nxt is None:
+                        self._count("errors")
+                        raise last_error
+                    tried.append(nxt)
+                    live.append(self._start(nxt, messages, model, title, timeout, params, attempt.hedge, events))
+                    self._count("failovers")
+                    metrics.FALLBACKS.inc(kind="failover", provider=nxt.name, model=nxt.model or "")
+                continue
+            if kind == "delta" and not first_token:
+                continue
+            # vencedora: primeiro token (stream) ou resposta completa
+            self._settle(attempt, live, started)
+            return attempt
+
+    def _settle(self, winner: _Attempt, live: List[_Attempt], started: float):
+        with self._lock:
+            self.stats["wins"][winner.route.name] = self.stats["wins"].get(winner.route.name, 0) + 1
+            if winner.hedge:
+                self.stats["hedge_wins"] += 1
+        elapsed = time.perf_counter() - started
+        for other in live:
+            if other is winner:
+                continue
+            if self.measure_losers and winner.hedge:
+                self._pool.submit(self._measure_loser, other, started, elapsed)
+            else:
+                other.cancel.set()
+                self._count("cancelled")
+
+    def _measure_loser(self, loser: _Attempt, started: float, winner_elapsed: float):
+        loser.finished.wait()
+        if loser.done:
+            with self._lock:
+                self.saved.append(time.perf_counter() - started - winner_elapsed)
+
+    def _run(self, messages, model, title, timeout, params, first_token: bool) -> _Attempt:
+        return self._race(messages, model, title, timeout, params, first_token, queue.Queue())
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {k: (dict(v) if isinstance(v, dict) else v) for k, v in self.stats.items()}
+            saved = sorted(self.saved)
+        out["hedge_rate"] = out["hedges"] / out["requests"] if out["requests"] else None
+        if saved:
+            out["saved_s"] = {"n": len(saved), "p50": saved[len(saved) // 2],
+                              "max": saved[-1], "total": sum(saved)}
+        out["routes"] = {
+            r.name: {"breaker": r.breaker.state, "opens": r.breaker.opens,
+                     "ttft_p50": r.ttft.percentile(50), "ttft_p95": r.ttft.percentile(95),
+                     "total_p95": r.total.percentile(95)}
+            for r in self.routes
+        }
+        return out
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for route in self.routes:
+            route.client.close()
+
+
+def build_router(specs: Sequence[str] = ("openrouter", "runpod"), **kwargs: Any) -> ProviderRouter:
+    """
+    Rotas a partir do config.json, na ordem de preferência. Cada item é "provider" ou
+    "provider:modelo"; providers sem endpoint de chat ou com config incompleta ficam de fora.
+    """
+    routes, clients = [], {}
+    for spec in specs:
+        name, _, model = spec.partition(":")
+        try:
+            client = clients.get(name) or ProviderClient(name)
+        except ConfigError as e:
+            print(f"Rota {spec} ignorada: {e}")
+            continue
+        clients[name] = client
+        routes.append(Route(client, model or None))
+    return ProviderRouter(routes, **kwargs)
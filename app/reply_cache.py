@@ -0,0 +1,142 @@
+# app/reply_cache.py
+# Cache de respostas da IA 1 para mensagens repetidas ("oi, tudo bem?", "quanto é?").
+from __future__ import annotations
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ai_intent import normalize
+
+PURGE_EVERY = 500  # a cada N gravações o SQLite perde os vencidos e o excesso além de max_disk_entries
+
+
+def normalize_message(text: str) -> str:
+    """Normaliza pra casar variações triviais: caixa, acento, pontuação, 'oiii' -> 'oi'."""
+    text = normalize(text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"(\w)\1{2,}", r"\1", text)
+    return " ".join(text.split())
+
+
+class ReplyCache:
+    """
+    LRU + TTL em memória, com armazenamento opcional em SQLite que sobrevive a restart.
+    Chave = persona + mensagem normalizada + hash da janela recente do histórico.
+    O SQLite é limpo a cada `purge_every` gravações: vencidos saem e ficam só as
+    `max_disk_entries` mais recentes.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 6 * 3600,
+                 path: Optional[Path] = None, history_window: int = 2,
+                 max_disk_entries: int = 10000, purge_every: int = PURGE_EVERY):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.purge_every = purge_every
+        self._puts = 0
+        self.disk_evictions = 0
+        self.ttl = ttl
+        self.history_window = history_window
+        self._mem: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, reply TEXT, created REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS replies_created ON replies (created)")
+            self._purge_disk()
+
+    def make_key(self, persona_id: str, message: str, history: List[Dict[str, str]]) -> str:
+        window = history[-self.history_window:] if self.history_window else []
+        window_norm = [(m.get("role"), normalize_message(m.get("content", ""))) for m in window]
+        raw = json.dumps([persona_id, normalize_message(message), window_norm], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, persona_id: str, message: str, history: List[Dict[str, str]]) -> Optional[str]:
+        key = self.make_key(persona_id, message, history)
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                reply, created = item
+                if now - created <= self.ttl:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return reply
+                del self._mem[key]
+                self.expired += 1
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT reply, created FROM replies WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._store_mem(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, persona_id: str, message: str, history: List[Dict[str, str]], reply: str):
+        key = self.make_key(persona_id, message, history)
+        created = time.time()
+        with self._lock:
+            self._store_mem(key, reply, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO replies (key, reply, created) VALUES (?, ?, ?)",
+                    (key, reply, created),
+                )
+                self._puts += 1
+                if self._puts % self.purge_every == 0:
+                    self._purge_disk()  # faz o commit
+                else:
+                    self._db.commit()
+
+    def _store_mem(self, key: str, reply: str, created: float):
+        self._mem[key] = (reply, created)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _purge_disk(self):
+        self._db.execute("DELETE FROM replies WHERE created < ?", (time.time() - self.ttl,))
+        cur = self._db.execute(
+            "DELETE FROM replies WHERE key IN (SELECT key FROM replies ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+        self.disk_evictions += max(cur.rowcount, 0)
+        self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._mem),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,152 @@
+# app/services/chat_service.py
+# Caminho de resposta da IA 1 para uma conversa (estado isolado por instância).
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app import metrics
+from app.ai_provider import ProviderClient, SentenceBuffer, StreamStats, get_client
+from app.context_window import ContextWindow
+from app.model_router import ModelRouter, RouteDecision
+from app.persona import PersonaStore, get_store
+from app.reply_cache import ReplyCache
+
+MODEL_IA1 = "openai/gpt-4o"  # só quando o provider não tem default_model_ia1
+PROMPT_BUDGET = 1200  # teto de tokens do prompt (system + resumo + histórico + mensagem)
+TITLE = "whatsapp-autoresponder"
+
+
+class ChatService:
+    """
+    Uma conversa cliente x garota: histórico, janela de contexto e chamada ao provider.
+    O cache de respostas pode ser compartilhado entre conversas; o resto é por instância.
+    """
+
+    def __init__(self, persona_id: str, client: Optional[ProviderClient] = None,
+                 store: Optional[PersonaStore] = None, model: Optional[str] = None,
+                 cache: Optional[ReplyCache] = None, prompt_budget: int = PROMPT_BUDGET,
+                 summarize: bool = True, temperature: float = 0.8, max_tokens: int = 200,
+                 timeout: float = 30, router: Optional[ModelRouter] = None):
+        self.persona_id = persona_id
+        self.client = client or get_client()
+        self.store = store or get_store()
+        self.model = model or self.client.models.get("ia1") or MODEL_IA1
+        self.router = router  # quando informado, escolhe o modelo a cada turno (pequeno x grande)
+        self.cache = cache
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.history: List[Dict[str, str]] = []
+        self.context = ContextWindow(budget=prompt_budget, model=self.model, summarize=summarize)
+        self.reply_stats: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()  # histórico/janela podem ser usados por mais de uma thread
+
+    @property
+    def persona(self) -> Dict[str, Any]:
+        return self.store.get(self.persona_id)
+
+    def build_messages(self, client_message: str, extra_system: Optional[str] = None) -> List[Dict[str, str]]:
+        """extra_system: contexto do turno (ex.: intents já detectados) anexado ao system prompt."""
+        system_prompt = self.store.prompt(self.persona_id, "ia1")
+        if extra_system:
+            system_prompt = f"{system_prompt}\n\n{extra_system}"
+        with self._lock:
+            return self.context.build(system_prompt, self.history, client_message)
+
+    def payload(self, client_message: str, extra_system: Optional[str] = None,
+                model: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "messages": self.build_messages(client_message, extra_system),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+
+    def _use_cache(self, extra_system: Optional[str]) -> bool:
+        # resposta guardada não conhece o contexto extra do turno
+        return self.cache is not None and not extra_system
+
+    def _cached(self, client_message: str, extra_system: Optional[str] = None) -> Optional[str]:
+        if not self._use_cache(extra_system):
+            return None
+        return self.cache.get(self.persona_id, client_message, self.history)
+
+    def _route(self, client_message: str, intents: Optional[Dict[str, str]]) -> Tuple[str, Optional[RouteDecision]]:
+        if self.router is None:
+            return self.model, None
+        decision = self.router.choose("ia1", client_message, intents, turn=len(self.history) // 2)
+        return decision.model, decision
+
+    def reply(self, client_message: str, extra_system: Optional[str] = None,
+              intents: Optional[Dict[str, str]] = None) -> str:
+        """intents: o que a conversa já detectou (usado pelo roteador de modelos)."""
+        cached = self._cached(client_message, extra_system)
+        if cached is not None:
+            return cached
+        model, decision = self._route(client_message, intents)
+        payload = self.payload(client_message, extra_system, model)
+        started = time.perf_counter()
+        try:
+            with metrics.labels(persona=self.persona_id, operation="ia1"):
+                data = self.client.chat_completion(payload, title=TITLE, timeout=self.timeout)
+        except Exception:
+            if decision is not None:
+                self.router.record(decision, time.perf_counter() - started, error=True)
+            raise
+        if decision is not None:
+            usage = data.get("usage") or {}
+            self.router.record(decision, time.perf_counter() - started, usage.get("prompt_tokens"),
+                               usage.get("completion_tokens"))
+        reply = data["choices"][0]["message"]["content"]
+        if self._use_cache(extra_system):
+            self.cache.put(self.persona_id, client_message, self.history, reply)
+        return reply
+
+    def reply_stream(self, client_message: str, stats: Optional[StreamStats] = None,
+                     extra_system: Optional[str] = None, intents: Optional[Dict[str, str]] = None) -> Iterator[str]:
+        """Devolve frases completas assim que ficam prontas."""
+        stats = stats if stats is not None else StreamStats()
+        buffer = SentenceBuffer()
+        cached = self._cached(client_message, extra_system)
+        if cached is not None:
+            stats.model = "cache"
+            stats.mark_chunk()
+            stats.finished_at = time.perf_counter()
+            yield from buffer.feed(cached)
+            rest = buffer.flush()
+            if rest:
+                yield rest
+            return
+        model, decision = self._route(client_message, intents)
+        messages = self.build_messages(client_message, extra_system)
+        parts = []
+        started = time.perf_counter()
+        outcome = "cancelled"  # GeneratorExit (orquestrador fechou o stream) não passa pelo except abaixo
+        try:
+            with metrics.labels(persona=self.persona_id, operation="ia1"):
+                for delta in self.client.chat_stream(messages, model=model, title=TITLE, timeout=self.timeout,
+                                                     stats=stats, temperature=self.temperature,
+                                                     max_tokens=self.max_tokens):
+                    parts.append(delta)
+                    yield from buffer.feed(delta)
+            outcome = "ok"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            if decision is not None:
+                self.router.record(decision, time.perf_counter() - started,
+                                   stats.prompt_tokens or self.context.last_prompt_tokens, stats.tokens, stats.ttft,
+                                   error=outcome == "error", cancelled=outcome == "cancelled")
+        rest = buffer.flush()
+        if rest:
+            yield rest
+        self.reply_stats.append({**stats.as_dict(), "prompt_tokens": self.context.last_prompt_tokens})
+        if self._use_cache(extra_system) and parts:
+            self.cache.put(self.persona_id, client_message, self.history, "".join(parts).strip())
+
+    def record(self, client_message: str, reply: str):
+        with self._lock:
+            self.history.append({"role": "user", "content": client_message})
+            self.history.append({"role": "assistant", "content": reply})
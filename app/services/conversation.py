@@ -0,0 +1,89 @@
+# app/services/conversation.py
+# Uma conversa completa: cada mensagem do cliente passa pela resposta (IA 1) e pelos intents (IA 2).
+from __future__ import annotations
+import time
+from typing import Any, Dict, Optional
+
+from app.ai_intent import INTENT_FIELDS
+from app.ai_provider import ProviderClient, get_client
+from app.conversation_state import ConversationState, ConversationStateStore
+from app.persona import PersonaStore, get_store
+from app.reply_cache import ReplyCache
+from app.services.chat_service import ChatService
+from app.services.intent_service import IntentAnalyzer
+
+
+def intents_context(intents: Dict[str, str]) -> Optional[str]:
+    """Trecho pro system prompt da IA 1 com o que o cliente já informou (None se nada)."""
+    labels = {"local": "local", "data": "data/horário", "pagamento": "pagamento", "fora_do_perfil": "pediu fora do perfil"}
+    known = [f"{labels[k]}: {intents[k]}" for k in INTENT_FIELDS if intents.get(k)]
+    if not known:
+        return None
+    return "O cliente já informou (não pergunte de novo): " + "; ".join(known) + "."
+
+
+class Conversation:
+    """
+    Estado isolado de um cliente falando com uma garota: histórico da IA 1 e intents
+    acumulados da IA 2. Substitui os globais conversation_history/detected_intents dos REPLs.
+    Com `state_store`, os intents ficam no store compartilhado (conv:{id}:state).
+    """
+
+    def __init__(self, persona_id: str, conversation_id: str = "", client: Optional[ProviderClient] = None,
+                 store: Optional[PersonaStore] = None, cache: Optional[ReplyCache] = None,
+                 fast_path: bool = True, chat_options: Optional[Dict[str, Any]] = None,
+                 intent_options: Optional[Dict[str, Any]] = None,
+                 state_store: Optional[ConversationStateStore] = None):
+        self.conversation_id = conversation_id
+        self.persona_id = persona_id
+        client = client or get_client()
+        store = store or get_store()
+        self.chat = ChatService(persona_id, client=client, store=store, cache=cache, **(chat_options or {}))
+        self.analyzer = IntentAnalyzer(persona_id, client=client, store=store, fast_path=fast_path,
+                                       **(intent_options or {}))
+        self.state_store = state_store
+        if state_store is not None:
+            self.state = state_store.load(conversation_id, persona_id)
+        else:
+            self.state = ConversationState(conversation_id, persona_id)
+        self.turns = 0
+
+    @property
+    def detected_intents(self) -> Dict[str, str]:
+        return self.state.intents
+
+    def booking_complete(self) -> bool:
+        return self.state.booking_complete()
+
+    def merge_intents(self, intents: Dict[str, Any]) -> bool:
+        """
+        Intents novos só sobrescrevem campos que vieram preenchidos. Devolve True só na
+        mensagem que completou o agendamento.
+        """
+        fields = intents.get("intents") or {}
+        if self.state_store is not None:
+            self.state, _, completed = self.state_store.merge(self.conversation_id, fields, self.persona_id)
+            return completed
+        was_complete = self.state.booking_complete()
+        self.state.merge(fields)
+        return self.state.booking_complete() and not was_complete
+
+    def handle(self, client_message: str) -> Dict[str, Any]:
+        """Resposta + intents de uma mensagem, com a latência de cada etapa."""
+        started = time.perf_counter()
+        reply = self.chat.reply(client_message, intents=self.detected_intents)
+        reply_s = time.perf_counter() - started
+        intents = self.analyzer.analyze(client_message)
+        intent_s = time.perf_counter() - started - reply_s
+        completed = self.merge_intents(intents)
+        self.chat.record(client_message, reply)
+        self.turns += 1
+        return {
+            "reply": reply,
+            "intents": dict(self.detected_intents),
+            "booking_complete": self.booking_complete(),
+            "booking_completed_now": completed,
+            "reply_s": reply_s,
+            "intent_s": intent_s,
+            "total_s": time.perf_counter() - started,
+        }
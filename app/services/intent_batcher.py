@@ -0,0 +1,222 @@
+# app/services/intent_batcher.py
+# Micro-lotes de análise de intents: mensagens de várias conversas numa requisição só.
+from __future__ import annotations
+import json
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app import metrics
+from app.ai_intent import INTENT_FIELDS, get_matcher
+from app.ai_provider import ProviderClient, get_client
+from app.persona import PersonaStore, build_ia2_batch_prompt, get_store
+from app.services.intent_service import MODEL_IA2, IntentAnalyzer
+
+TITLE = "whatsapp-autoresponder-intent-batch"
+MAX_BATCH = 16
+MAX_WAIT = 0.05  # espera máxima do primeiro item da fila até o lote sair (s)
+TOKENS_PER_ITEM = 60  # orçamento de saída por mensagem do lote
+WINDOW = 1000  # lotes/atrasos recentes guardados pro relatório
+
+
+def parse_batch(text: str) -> Dict[str, Dict[str, Any]]:
+    """Lista JSON [{"id", "intents"}] -> {id: {"intents": {...}}} com os quatro campos como string."""
+    obj = json.loads(text)
+    if isinstance(obj, dict):
+        obj = obj.get("resultados") or obj.get("results") or obj.get("items") or []
+    out: Dict[str, Dict[str, Any]] = {}
+    for item in obj if isinstance(obj, list) else []:
+        if not isinstance(item, dict) or "id" not in item:
+            continue
+        intents = item.get("intents") or {}
+        out[str(item["id"])] = {"intents": {k: str(intents.get(k) or "") for k in INTENT_FIELDS}}
+    return out
+
+
+class BatchStats:
+    """
+    Tamanho dos lotes e atraso de fila (do enfileiramento até o envio). Contadores e máximos
+    cobrem o processo todo; histograma e percentis, a janela recente (`WINDOW`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.items = 0
+        self.fast = 0
+        self.batches = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.batched = 0  # itens que saíram em lote (média de tamanho)
+        self.max_size = 0
+        self.max_delay: Optional[float] = None
+        self.sizes: Deque[int] = deque(maxlen=WINDOW)
+        self.queue_delays: Deque[float] = deque(maxlen=WINDOW)
+
+    def record_batch(self, size: int, delays: List[float]):
+        with self._lock:
+            self.batches += 1
+            self.batched += size
+            self.max_size = max(self.max_size, size)
+            if delays:
+                worst = max(delays)
+                self.max_delay = worst if self.max_delay is None else max(self.max_delay, worst)
+            self.sizes.append(size)
+            self.queue_delays.extend(delays)
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            delays = list(self.queue_delays)
+            sizes = list(self.sizes)
+            out = {
+                "items": self.items,
+                "fast": self.fast,
+                "batches": self.batches,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+                "avg_batch_size": self.batched / self.batches if self.batches else None,
+                "max_batch_size": self.max_size or None,
+            }
+            delay_max = self.max_delay
+        # ordena a cópia da janela fora do lock
+        delays.sort()
+        pick = lambda q: delays[min(len(delays) - 1, int(q * len(delays)))] if delays else None
+        out.update({
+            "size_histogram": {str(n): c for n, c in sorted(Counter(sizes).items())},
+            "queue_delay_p50": pick(0.5),
+            "queue_delay_p95": pick(0.95),
+            "queue_delay_max": delay_max,
+        })
+        return out
+
+
+class IntentBatcher:
+    """
+    Junta mensagens que chegam dentro de `max_wait` (até `max_batch`) numa única chamada à IA 2,
+    que devolve uma lista JSON de intents por id, e distribui o resultado de volta pra cada
+    Future. O caminho rápido local continua antes da fila; ids que faltarem na resposta do
+    lote são refeitos individualmente, em paralelo num pool próprio.
+    """
+
+    def __init__(self, client: Optional[ProviderClient] = None, store: Optional[PersonaStore] = None,
+                 model: Optional[str] = None, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT,
+                 fast_path: bool = True, workers: int = 4, temperature: float = 0.2, timeout: float = 60):
+        self.client = client or get_client()
+        self.store = store or get_store()
+        self.model = model or self.client.models.get("ia2") or MODEL_IA2  # lote de extração = modelo pequeno
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.fast_path = fast_path
+        self.temperature = temperature
+        self.timeout = timeout
+        self.stats = BatchStats()
+        self._queue: "queue.Queue[Optional[Tuple[str, str, str, float, Future]]]" = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ia2-batch")
+        # refações individuais (JSON inválido / id faltando) não seguram o worker do lote
+        self._fallback_pool = ThreadPoolExecutor(max_workers=max_batch, thread_name_prefix="ia2-fallback")
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _next_id(self) -> str:
+        with self._seq_lock:
+            self._seq += 1
+            return f"m{self._seq}"
+
+    def submit(self, persona_id: str, client_message: str) -> Future:
+        self.stats.incr("items")
+        future: Future = Future()
+        if self.fast_path:
+            intents = get_matcher(self.store.get(persona_id)).match(client_message)
+            if intents is not None:
+                self.stats.incr("fast")
+                future.set_result(intents)
+                return future
+        self._queue.put((self._next_id(), persona_id, client_message, time.perf_counter(), future))
+        return future
+
+    def analyze(self, persona_id: str, client_message: str) -> Dict[str, Any]:
+        return self.submit(persona_id, client_message).result()
+
+    def _collect(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first[3] + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            now = time.perf_counter()
+            self.stats.record_batch(len(batch), [now - item[3] for item in batch])
+            self._pool.submit(self._send, batch)
+            if stop:
+                return
+
+    def payload(self, batch: List[Tuple[str, str, str, float, Future]]) -> Dict[str, Any]:
+        persona_ids = list(dict.fromkeys(item[1] for item in batch))
+        items = [{"id": mid, "garota": pid, "mensagem": msg} for mid, pid, msg, _, _ in batch]
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": build_ia2_batch_prompt([self.store.get(p) for p in persona_ids])},
+                {"role": "user", "content": json.dumps(items, ensure_ascii=False)}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": TOKENS_PER_ITEM * len(batch) + 50
+        }
+
+    def _send(self, batch: List[Tuple[str, str, str, float, Future]]):
+        persona_ids = {item[1] for item in batch}
+        call_labels = {"persona": persona_ids.pop() if len(persona_ids) == 1 else "multi", "operation": "ia2_batch"}
+        try:
+            with metrics.labels(**call_labels):
+                data = self.client.chat_completion(self.payload(batch), title=TITLE, timeout=self.timeout)
+            results = parse_batch(data["choices"][0]["message"]["content"])
+        except json.JSONDecodeError:
+            results = {}
+        except Exception as e:
+            self.stats.incr("errors")
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        for mid, pid, msg, _, future in batch:
+            if mid in results:
+                future.set_result(results[mid])
+                continue
+            # resposta do lote sem este id (ou JSON inválido): refaz sozinho, em paralelo com os demais
+            self.stats.incr("fallbacks")
+            metrics.FALLBACKS.inc(kind="batch_item", model=self.model, persona=pid, operation="ia2_batch")
+            self._fallback_pool.submit(self._send_single, pid, msg, future)
+
+    def _send_single(self, persona_id: str, client_message: str, future: Future):
+        try:
+            analyzer = IntentAnalyzer(persona_id, client=self.client, store=self.store, model=self.model,
+                                      fast_path=False, timeout=self.timeout)
+            future.set_result(analyzer.analyze(client_message))
+        except Exception as e:
+            future.set_exception(e)
+
+    def close(self):
+        self._queue.put(None)
+        self._collector.join()
+        self._pool.shutdown(wait=True)  # lotes em curso ainda podem agendar refações
+        self._fallback_pool.shutdown(wait=True)
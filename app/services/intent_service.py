@@ -0,0 +1,83 @@
+# app/services/intent_service.py
+# Caminho de análise de intents da IA 2: regras locais primeiro, LLM quando precisa.
+from __future__ import annotations
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from app import metrics
+from app.ai_intent import INTENT_FIELDS, IntentMatcher, get_matcher
+from app.ai_provider import ProviderClient, get_client
+from app.model_router import ModelRouter
+from app.persona import PersonaStore, get_store
+
+if TYPE_CHECKING:
+    from app.services.intent_batcher import IntentBatcher
+
+MODEL_IA2 = "openai/gpt-4o"  # só quando o provider não tem default_model_ia2
+TITLE = "whatsapp-autoresponder-intent-analysis"
+
+
+def parse_intents(text: str) -> Dict[str, Any]:
+    """Lê o JSON do modelo e garante os quatro campos como string."""
+    obj = json.loads(text)
+    intents = obj.get("intents", obj) if isinstance(obj, dict) else {}
+    return {"intents": {k: str(intents.get(k) or "") for k in INTENT_FIELDS}}
+
+
+class IntentAnalyzer:
+    """Extrai local/data/pagamento/fora_do_perfil de uma mensagem do cliente."""
+
+    def __init__(self, persona_id: str, client: Optional[ProviderClient] = None,
+                 store: Optional[PersonaStore] = None, model: Optional[str] = None,
+                 fast_path: bool = True, temperature: float = 0.7, max_tokens: int = 150,
+                 timeout: float = 30, batcher: Optional["IntentBatcher"] = None,
+                 router: Optional[ModelRouter] = None):
+        self.persona_id = persona_id
+        self.client = client or get_client()
+        self.store = store or get_store()
+        self.model = model or self.client.models.get("ia2") or MODEL_IA2
+        self.router = router
+        self.fast_path = fast_path
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.batcher = batcher  # quando informado, o LLM é chamado em micro-lotes com outras conversas
+
+    @property
+    def matcher(self) -> IntentMatcher:
+        return get_matcher(self.store.get(self.persona_id))
+
+    def payload(self, client_message: str, model: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": self.store.prompt(self.persona_id, "ia2")},
+                {"role": "user", "content": client_message}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+
+    def analyze(self, client_message: str) -> Dict[str, Any]:
+        if self.fast_path:
+            intents = self.matcher.match(client_message)
+            if intents is not None:
+                return intents
+        if self.batcher is not None:
+            return self.batcher.analyze(self.persona_id, client_message)
+        decision = self.router.choose("ia2", client_message) if self.router is not None else None
+        started = time.perf_counter()
+        try:
+            with metrics.labels(persona=self.persona_id, operation="ia2"):
+                data = self.client.chat_completion(self.payload(client_message, decision and decision.model),
+                                                   title=TITLE, timeout=self.timeout)
+        except Exception:
+            if decision is not None:
+                self.router.record(decision, time.perf_counter() - started, error=True)
+            raise
+        if decision is not None:
+            usage = data.get("usage") or {}
+            self.router.record(decision, time.perf_counter() - started, usage.get("prompt_tokens"),
+                               usage.get("completion_tokens"))
+        return parse_intents(data["choices"][0]["message"]["content"])
@@ -0,0 +1,230 @@
+# app/services/orchestrator.py
+# Resposta (IA 1) e intents (IA 2) em paralelo pra cada mensagem, descartando trabalho superado.
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional
+
+from app.ai_provider import ProviderClient, get_client
+from app.analytics import AnalyticsStore
+from app.conversation_state import ConversationStateStore
+from app.model_router import ModelRouter
+from app.notifications import NotificationDispatcher
+from app.persona import PersonaStore, get_store
+from app.reply_cache import ReplyCache
+from app.services.conversation import Conversation, intents_context
+from app.services.intent_batcher import IntentBatcher
+
+INTENT_WAIT = 0.05  # quanto a resposta espera pelos intents antes de seguir sem eles (s); cobre o caminho rápido local
+SLOT_IDLE_TTL = 1800  # conversa parada há mais que isso sai da memória (intents voltam do state_store)
+MAX_SLOTS = 1000  # teto de conversas em memória; as paradas há mais tempo saem primeiro
+
+
+class _Slot:
+    """Estado de orquestração de uma conversa: geração atual e mensagens ainda sem resposta."""
+
+    def __init__(self, conversation: Conversation):
+        self.conversation = conversation
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pending: List[str] = []
+        self.cancel = threading.Event()
+        self.in_flight = 0  # respostas agendadas e ainda não terminadas (protegido pelo lock do orquestrador)
+        self.last_active = time.monotonic()
+
+
+class MessageOrchestrator:
+    """
+    Para cada mensagem dispara intents e resposta ao mesmo tempo. A resposta espera até
+    `intent_wait` pelos intents e, se chegarem, eles entram no system prompt. Quando chega
+    mensagem nova do mesmo cliente, a resposta em andamento é cancelada (no streaming, entre
+    frases) e a próxima responde às mensagens pendentes juntas.
+    Conversas sem nada em andamento e paradas há `idle_ttl` (ou além de `max_slots`, as mais
+    antigas) saem da memória; com `state_store`, os intents voltam dele na próxima mensagem.
+    """
+
+    def __init__(self, client: Optional[ProviderClient] = None, store: Optional[PersonaStore] = None,
+                 workers: int = 8, intent_wait: float = INTENT_WAIT, stream: bool = True,
+                 fast_path: bool = True, cache: Optional[ReplyCache] = None,
+                 intent_batcher: Optional[IntentBatcher] = None,
+                 state_store: Optional[ConversationStateStore] = None,
+                 notifier: Optional[NotificationDispatcher] = None,
+                 router: Optional[ModelRouter] = None,
+                 analytics: Optional[AnalyticsStore] = None, idle_ttl: float = SLOT_IDLE_TTL,
+                 max_slots: int = MAX_SLOTS):
+        self.client = client or get_client()
+        self.store = store or get_store()
+        self.intent_wait = intent_wait
+        self.stream = stream
+        self.fast_path = fast_path
+        self.cache = cache
+        self.intent_batcher = intent_batcher
+        self.state_store = state_store
+        self.notifier = notifier  # alertas saem numa fila à parte, nunca no caminho da resposta
+        self.router = router
+        self.analytics = analytics  # eventos pro analytics_daily (mensagens, respostas, agendamentos)
+        # pools separados: resposta esperando intents nunca ocupa a vaga de quem calcula os intents
+        self._reply_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ia1")
+        self._intent_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ia2")
+        self.idle_ttl = idle_ttl
+        self.max_slots = max_slots
+        self._slots: "OrderedDict[str, _Slot]" = OrderedDict()  # do uso mais antigo pro mais recente
+        self._lock = threading.Lock()
+        self.stats = {"messages": 0, "replies": 0, "stale": 0, "cancelled_streams": 0,
+                      "intents_in_time": 0, "intent_errors": 0, "bookings_completed": 0, "evicted": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def conversation(self, conversation_id: str, persona_id: str) -> Conversation:
+        return self._slot(conversation_id, persona_id).conversation
+
+    def _slot(self, conversation_id: str, persona_id: str, reserve: bool = False) -> _Slot:
+        with self._lock:
+            slot = self._slots.get(conversation_id)
+            if slot is None:
+                conv = Conversation(persona_id, conversation_id, client=self.client, store=self.store,
+                                    cache=self.cache, fast_path=self.fast_path,
+                                    chat_options={"router": self.router},
+                                    intent_options={"batcher": self.intent_batcher, "router": self.router},
+                                    state_store=self.state_store)
+                slot = self._slots[conversation_id] = _Slot(conv)
+            else:
+                self._slots.move_to_end(conversation_id)
+            slot.last_active = time.monotonic()
+            if reserve:
+                slot.in_flight += 1
+            self._evict_idle()
+            return slot
+
+    def _evict_idle(self):
+        """Chamado com self._lock: tira do começo do LRU as conversas paradas (nunca as em andamento)."""
+        now = time.monotonic()
+        for conversation_id in list(self._slots):
+            slot = self._slots[conversation_id]
+            expired = now - slot.last_active > self.idle_ttl
+            if not expired and len(self._slots) <= self.max_slots:
+                break  # daqui pra frente todas foram usadas mais recentemente
+            if slot.in_flight:
+                continue
+            del self._slots[conversation_id]
+            self.stats["evicted"] += 1
+
+    def _release(self, slot: _Slot):
+        with self._lock:
+            slot.in_flight -= 1
+            slot.last_active = time.monotonic()
+
+    def submit(self, conversation_id: str, persona_id: str, message: str, received: int = 1) -> Future:
+        """
+        Agenda a mensagem; o Future devolve o resultado (stale=True se foi superada).
+        received: quantas mensagens do cliente o texto junta (rajada agrupada pelo webhook).
+        """
+        slot = self._slot(conversation_id, persona_id, reserve=True)
+        if self.analytics is not None:
+            self.analytics.message_in(persona_id, received)
+        with slot.lock:
+            slot.cancel.set()  # qualquer resposta em andamento fica obsoleta
+            slot.cancel = threading.Event()
+            slot.generation += 1
+            slot.pending.append(message)
+            generation, cancel = slot.generation, slot.cancel
+        self._count("messages")
+        started = time.perf_counter()
+        intent_future = self._intent_pool.submit(self._intents, slot, message)
+        future = self._reply_pool.submit(self._reply, slot, generation, cancel, intent_future, started)
+        # intents podem terminar depois da resposta; a conversa só fica livre pra sair com os dois
+        future.add_done_callback(lambda _: intent_future.add_done_callback(lambda _: self._release(slot)))
+        return future
+
+    def process(self, conversation_id: str, persona_id: str, message: str, received: int = 1) -> Dict[str, Any]:
+        return self.submit(conversation_id, persona_id, message, received).result()
+
+    def _intents(self, slot: _Slot, message: str) -> Dict[str, Any]:
+        intents = slot.conversation.analyzer.analyze(message)
+        with slot.lock:
+            # intents valem mesmo se a resposta desta mensagem for superada
+            completed = slot.conversation.merge_intents(intents)
+            detected = dict(slot.conversation.detected_intents)
+        if completed:
+            self._count("bookings_completed")
+            if self.analytics is not None:
+                conv = slot.conversation
+                price = ((conv.chat.persona.get("profissional") or {}).get("preco_base") or {}).get("valor") or 0
+                self.analytics.booking(conv.persona_id, float(price))
+        if self.notifier is not None:
+            conv = slot.conversation
+            self.notifier.notify_intents(conv.conversation_id, conv.chat.persona, detected)
+        return intents
+
+    def _stale(self, slot: _Slot, started: float) -> Dict[str, Any]:
+        self._count("stale")
+        return {"conversation_id": slot.conversation.conversation_id, "stale": True, "reply": None,
+                "total_s": time.perf_counter() - started}
+
+    def _reply(self, slot: _Slot, generation: int, cancel: threading.Event, intent_future: Future,
+               started: float) -> Dict[str, Any]:
+        conv = slot.conversation
+        if cancel.is_set():
+            return self._stale(slot, started)
+        try:
+            intent_future.result(timeout=self.intent_wait)
+            in_time = True
+            self._count("intents_in_time")
+        except FutureTimeout:
+            in_time = False
+        except Exception:
+            in_time = False
+            self._count("intent_errors")
+        if cancel.is_set():
+            return self._stale(slot, started)
+
+        with slot.lock:
+            message = "\n".join(slot.pending)
+            known = dict(conv.detected_intents)
+            extra = intents_context(known)
+        if self.stream:
+            sentences = []
+            stream = conv.chat.reply_stream(message, extra_system=extra, intents=known)
+            try:
+                for sentence in stream:
+                    if cancel.is_set():
+                        self._count("cancelled_streams")
+                        return self._stale(slot, started)
+                    sentences.append(sentence)
+            finally:
+                stream.close()  # fecha a resposta HTTP se o stream foi interrompido
+            reply = " ".join(sentences)
+        else:
+            reply = conv.chat.reply(message, extra_system=extra, intents=known)
+        reply_s = time.perf_counter() - started
+
+        with slot.lock:
+            if generation != slot.generation:
+                return self._stale(slot, started)
+            conv.chat.record(message, reply)
+            slot.pending.clear()
+            conv.turns += 1
+            intents = dict(conv.detected_intents)
+            booking = conv.booking_complete()
+        self._count("replies")
+        if self.analytics is not None:
+            self.analytics.message_out(conv.persona_id)
+        return {
+            "conversation_id": conv.conversation_id,
+            "stale": False,
+            "message": message,
+            "reply": reply,
+            "intents": intents,
+            "intents_in_time": in_time,
+            "booking_complete": booking,
+            "reply_s": reply_s,
+            "total_s": time.perf_counter() - started,
+        }
+
+    def close(self):
+        self._reply_pool.shutdown(wait=True)
+        self._intent_pool.shutdown(wait=True)
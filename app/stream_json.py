@@ -0,0 +1,162 @@
+# app/stream_json.py
+# Validação incremental do JSON de diálogo ({"messages": [...]}) enquanto os tokens chegam.
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional
+
+PREAMBLE_LIMIT = 200  # texto tolerado antes do "{" (ex.: ```json)
+MIN_TURNS = 6
+MAX_TURNS = 12
+MAX_ITEM_CHARS = 1500  # um turno maior que isso é o modelo desandando
+ROLES = ("human", "assistant")
+
+
+class StreamValidationError(ValueError):
+    """Saída do modelo já é inválida; não adianta esperar o resto."""
+
+
+class DialogStreamValidator:
+    """
+    Consome o texto em pedaços (feed) e valida cada turno de "messages" assim que o objeto dele
+    fecha: papel human/assistant, alternância começando em human e conteúdo não vazio. Levanta
+    StreamValidationError no primeiro sinal de saída inválida, pra quem chama abortar a requisição.
+    `complete` fica True quando já há `max_turns` turnos ou o objeto raiz fechou — dá pra parar
+    o stream ali mesmo.
+    """
+
+    def __init__(self, min_turns: int = MIN_TURNS, max_turns: int = MAX_TURNS,
+                 max_item_chars: int = MAX_ITEM_CHARS, preamble_limit: int = PREAMBLE_LIMIT):
+        self.min_turns = min_turns
+        self.max_turns = max_turns
+        self.max_item_chars = max_item_chars
+        self.preamble_limit = preamble_limit
+        self.messages: List[Dict[str, str]] = []
+        self.consumed = 0
+        self.complete = False
+        self.closed = False  # objeto raiz fechou
+        self._started = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key_chars: Optional[List[str]] = None
+        self._key = ""
+        self._in_messages = False
+        self._item: Optional[List[str]] = None
+
+    def feed(self, text: str):
+        for ch in text:
+            self.consumed += 1
+            if self.complete:
+                return
+            self._step(ch)
+
+    def _fail(self, reason: str):
+        raise StreamValidationError(f"{reason} (após {self.consumed} caracteres)")
+
+    def _step(self, ch: str):
+        if not self._started:
+            if ch == "{":
+                self._started = True
+                self._stack.append("{")
+            elif self.consumed > self.preamble_limit:
+                self._fail("Saída não começa com objeto JSON")
+            return
+
+        depth = len(self._stack)
+        if self._item is not None:
+            self._item.append(ch)
+            if len(self._item) > self.max_item_chars:
+                self._fail("Turno longo demais")
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._key_chars is not None:
+                    self._key = "".join(self._key_chars)
+                    self._key_chars = None
+                return
+            if self._key_chars is not None:
+                self._key_chars.append(ch)
+            return
+
+        if ch == '"':
+            self._in_string = True
+            if depth == 1 and self._expect_key:
+                self._key_chars = []
+            elif depth == 2 and self._in_messages:
+                self._fail("Item de messages não é objeto")
+            return
+        if ch in " \t\r\n":
+            return
+
+        if depth == 1:
+            if ch == ":":
+                self._expect_key = False
+            elif ch == ",":
+                self._expect_key = True
+            elif ch == "}":
+                self._stack.pop()
+                self.closed = self.complete = True
+            elif ch in "[{":
+                self._in_messages = ch == "[" and self._key == "messages"
+                if self._key == "messages" and ch != "[":
+                    self._fail('"messages" não é lista')
+                self._stack.append(ch)
+            return
+
+        if depth == 2 and self._in_messages:
+            if ch == "{":
+                self._stack.append(ch)
+                self._item = ["{"]
+            elif ch == "]":
+                self._stack.pop()
+                self._in_messages = False
+                if len(self.messages) < self.min_turns:
+                    self._fail(f"Só {len(self.messages)} turnos")
+            elif ch != ",":
+                self._fail("Item de messages não é objeto")
+            return
+
+        if ch in "[{":
+            self._stack.append(ch)
+        elif ch in "]}":
+            opener = self._stack.pop()
+            if (opener, ch) not in (("[", "]"), ("{", "}")):
+                self._fail("JSON desbalanceado")
+            if self._in_messages and len(self._stack) == 2 and self._item is not None:
+                self._close_item("".join(self._item))
+                self._item = None
+
+    def _close_item(self, raw: str):
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError:
+            self._fail("Turno não é JSON válido")
+        role, content = item.get("role"), item.get("content")
+        if role not in ROLES:
+            self._fail(f"Papel inválido: {role!r}")
+        expected = ROLES[len(self.messages) % 2]
+        if role != expected:
+            self._fail(f"Turno {len(self.messages) + 1} deveria ser {expected}")
+        if not isinstance(content, str) or not content.strip():
+            self._fail(f"Turno {len(self.messages) + 1} sem conteúdo")
+        self.messages.append({"role": role, "content": content.strip()})
+        if len(self.messages) >= self.max_turns:
+            self.complete = True
+
+    def result(self) -> Dict[str, Any]:
+        """
+        Diálogo validado. Saída cortada (max_tokens) com turnos suficientes é aproveitada até o
+        último par human/assistant completo.
+        """
+        messages = self.messages
+        if len(messages) % 2:
+            messages = messages[:-1]
+        if len(messages) < self.min_turns:
+            raise StreamValidationError(f"Só {len(messages)} turnos válidos")
+        return {"messages": list(messages)}
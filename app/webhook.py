@@ -0,0 +1,390 @@
+# app/webhook.py
+# Entrada do WhatsApp: webhook que só enfileira, fila ordenada por telefone e rajada de mensagens vira uma resposta.
+from __future__ import annotations
+import hashlib
+import heapq
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+WEBHOOK_PATH = "/v1/webhook/whatsapp"  # integrations.whatsapp.webhook_path do architecture.yaml
+DEBOUNCE = 1.5  # silêncio do cliente que fecha a rajada (s)
+MAX_DELAY = 6.0  # rajada sem fim não segura a resposta mais que isso desde a primeira mensagem (s)
+WORKERS = 8
+SEEN_MEMORY = 20000  # ids de mensagem lembrados pra descartar reentregas do provedor
+WINDOW = 1000  # esperas/acks recentes guardados pro relatório
+
+ACK = b"EVENT_RECEIVED"
+
+
+@dataclass
+class InboundMessage:
+    phone: str  # quem mandou (número do cliente)
+    text: str
+    message_id: str = ""
+    to: str = ""  # número/instância que recebeu (identifica a garota)
+    timestamp: float = 0.0  # horário do provedor
+    received: float = field(default_factory=time.monotonic)
+
+
+def _clean_phone(value: str) -> str:
+    # UltraMsg manda "5511...@c.us"; Twilio, "whatsapp:+5511..."
+    return value.split("@", 1)[0].replace("whatsapp:", "").lstrip("+")
+
+
+def parse_meta_payload(data: Dict[str, Any]) -> List[InboundMessage]:
+    """Webhook da Meta Cloud API: entry[].changes[].value.messages[] (só texto; status são ignorados)."""
+    out = []
+    for entry in data.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            to = (value.get("metadata") or {}).get("phone_number_id", "")
+            for msg in value.get("messages") or []:
+                text = (msg.get("text") or {}).get("body")
+                if msg.get("type") != "text" or not text:
+                    continue
+                out.append(InboundMessage(_clean_phone(str(msg.get("from", ""))), text, str(msg.get("id", "")),
+                                          str(to), float(msg.get("timestamp") or 0)))
+    return out
+
+
+def parse_ultramsg_payload(data: Dict[str, Any]) -> List[InboundMessage]:
+    """Webhook do UltraMsg (bloco ultra_msg do config.json): {"event_type", "instanceId", "data": {...}}."""
+    if data.get("event_type") not in (None, "message_received"):
+        return []
+    msg = data.get("data") or {}
+    if msg.get("fromMe") or msg.get("type", "chat") != "chat" or not msg.get("body"):
+        return []
+    return [InboundMessage(_clean_phone(str(msg.get("from", ""))), msg["body"], str(msg.get("id", "")),
+                           str(data.get("instanceId") or _clean_phone(str(msg.get("to", "")))),
+                           float(msg.get("time") or 0))]
+
+
+def parse_twilio_form(form: Dict[str, str]) -> List[InboundMessage]:
+    if not form.get("Body"):
+        return []
+    return [InboundMessage(_clean_phone(form.get("From", "")), form["Body"], form.get("MessageSid", ""),
+                           _clean_phone(form.get("To", "")))]
+
+
+def parse_payload(body: bytes, content_type: str = "application/json") -> List[InboundMessage]:
+    """Detecta o formato do provedor pelo corpo."""
+    if "application/x-www-form-urlencoded" in content_type:
+        form = {k: v[0] for k, v in parse_qs(body.decode("utf-8", "replace")).items()}
+        return parse_twilio_form(form)
+    data = json.loads(body or b"{}")
+    if not isinstance(data, dict):
+        return []
+    if "entry" in data:
+        return parse_meta_payload(data)
+    return parse_ultramsg_payload(data)
+
+
+def verify_signature(body: bytes, header: Optional[str], app_secret: str) -> bool:
+    """X-Hub-Signature-256 da Meta: "sha256=" + HMAC-SHA256 do corpo com o app secret."""
+    if not header or not header.startswith("sha256="):
+        return False
+    expected = hmac.new(app_secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header[len("sha256="):])
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class _PhoneQueue:
+    """Mensagens ainda não respondidas de um cliente; `busy` garante uma rajada por vez, em ordem."""
+
+    __slots__ = ("messages", "first_at", "last_at", "busy", "scheduled_at")
+
+    def __init__(self):
+        self.messages: List[InboundMessage] = []
+        self.first_at = 0.0
+        self.last_at = 0.0
+        self.busy = False
+        self.scheduled_at: Optional[float] = None
+
+    def ready_at(self, debounce: float, max_delay: float) -> float:
+        return min(self.last_at + debounce, self.first_at + max_delay)
+
+
+class WebhookIngestor:
+    """
+    ingest() só enfileira e volta (o webhook responde 200 na hora). Cada telefone tem sua fila:
+    mensagens seguidas do mesmo cliente esperam `debounce` de silêncio (no máximo `max_delay`
+    desde a primeira) e vão juntas pro `handler(phone, mensagens)` num pool de workers. Um
+    telefone nunca tem duas rajadas em processamento ao mesmo tempo; o que chega durante o
+    processamento vira a próxima rajada, na ordem de chegada.
+    """
+
+    def __init__(self, handler: Callable[[str, List[InboundMessage]], Any], workers: int = WORKERS,
+                 debounce: float = DEBOUNCE, max_delay: float = MAX_DELAY):
+        self.handler = handler
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self._queues: Dict[str, _PhoneQueue] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._inflight = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="webhook")
+        self.stats: Dict[str, int] = {"received": 0, "duplicates": 0, "bursts": 0, "handler_errors": 0}
+        self.burst_sizes: Dict[int, int] = {}
+        self.waits: Deque[float] = deque(maxlen=WINDOW)  # 1ª mensagem da rajada -> início do processamento (s)
+        self._scheduler = threading.Thread(target=self._run, name="webhook-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def ingest(self, messages: List[InboundMessage]) -> int:
+        """Enfileira; devolve quantas eram novas (reentregas do provedor são descartadas)."""
+        accepted = 0
+        with self._cond:
+            for msg in messages:
+                if msg.message_id:
+                    if msg.message_id in self._seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    self._seen[msg.message_id] = None
+                    if len(self._seen) > SEEN_MEMORY:
+                        self._seen.popitem(last=False)
+                q = self._queues.get(msg.phone)
+                if q is None:
+                    q = self._queues[msg.phone] = _PhoneQueue()
+                if not q.messages:
+                    q.first_at = msg.received
+                q.messages.append(msg)
+                q.last_at = msg.received
+                self.stats["received"] += 1
+                accepted += 1
+                if not q.busy:
+                    self._schedule(msg.phone, q)
+            self._cond.notify()
+        return accepted
+
+    def _schedule(self, phone: str, q: _PhoneQueue):
+        # entrada antiga no heap continua lá; _run compara com scheduled_at e ignora a obsoleta
+        q.scheduled_at = q.ready_at(self.debounce, self.max_delay)
+        self._seq += 1
+        heapq.heappush(self._heap, (q.scheduled_at, self._seq, phone))
+
+    def _take_due(self) -> List[Tuple[str, List[InboundMessage]]]:
+        now = time.monotonic()
+        due = []
+        while self._heap and (self._heap[0][0] <= now or self._closing):
+            at, _, phone = heapq.heappop(self._heap)
+            q = self._queues.get(phone)
+            if q is None or q.busy or q.scheduled_at != at or not q.messages:
+                continue
+            burst, q.messages, q.busy, q.scheduled_at = q.messages, [], True, None
+            due.append((phone, burst))
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due = self._take_due()
+                while not due:
+                    if self._closing and not self._heap and not self._inflight:
+                        return
+                    wait = max(0.0, self._heap[0][0] - time.monotonic()) if self._heap else None
+                    self._cond.wait(wait if not self._closing else 0.05)
+                    due = self._take_due()
+                now = time.monotonic()
+                for phone, burst in due:
+                    self._inflight += 1
+                    self.stats["bursts"] += 1
+                    self.burst_sizes[len(burst)] = self.burst_sizes.get(len(burst), 0) + 1
+                    self.waits.append(now - burst[0].received)
+            for phone, burst in due:
+                self._pool.submit(self._process, phone, burst)
+
+    def _process(self, phone: str, burst: List[InboundMessage]):
+        try:
+            self.handler(phone, burst)
+        except Exception as e:
+            with self._cond:
+                self.stats["handler_errors"] += 1
+            print(f"Erro ao processar mensagens de {phone}: {e}")
+        finally:
+            with self._cond:
+                self._inflight -= 1
+                q = self._queues[phone]
+                q.busy = False
+                if q.messages:
+                    self._schedule(phone, q)
+                else:
+                    del self._queues[phone]  # telefone ocioso não ocupa memória
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Processa já o que está esperando (ignora o debounce) e aguarda terminar."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._queues:
+                now = time.monotonic()
+                for phone, q in self._queues.items():
+                    if not q.busy and q.messages and (q.scheduled_at is None or q.scheduled_at > now):
+                        q.first_at = q.last_at = now - self.max_delay
+                        self._schedule(phone, q)
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.1) if remaining is not None else 0.1)
+        return True
+
+    def close(self, timeout: Optional[float] = 30):
+        """Processa o que restou e para o scheduler e os workers."""
+        self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._scheduler.join(timeout)
+        self._pool.shutdown(wait=True)
+
+    def report(self) -> Dict[str, Any]:
+        with self._cond:
+            waits = list(self.waits)
+            out: Dict[str, Any] = dict(self.stats)
+            out["burst_sizes"] = dict(sorted(self.burst_sizes.items()))
+        out["messages_per_burst"] = out["received"] / out["bursts"] if out["bursts"] else None
+        out["wait_p50_s"] = _percentile(waits, 50)
+        out["wait_p95_s"] = _percentile(waits, 95)
+        return out
+
+
+def conversation_handler(orchestrator: Any, persona_for: Callable[[InboundMessage], str],
+                         send: Callable[[str, str], Any]) -> Callable[[str, List[InboundMessage]], Dict[str, Any]]:
+    """
+    Handler do ingestor em cima do MessageOrchestrator: a rajada vai como uma mensagem só
+    (linhas juntadas) e a resposta sai por `send(telefone, texto)`.
+    """
+    def handle(phone: str, burst: List[InboundMessage]) -> Dict[str, Any]:
+        persona_id = persona_for(burst[0])
+        result = orchestrator.process(f"{persona_id}:{phone}", persona_id, "\n".join(m.text for m in burst),
+                                      received=len(burst))
+        if result.get("reply"):
+            send(phone, result["reply"])
+        return result
+    return handle
+
+
+class UltraMsgSender:
+    """Envia a resposta pelo UltraMsg (POST /{instance}/messages/chat), com sessão keep-alive."""
+
+    def __init__(self, instance_id: str, token: str, base_url: str = "https://api.ultramsg.com",
+                 timeout: float = 15):
+        self.url = f"{base_url.rstrip('/')}/{instance_id}/messages/chat"
+        self.token = token
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @classmethod
+    def from_config(cls, block: Dict[str, Any]) -> "UltraMsgSender":
+        return cls(block["instance_id"], block["token"])
+
+    def __call__(self, phone: str, text: str):
+        resp = self.session.post(self.url, data={"token": self.token, "to": phone, "body": text},
+                                 timeout=self.timeout)
+        resp.raise_for_status()
+
+
+class WebhookServer:
+    """
+    Recebe o webhook em `path`: GET faz a verificação da Meta (hub.challenge), POST valida a
+    assinatura (se houver app secret), enfileira no ingestor e responde 200 sem esperar a IA.
+    """
+
+    def __init__(self, ingestor: WebhookIngestor, host: str = "127.0.0.1", port: int = 8000,
+                 path: str = WEBHOOK_PATH, verify_token: Optional[str] = None, app_secret: Optional[str] = None):
+        self.ingestor = ingestor
+        self.path = path
+        self.verify_token = verify_token
+        self.app_secret = app_secret
+        self.ack_times: Deque[float] = deque(maxlen=WINDOW)  # POST -> 200 (s), janela recente
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code: int, body: bytes = b""):
+                self.send_response(code)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == "/health":
+                    self._reply(200, b"ok")
+                    return
+                if url.path != server.path:
+                    self._reply(404)
+                    return
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if query.get("hub.mode") == "subscribe" and query.get("hub.verify_token") == server.verify_token:
+                    self._reply(200, query.get("hub.challenge", "").encode("utf-8"))
+                else:
+                    self._reply(403)
+
+            def do_POST(self):
+                started = time.perf_counter()
+                if urlsplit(self.path).path != server.path:
+                    self._reply(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if server.app_secret and not verify_signature(body, self.headers.get("X-Hub-Signature-256"),
+                                                              server.app_secret):
+                    self._reply(401)
+                    return
+                try:
+                    messages = parse_payload(body, self.headers.get("Content-Type") or "application/json")
+                except (ValueError, TypeError, AttributeError):
+                    self._reply(400)
+                    return
+                server.ingestor.ingest(messages)
+                self._reply(200, ACK)
+                server.ack_times.append(time.perf_counter() - started)
+
+        return Handler
+
+    def start(self) -> "WebhookServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "WebhookServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
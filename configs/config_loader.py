@@ -1,13 +1,22 @@
 # /workspaces/whatsapp-autoresponder/configs/config_loader.py
 from __future__ import annotations
+import copy
 import json
 import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Tuple, Any
+from types import MappingProxyType
+from typing import Dict, Tuple, Any, Iterator, Mapping, Optional
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 CONFIG_PATH = PROJECT_ROOT / "configs" / "config.json"
 
+# intervalo mínimo entre checagens de mtime (o caminho quente não faz stat a cada chamada)
+CHECK_INTERVAL = 1.0
+
 class ConfigError(RuntimeError):
     pass
 
@@ -20,23 +29,220 @@ def _read_json(path: Path) -> Dict[str, Any]:
     except json.JSONDecodeError as e:
         raise ConfigError(f"JSON inválido em {path}: {e}")
 
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+@dataclass(frozen=True, eq=False)
+class ProviderSettings(Mapping):
+    """
+    Settings imutáveis de um provider, já validados e com endpoint/headers resolvidos.
+    Continua se comportando como dict de leitura (settings["api_key"], settings.get(...)).
+    Igualdade/hash por identidade: cada versão da config gera um objeto (get_client compara com "is").
+    """
+    name: str
+    api_key: Optional[str]
+    endpoint: Optional[str]
+    headers: Mapping[str, str]
+    models: Mapping[str, Optional[str]]
+    default_model: Optional[str]
+    raw: Mapping[str, Any] = field(repr=False)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.raw[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.raw)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    # o __hash__ gerado pelo dataclass falharia nos campos MappingProxyType; Mapping tiraria o hash
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+class _ConfigCache:
+    """Config parseada uma vez; recarrega só quando o mtime/tamanho do arquivo muda."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.RLock()  # get_provider_config lê a config e o memo sob o mesmo lock
+        self._raw: Optional[Dict[str, Any]] = None
+        self._signature: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        self._providers: Dict[Tuple[Any, ...], Tuple[str, ProviderSettings]] = {}
+        self.reloads = 0
+
+    def _file_signature(self) -> Tuple[int, int]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise ConfigError(f"Config não encontrada em: {self.path}")
+        return st.st_mtime_ns, st.st_size
+
+    def raw(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self._raw is not None and now - self._last_check < CHECK_INTERVAL:
+            return self._raw
+        with self._lock:
+            self._last_check = now
+            signature = self._file_signature()
+            if self._raw is None or signature != self._signature:
+                self._raw = _read_json(self.path)
+                self._signature = signature
+                self._providers.clear()
+                self.reloads += 1
+            return self._raw
+
+    def invalidate(self):
+        with self._lock:
+            self._raw = None
+            self._signature = None
+            self._providers.clear()
+
+_cache = _ConfigCache(CONFIG_PATH)
+
 def load_config() -> Dict[str, Any]:
-    return _read_json(CONFIG_PATH)
+    """Cópia da config em cache (quem chama pode alterar à vontade)."""
+    return copy.deepcopy(_cache.raw())
+
+def reload_config():
+    """Força releitura do config.json na próxima chamada."""
+    _cache.invalidate()
 
-def get_provider_config(provider: str | None = None) -> Tuple[str, Dict[str, Any]]:
+def install_reload_signal(signum: int = getattr(signal, "SIGHUP", 0)) -> bool:
+    """Recarrega a config ao receber o sinal (padrão SIGHUP). Só funciona na thread principal."""
+    if not signum:
+        return False
+    signal.signal(signum, lambda *_: reload_config())
+    return True
+
+def _providers_block(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Aceita os dois formatos de config:
+      - {"providers": {"openrouter": {...}, ...}}
+      - legado: {"provider": "openrouter", "settings": {...}, "runpod": {...}, ...}
     """
-    Retorna (provider_name, settings_dict).
+    if isinstance(cfg.get("providers"), dict):
+        return cfg["providers"]
+    if isinstance(cfg.get("settings"), dict) and cfg.get("provider"):
+        providers = {
+            name: block for name, block in cfg.items()
+            if name in ("openrouter", "google_cloud", "runpod") and isinstance(block, dict)
+        }
+        providers[cfg["provider"]] = cfg["settings"]
+        return providers
+    raise ConfigError('Config deve conter {"providers": {...}}')
+
+# Permitir overrides via env (ex.: OPENROUTER_API_KEY)
+ENV_OVERRIDES = {
+    "openrouter": ("OPENROUTER_API_KEY", "api_key"),
+    "runpod": ("RUNPOD_API_KEY", "api_key"),
+    "google_cloud": ("GOOGLE_API_KEY", "api_key"),
+}
+
+def _build_settings(active: str, source: Dict[str, Any]) -> ProviderSettings:
+    settings = copy.deepcopy(source)
+
+    # validações leves por provider
+    if active == "openrouter":
+        if not settings.get("api_key"):
+            raise ConfigError('openrouter: campo obrigatório ausente: "api_key"')
+        if not settings.get("base_url") and not settings.get("endpoint"):
+            raise ConfigError('openrouter: informe "base_url" ou "endpoint"')
+        # default endpoint de chat
+        settings.setdefault("chat_path", "/v1/chat/completions")
+
+    elif active == "google_cloud":
+        for k in ["project_id", "location", "model", "api_key"]:
+            if not settings.get(k):
+                raise ConfigError(f'google_cloud: campo obrigatório ausente: "{k}"')
+
+    elif active == "runpod":
+        if not settings.get("api_key"):
+            raise ConfigError('runpod: campo obrigatório ausente: "api_key"')
+        if not settings.get("base_url") and not settings.get("endpoint"):
+            raise ConfigError('runpod: informe "base_url" ou "endpoint"')
+
+    if active in ENV_OVERRIDES:
+        env_name, fld = ENV_OVERRIDES[active]
+        if os.getenv(env_name):
+            settings[fld] = os.getenv(env_name)
+
+    # header padrão (montado depois do override pra usar a chave efetiva)
+    if active == "openrouter":
+        settings.setdefault("headers", {
+            "Authorization": f"Bearer {settings['api_key']}",
+            "HTTP-Referer": settings.get("referer", "https://example.com"),
+            "X-Title": settings.get("app_title", "whatsapp-autoresponder"),
+            "Content-Type": "application/json",
+        })
+
+    endpoint = settings.get("endpoint")
+    if not endpoint and settings.get("base_url"):
+        endpoint = settings["base_url"].rstrip("/") + settings.get("chat_path", "/v1/chat/completions")
+
+    models = {
+        "ia1": settings.get("default_model_ia1") or settings.get("model"),
+        "ia2": settings.get("default_model_ia2") or settings.get("model"),
+    }
+    return ProviderSettings(
+        name=active,
+        api_key=settings.get("api_key"),
+        endpoint=endpoint,
+        headers=_freeze(settings.get("headers") or {}),
+        models=MappingProxyType(models),
+        default_model=settings.get("default_model") or settings.get("model") or models["ia1"],
+        raw=_freeze(settings),
+    )
+
+def settings_from_dict(name: str, block: Dict[str, Any]) -> ProviderSettings:
+    """Monta settings fora do config.json (ex.: servidor mock de benchmark)."""
+    return _build_settings(name, block)
+
+EMAIL_PASS_ENV = "EMAIL_PASS"
+
+def get_email_config() -> Mapping[str, Any]:
+    """Bloco "email" (SMTP) validado e imutável; senha pode vir da env EMAIL_PASS."""
+    block = _cache.raw().get("email")
+    if not isinstance(block, dict):
+        raise ConfigError('Config não tem o bloco "email" (SMTP).')
+    settings = copy.deepcopy(block)
+    if os.getenv(EMAIL_PASS_ENV):
+        settings["pass"] = os.getenv(EMAIL_PASS_ENV)
+    for k in ["user", "pass", "server", "port"]:
+        if not settings.get(k):
+            raise ConfigError(f'email: campo obrigatório ausente: "{k}"')
+    settings["port"] = int(settings["port"])
+    return _freeze(settings)
+
+def get_routing_config() -> Mapping[str, Any]:
+    """
+    Bloco opcional "routing" (roteador de modelos): small_model/large_model, policies por
+    operação (ia1/ia2) e prices por modelo. Sem o bloco, valem os padrões do app/model_router.py.
+    """
+    block = _cache.raw().get("routing") or {}
+    if not isinstance(block, dict):
+        raise ConfigError('"routing" deve ser um objeto.')
+    return _freeze(copy.deepcopy(block))
+
+def get_provider_config(provider: str | None = None) -> Tuple[str, ProviderSettings]:
+    """
+    Retorna (provider_name, settings) — settings imutável, validado uma vez e memoizado
+    até o config.json mudar (ou reload_config()).
     Prioridade para escolha do provider:
       1) parâmetro da função (se informado)
       2) variável de ambiente PROVIDER
       3) campo "provider" do config.json
     """
-    cfg = load_config()
-
-    # estrutura esperada
-    if "providers" not in cfg or not isinstance(cfg["providers"], dict):
-        raise ConfigError('Config deve conter {"providers": {...}}')
+    # config + memo sob o lock: um reload no meio não grava settings velhos no memo novo
+    with _cache._lock:
+        return _provider_config(_cache.raw(), provider)
 
+def _provider_config(cfg: Dict[str, Any], provider: str | None) -> Tuple[str, ProviderSettings]:
     # quem é o provider ativo?
     active = (
         provider
@@ -49,49 +255,22 @@ def get_provider_config(provider: str | None = None) -> Tuple[str, Dict[str, Any
             "ou set a env PROVIDER, ou passe parâmetro para get_provider_config()."
         )
 
-    providers = cfg["providers"]
+    env_name = ENV_OVERRIDES.get(active, ("", ""))[0]
+    key = (active, os.getenv(env_name) if env_name else None)
+    cached = _cache._providers.get(key)
+    if cached is not None:
+        return cached
+
+    # estrutura esperada
+    providers = _providers_block(cfg)
     if active not in providers:
         existentes = ", ".join(providers.keys()) or "(nenhum)"
         raise ConfigError(f'Provider "{active}" não existe em config. Disponíveis: {existentes}')
 
-    settings = providers[active]
-    if not isinstance(settings, dict):
+    source = providers[active]
+    if not isinstance(source, dict):
         raise ConfigError(f'Bloco do provider "{active}" deve ser um objeto JSON.')
 
-    # validações leves por provider
-    if active == "openrouter":
-        for k in ["api_key", "base_url"]:
-            if not settings.get(k):
-                raise ConfigError(f'openrouter: campo obrigatório ausente: "{k}"')
-        # header padrão (sem expor chave)
-        settings.setdefault("headers", {
-            "Authorization": f"Bearer {settings['api_key']}",
-            "HTTP-Referer": settings.get("referer", "https://example.com"),
-            "X-Title": settings.get("app_title", "whatsapp-autoresponder"),
-            "Content-Type": "application/json",
-        })
-        # default endpoint de chat
-        settings.setdefault("chat_path", "/v1/chat/completions")
-
-    elif active == "google_cloud":
-        for k in ["project_id", "location", "model", "api_key"]:
-            if not settings.get(k):
-                raise ConfigError(f'google_cloud: campo obrigatório ausente: "{k}"')
-
-    elif active == "runpod":
-        for k in ["api_key", "base_url"]:
-            if not settings.get(k):
-                raise ConfigError(f'runpod: campo obrigatório ausente: "{k}"')
-
-    # Permitir overrides via env (ex.: OPENROUTER_API_KEY)
-    env_overrides = {
-        "openrouter": ("OPENROUTER_API_KEY", "api_key"),
-        "runpod": ("RUNPOD_API_KEY", "api_key"),
-        "google_cloud": ("GOOGLE_API_KEY", "api_key"),
-    }
-    if active in env_overrides:
-        env_name, field = env_overrides[active]
-        if os.getenv(env_name):
-            settings[field] = os.getenv(env_name)
-
-    return active, settings
\ No newline at end of file
+    result = (active, _build_settings(active, source))
+    _cache._providers[key] = result
+    return result
@@ -0,0 +1,145 @@
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, Any, List
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app.analytics import (ANALYTICS_DIR, BOOKING, KINDS, MESSAGE_IN, MESSAGE_OUT, PAYMENT, AnalyticsStore,
+                           DayClock, day_range)
+
+
+def naive_range(store: AnalyticsStore, start: str, end: str) -> Dict[str, Any]:
+    """O que o painel faria sem rollup: varre o log inteiro a cada consulta."""
+    clock = DayClock(store.tz)
+    totals = {"messages_in": 0, "messages_out": 0, "bookings": 0, "revenue": 0}
+    for ts, kind, _, amount in store.log.read():
+        if not start <= clock.day(ts) <= end:
+            continue
+        if kind != PAYMENT:
+            totals[KINDS[kind]] += 1
+        if kind in (PAYMENT, BOOKING):
+            totals["revenue"] += amount
+    totals["revenue"] /= 100
+    return totals
+
+
+def synthetic_events(n: int, days: int, creators: int, seed: int) -> List[tuple]:
+    """Conversas sintéticas: ~2 mensagens do cliente por resposta, agendamento em ~3% das respostas."""
+    rng = random.Random(seed)
+    start = time.time() - days * 86400
+    ids = [f"gp{i:03d}" for i in range(1, creators + 1)]
+    events = []
+    ts = start
+    step = days * 86400 / n
+    while len(events) < n:
+        ts += rng.expovariate(1 / step)
+        cid = rng.choice(ids)
+        r = rng.random()
+        if r < 0.64:
+            events.append((MESSAGE_IN, cid, 0, ts))
+        elif r < 0.97:
+            events.append((MESSAGE_OUT, cid, 0, ts))
+        elif r < 0.99:
+            events.append((BOOKING, cid, rng.choice([30000, 45000, 60000]), ts))
+        else:
+            events.append((PAYMENT, cid, rng.choice([10000, 20000]), ts))
+    return events
+
+
+def bench(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        events = synthetic_events(args.events, args.days, args.creators, args.seed)
+        store = AnalyticsStore(Path(tmp))
+        started = time.perf_counter()
+        batch = 1000
+        for i in range(0, len(events), batch):
+            store.log.append_many(events[i:i + batch])
+        append_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store.rebuild()
+        rebuild_s = time.perf_counter() - started
+
+        # eventos ao vivo: log + rollup + checkpoint periódico, um por vez
+        live = synthetic_events(args.live, 1, args.creators, args.seed + 1)
+        started = time.perf_counter()
+        for kind, cid, amount, ts in live:
+            store.record(kind, cid, amount, ts)
+        live_s = time.perf_counter() - started
+        store.close()
+
+        # restart: snapshot do SQLite + só o rabo do log depois do checkpoint
+        started = time.perf_counter()
+        store = AnalyticsStore(Path(tmp))
+        reopen_s = time.perf_counter() - started
+        replayed = store.replayed
+
+        start, end = day_range(30)
+        started = time.perf_counter()
+        for _ in range(args.queries):
+            result = store.query(start, end)
+        query_s = (time.perf_counter() - started) / args.queries
+        started = time.perf_counter()
+        naive = naive_range(store, start, end)
+        naive_s = time.perf_counter() - started
+        assert naive == result["totals"], (naive, result["totals"])
+        size = store.log.size
+        store.close()
+
+    total = args.events + args.live
+    print(f"Eventos: {total} ({size / total:.0f} bytes/evento, log {size / 1e6:.1f} MB) | "
+          f"{args.days} dias | {args.creators} garotas")
+    print(f"  append em lote:       {args.events / append_s:,.0f} eventos/s")
+    print(f"  evento ao vivo:       {live_s / args.live * 1e6:.1f} µs/evento (log + rollup + checkpoint)")
+    print(f"  rebuild (1 passada):  {rebuild_s:.2f}s ({args.events / rebuild_s:,.0f} eventos/s)")
+    print(f"  reabrir:              {reopen_s * 1000:.0f}ms ({replayed} eventos reaplicados depois do snapshot)")
+    print(f"  consulta 30 dias:     {query_s * 1e6:.0f} µs (varrendo o log: {naive_s * 1000:.0f}ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rollup do analytics_daily: rebuild, consulta e benchmark.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="recalcula o rollup a partir do log")
+    p_rebuild.add_argument("--dir", type=Path, default=ANALYTICS_DIR)
+    p_query = sub.add_parser("query", help="totais e linhas diárias de um intervalo")
+    p_query.add_argument("--dir", type=Path, default=ANALYTICS_DIR)
+    p_query.add_argument("--days", type=int, default=7, help="últimos N dias (se --start/--end não vierem)")
+    p_query.add_argument("--start", default=None)
+    p_query.add_argument("--end", default=None)
+    p_query.add_argument("--creator", default=None, help="id da garota (ex.: gp001)")
+    p_bench = sub.add_parser("bench", help="log sintético num diretório temporário")
+    p_bench.add_argument("--events", type=int, default=1_000_000)
+    p_bench.add_argument("--live", type=int, default=20_000)
+    p_bench.add_argument("--days", type=int, default=365)
+    p_bench.add_argument("--creators", type=int, default=50)
+    p_bench.add_argument("--queries", type=int, default=100)
+    p_bench.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args)
+        return
+    store = AnalyticsStore(args.dir)
+    try:
+        if args.command == "rebuild":
+            started = time.perf_counter()
+            n = store.rebuild()
+            print(f"Rollup refeito: {n} eventos em {time.perf_counter() - started:.2f}s")
+        else:
+            start, end = day_range(args.days, tz=store.tz)
+            result = store.query(args.start or start, args.end or end, args.creator)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import sys
+import json
+import random
+import hashlib
+import argparse
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app.ai_intent import normalize
+
+# Configurações
+DIALOGS_FILE = PROJECT_ROOT / "data" / "dialogs" / "generated_dialogs.jsonl"
+NUM_PERM = 128  # tamanho da assinatura MinHash
+BANDS = 16  # LSH: 16 bandas x 8 linhas -> candidatos a partir de ~0.7 de similaridade
+SHINGLE_SIZE = 3  # n-gramas de palavras
+THRESHOLD = 0.8  # Jaccard estimado a partir do qual é "quase duplicado"
+SAVE_EVERY = 500  # grava o estado (offset/next_id) a cada N diálogos indexados
+SEED = 251
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def dialog_text(record: Dict[str, Any]) -> List[str]:
+    dialog = record.get("dialog", record)
+    turns = dialog.get("messages") or dialog.get("conversations") or []
+    out = []
+    for t in turns:
+        role = t.get("role", t.get("from", ""))
+        content = t.get("content", t.get("value", ""))
+        out.append(f"{role}: {' '.join(normalize(content).split())}")
+    return out
+
+
+def shingles(turns: List[str], k: int = SHINGLE_SIZE) -> set:
+    words = " ".join(turns).split()
+    if len(words) <= k:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+class DedupIndex:
+    """
+    Índice MinHash + LSH incremental: cada diálogo novo consulta só os baldes das suas
+    bandas (sub-linear) e é inserido em seguida. Duplicados exatos via hash do conteúdo.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, bands: int = BANDS, threshold: float = THRESHOLD):
+        if num_perm % bands:
+            raise ValueError("num_perm precisa ser múltiplo de bands.")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = random.Random(SEED)
+        self._perms = [(rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE)) for _ in range(num_perm)]
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(bands)]
+        self._exact: Dict[str, int] = {}
+        self._sigs: Dict[int, List[int]] = {}
+
+    def signature(self, items: set) -> List[int]:
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+                  for s in items]
+        return [min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes) for a, b in self._perms]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    def _bands(self, sig: List[int]) -> List[Tuple[int, ...]]:
+        return [tuple(sig[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    def query(self, exact_key: str, sig: List[int]) -> Tuple[str, Optional[int], float]:
+        """Devolve ("exact" | "near" | "unique", id do original, similaridade)."""
+        if exact_key in self._exact:
+            return "exact", self._exact[exact_key], 1.0
+        best, best_sim = None, 0.0
+        seen = set()
+        for band, key in enumerate(self._bands(sig)):
+            for cand in self._buckets[band].get(key, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                sim = self.similarity(sig, self._sigs[cand])
+                if sim > best_sim:
+                    best, best_sim = cand, sim
+        if best is not None and best_sim >= self.threshold:
+            return "near", best, best_sim
+        return "unique", None, best_sim
+
+    def add(self, item_id: int, exact_key: str, sig: List[int]):
+        self._exact.setdefault(exact_key, item_id)
+        self._sigs[item_id] = sig
+        for band, key in enumerate(self._bands(sig)):
+            self._buckets[band].setdefault(key, []).append(item_id)
+
+
+class DedupRun:
+    """Processa o JSONL de forma incremental, guardando assinaturas e offset ao lado do arquivo."""
+
+    def __init__(self, dialogs_file: Path = DIALOGS_FILE):
+        self.dialogs_file = dialogs_file
+        self.state_file = dialogs_file.with_name(dialogs_file.stem + ".dedup_state.json")
+        self.sigs_file = dialogs_file.with_name(dialogs_file.stem + ".dedup_sigs.jsonl")
+        self.index = DedupIndex()
+        self.offset = 0
+        self.next_id = 0
+        self.line_no = 0  # linhas não vazias já lidas (inclui as inválidas)
+        self.invalid: List[int] = []  # linhas que não são JSON válido (puladas)
+        self.entries: List[Dict[str, Any]] = []
+
+    def reset(self):
+        for path in (self.state_file, self.sigs_file):
+            if path.exists():
+                path.unlink()
+
+    def load(self):
+        if not self.state_file.exists() or not self.sigs_file.exists():
+            return
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("num_perm") != NUM_PERM or state.get("bands") != BANDS or state.get("seed") != SEED:
+            print("Parâmetros do índice mudaram; reconstruindo do zero.")
+            self.reset()
+            return
+        if self.dialogs_file.stat().st_size < state["offset"]:
+            print("Arquivo de diálogos encolheu (sobrescrito?); reconstruindo do zero.")
+            self.reset()
+            return
+        # o estado é gravado depois das assinaturas: o que passar de next_id é de uma execução
+        # interrompida e vai ser reindexado a partir do offset salvo
+        with open(self.sigs_file, "r+b") as f:
+            for _ in range(state["next_id"]):
+                raw = f.readline()
+                if not raw.endswith(b"\n"):
+                    break
+                entry = json.loads(raw)
+                self.index.add(entry["id"], entry["key"], entry["sig"])
+                self.entries.append({k: v for k, v in entry.items() if k != "sig"})
+            if len(self.entries) < state["next_id"]:
+                print("Assinaturas incompletas; reconstruindo do zero.")
+                self.index, self.entries = DedupIndex(), []
+                self.reset()
+                return
+            f.truncate(f.tell())
+        self.offset = state["offset"]
+        self.next_id = state["next_id"]
+        self.line_no = state.get("line_no", self.next_id)
+        self.invalid = state.get("invalid", [])
+
+    def save_state(self):
+        tmp = self.state_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"offset": self.offset, "next_id": self.next_id, "line_no": self.line_no,
+                       "invalid": self.invalid, "num_perm": NUM_PERM, "bands": BANDS, "seed": SEED}, f)
+        tmp.replace(self.state_file)
+
+    def update(self, save_every: int = SAVE_EVERY) -> List[Dict[str, Any]]:
+        """Indexa só as linhas novas desde a última execução."""
+        new_entries = []
+        with open(self.dialogs_file, "rb") as f, open(self.sigs_file, "a", encoding="utf-8") as sigs_out:
+            f.seek(self.offset)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # linha ainda sendo escrita pelo gerador
+                self.offset += len(raw)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                self.line_no += 1
+                try:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError("registro não é um objeto")
+                except ValueError:
+                    self.invalid.append(self.line_no)
+                    continue
+                turns = dialog_text(record)
+                exact_key = hashlib.sha1("\n".join(turns).encode("utf-8")).hexdigest()
+                sig = self.index.signature(shingles(turns))
+                status, dup_of, sim = self.index.query(exact_key, sig)
+                entry = {
+                    "id": self.next_id,
+                    "line": self.line_no,
+                    "key": exact_key,
+                    "persona": (record.get("garota") or {}).get("id") or (record.get("garota") or {}).get("nome"),
+                    "meta": record.get("meta"),
+                    "status": status,
+                    "dup_of": dup_of,
+                    "similarity": round(sim, 3),
+                }
+                self.index.add(self.next_id, exact_key, sig)
+                sigs_out.write(json.dumps({**entry, "sig": sig}) + "\n")
+                self.entries.append(entry)
+                new_entries.append(entry)
+                self.next_id += 1
+                if self.next_id % save_every == 0:
+                    sigs_out.flush()
+                    self.save_state()
+        self.save_state()
+        return new_entries
+
+    def report(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        groups: Dict[str, Dict[str, Dict[str, Any]]] = {"persona": {}, "meta": {}}
+        for entry in self.entries:
+            for dim in ("persona", "meta"):
+                g = groups[dim].setdefault(str(entry[dim]), {"total": 0, "exact": 0, "near": 0})
+                g["total"] += 1
+                if entry["status"] != "unique":
+                    g[entry["status"]] += 1
+        for dim in groups.values():
+            for g in dim.values():
+                g["dup_rate"] = round((g["exact"] + g["near"]) / g["total"], 3) if g["total"] else 0.0
+        return groups
+
+    def write_clean(self, out_path: Path) -> int:
+        dup_lines = {e["line"] for e in self.entries if e["status"] != "unique"} | set(self.invalid)
+        kept = 0
+        with open(self.dialogs_file, "r", encoding="utf-8") as f, open(out_path, "w", encoding="utf-8") as out:
+            line_no = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                line_no += 1
+                if line_no not in dup_lines:
+                    out.write(line)
+                    kept += 1
+        return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detecta diálogos duplicados/quase duplicados (MinHash + LSH).")
+    parser.add_argument("--file", type=Path, default=DIALOGS_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="ignora o índice salvo e refaz do zero")
+    parser.add_argument("--clean", type=Path, default=None, help="grava cópia sem os duplicados neste caminho")
+    args = parser.parse_args()
+
+    run = DedupRun(args.file)
+    if args.rebuild:
+        run.reset()
+    run.load()
+    new_entries = run.update()
+    for e in new_entries:
+        if e["status"] != "unique":
+            print(f"[linha {e['line']}] {e['status']} da linha {run.entries[e['dup_of']]['line']} (sim={e['similarity']})")
+
+    total = len(run.entries)
+    dups = sum(1 for e in run.entries if e["status"] != "unique")
+    print(f"Indexados: {total} (novos: {len(new_entries)}) | duplicados: {dups} "
+          f"({(dups / total if total else 0):.1%}) | linhas inválidas puladas: {len(run.invalid)}")
+    for dim, groups in run.report().items():
+        print(f"Por {dim}:")
+        for name, g in sorted(groups.items()):
+            print(f"  {name}: total {g['total']} | exatos {g['exact']} | quase {g['near']} | taxa {g['dup_rate']:.1%}")
+    if args.clean:
+        kept = run.write_clean(args.clean)
+        print(f"Cópia sem duplicados: {args.clean} ({kept} diálogos)")
+
+
+if __name__ == "__main__":
+    main()
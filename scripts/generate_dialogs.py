@@ -1,8 +1,12 @@
 import os
 import sys
 import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 import requests
 
 # Caminho do projeto
@@ -10,14 +14,28 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.append(str(PROJECT_ROOT))
 
+from app import metrics
+from app.ai_provider import get_client
+from app.stream_json import DialogStreamValidator, StreamValidationError
+
 # Configurações
-OVERWRITE = "sim"  # "sim" para substituir, "nao" para adicionar
+OVERWRITE = "nao"  # "sim" apaga saída + manifesto; "nao" retoma pulando o que já foi gerado
 NUM_DIALOGOS = 4  # Gerar 4 diálogos
+WORKERS = 4  # requisições simultâneas ao provider
+RPM_LIMIT = 60  # teto de requisições por minuto por provider (0 = sem limite)
+MAX_RETRIES = 3  # novas tentativas por diálogo antes do fallback
+BACKOFF_BASE = 2.0  # segundos; dobra a cada tentativa (+ jitter)
+STREAM_VALIDATE = True  # True: valida o JSON turno a turno no streaming e aborta cedo saída inválida
 PERSONALITIES_FILE = PROJECT_ROOT / "data" / "personas" / "personas_gp_client.json"
 OUTPUT_FILE = PROJECT_ROOT / "data" / "dialogs" / "generated_dialogs.jsonl"
+MANIFEST_FILE = PROJECT_ROOT / "data" / "dialogs" / "generated_dialogs.manifest.jsonl"
+METRICS_FILE = metrics.LOGS_DIR / "generate_dialogs.prom"  # métricas da rodada (formato Prometheus)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
 
 def ensure_dirs():
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
 
 def load_personalities() -> Dict[str, List[Dict[str, Any]]]:
     with open(PERSONALITIES_FILE, "r", encoding="utf-8") as f:
@@ -39,10 +57,6 @@ def resolve_model_name(default_model: str) -> str:
     }
     return mapping.get(default_model.strip().lower(), default_model)
 
-def load_config() -> Dict[str, Any]:
-    with open(PROJECT_ROOT / "configs" / "config.json", "r", encoding="utf-8") as f:
-        return json.load(f)
-
 def build_api_payload(garota: Dict[str, Any], cliente: Dict[str, Any], model_name: str, meta: str) -> Dict[str, Any]:
     system_prompt = (
         f"Você é uma assistente que GERA diálogos em português do Brasil entre uma acompanhante (mulher adulta) "
@@ -77,19 +91,67 @@ def build_api_payload(garota: Dict[str, Any], cliente: Dict[str, Any], model_nam
         "max_tokens": 900
     }
 
+class RateLimiter:
+    """Limita a taxa de requisições (RPM) de forma thread-safe, espaçando as chamadas."""
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, rpm: int = RPM_LIMIT) -> RateLimiter:
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter(rpm)
+        return _limiters[provider]
+
 def call_chat_api(payload: Dict[str, Any]) -> str:
-    config = load_config()
-    api_key = config["settings"]["api_key"]
-    endpoint = config["settings"]["endpoint"]
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/macklee251/whatsapp-autoresponder",
-        "X-Title": "whatsapp-autoresponder-dataset-gen"
-    }
-    resp = requests.post(endpoint, headers=headers, json=payload, timeout=120)
-    resp.raise_for_status()
-    return resp.json()["choices"][0]["message"]["content"]
+    data = get_client().chat_completion(payload, title="whatsapp-autoresponder-dataset-gen", timeout=120)
+    return data["choices"][0]["message"]["content"]
+
+_stream_stats = {"aborted": 0, "chars_before_abort": 0, "stopped_early": 0}
+_stream_stats_lock = threading.Lock()
+
+def call_chat_api_validated(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Variante em streaming: cada turno é validado assim que fecha. Saída inválida derruba a
+    requisição na hora (StreamValidationError, que é ValueError e entra no retry); ao atingir o
+    máximo de turnos, para de consumir tokens.
+    """
+    params = {k: v for k, v in payload.items() if k not in ("model", "messages")}
+    validator = DialogStreamValidator()
+    stream = get_client().chat_stream(payload["messages"], model=payload["model"],
+                                      title="whatsapp-autoresponder-dataset-gen", timeout=120, **params)
+    try:
+        for delta in stream:
+            validator.feed(delta)
+            if validator.complete:
+                if not validator.closed:
+                    with _stream_stats_lock:
+                        _stream_stats["stopped_early"] += 1
+                break
+    except StreamValidationError:
+        with _stream_stats_lock:
+            _stream_stats["aborted"] += 1
+            _stream_stats["chars_before_abort"] += validator.consumed
+        raise
+    finally:
+        stream.close()  # fecha a conexão: o provider para de gerar
+    return validator.result()
 
 def best_effort_json_parse(text: str) -> Optional[Dict[str, Any]]:
     try:
@@ -154,57 +216,172 @@ def pair_indices(num: int, n_g: int, n_c: int) -> List[tuple]:
         pairs.append((g, c))
     return pairs
 
+def dialog_key(garota: Dict[str, Any], cliente: Dict[str, Any], meta: str) -> str:
+    return f"{garota.get('id', garota.get('nome'))}|{cliente.get('id', cliente.get('nome'))}|{meta}"
+
+def load_manifest() -> Dict[str, str]:
+    """Status mais recente de cada chave (garota, cliente, meta) gravada em execuções anteriores."""
+    status: Dict[str, str] = {}
+    if not MANIFEST_FILE.exists():
+        return status
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                status[entry["key"]] = entry.get("status", "ok")
+            except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                # linha truncada por queda no meio da escrita: ignora
+                continue
+    return status
+
+def drop_keys(path: Path, keys: Set[str], key_of) -> int:
+    """Reescreve o JSONL sem as linhas das chaves dadas (troca atômica). Devolve quantas saíram."""
+    if not keys or not path.exists():
+        return 0
+    dropped = 0
+    tmp = path.with_name(path.name + ".tmp")
+    with open(path, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for line in src:
+            try:
+                key = key_of(json.loads(line))
+            except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                key = None
+            if key in keys:
+                dropped += 1
+                continue
+            dst.write(line)
+    tmp.replace(path)
+    return dropped
+
+def drop_fallbacks(keys: Set[str]) -> int:
+    """Tira do dataset e do manifesto os diálogos de fallback que vão ser gerados de novo."""
+    dropped = drop_keys(OUTPUT_FILE, keys, lambda r: dialog_key(r["garota"], r["cliente"], r["meta"]))
+    drop_keys(MANIFEST_FILE, keys, lambda r: r["key"])
+    return dropped
+
+def retry_delay(attempt: int, error: Exception) -> float:
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return BACKOFF_BASE * (2 ** attempt) + random.uniform(0, BACKOFF_BASE)
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is None or error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ValueError))
+
+def generate_one(payload: Dict[str, Any], limiter: RateLimiter, persona: Optional[str] = None) -> Dict[str, Any]:
+    """Gera um diálogo válido com retry + backoff; levanta a última exceção se esgotar."""
+    attempt = 0
+    with metrics.labels(persona=persona, operation="dataset_gen"):
+        while True:
+            try:
+                limiter.wait()
+                if STREAM_VALIDATE:
+                    obj = validate_messages(call_chat_api_validated(payload))
+                else:
+                    raw = call_chat_api(payload)
+                    obj = best_effort_json_parse(raw)
+                    obj = validate_messages(obj) if obj else None
+                if not obj:
+                    raise ValueError("JSON inválido do modelo.")
+                return obj
+            except Exception as e:
+                if attempt >= MAX_RETRIES or not is_retryable(e):
+                    raise
+                metrics.RETRIES.inc(model=payload["model"])
+                time.sleep(retry_delay(attempt, e))
+                attempt += 1
+
 def generate_dialogs():
     ensure_dirs()
     personas = load_personalities()
     garotas = personas["garotas"]
     clientes = personas["clientes"]
-    config = load_config()
-    model_name = resolve_model_name(config["settings"]["default_model"])
+    client = get_client()
+    # diálogos de treino com o modelo grande (default_model_ia1); o mapa cobre nomes sem prefixo
+    model_name = resolve_model_name(client.models.get("ia1") or client.default_model)
+    limiter = get_rate_limiter(client.provider)
     metas = [
         "conversa natural com putaria e marcação no final",
         "desentendimento leve sem xingamentos e sem marcação",
         "cliente arrogante com resposta arrogante da garota",
         "cliente pede algo fora dos limites e garota nega"
     ]
+
+    if OVERWRITE.lower() == "sim":
+        for path in (OUTPUT_FILE, MANIFEST_FILE):
+            if path.exists():
+                path.unlink()
+    manifest_status = load_manifest()
+    # só "ok" conta como feito; fallback (texto fixo) sai do dataset e volta pra fila
+    retry = {key for key, status in manifest_status.items() if status != "ok"}
+    if retry:
+        print(f"Refazendo {len(retry)} diálogos que caíram no fallback "
+              f"({drop_fallbacks(retry)} linhas de fallback removidas de {OUTPUT_FILE.name}).")
+    done = {key for key, status in manifest_status.items() if status == "ok"}
+
+    # monta a fila só com as triplas (garota, cliente, meta) ainda não geradas
+    jobs: List[Tuple[int, Dict[str, Any], Dict[str, Any], str]] = []
     pairs = pair_indices(NUM_DIALOGOS, len(garotas), len(clientes))
-    print(f"Geração iniciada | modelo: {model_name} | diálogos: {len(pairs)}")
+    for idx, (gi, ci) in enumerate(pairs, start=1):
+        garota, cliente = garotas[gi], clientes[ci]
+        meta = metas[(idx - 1) % len(metas)]
+        key = dialog_key(garota, cliente, meta)
+        if key in done:
+            continue
+        done.add(key)
+        jobs.append((idx, garota, cliente, meta))
+
+    skipped = len(pairs) - len(jobs)
+    print(f"Geração iniciada | modelo: {model_name} | diálogos: {len(jobs)} "
+          f"(pulados: {skipped}) | workers: {WORKERS} | rpm: {RPM_LIMIT or 'sem limite'}")
     ok, fail = 0, 0
-    mode = "w" if OVERWRITE.lower() == "sim" else "a"
-    with open(OUTPUT_FILE, mode, encoding="utf-8") as out:
-        for idx, (gi, ci) in enumerate(pairs, start=1):
-            garota = garotas[gi]
-            cliente = clientes[ci]
-            meta = metas[idx - 1]
-            payload = build_api_payload(garota, cliente, model_name, meta)
+    with open(OUTPUT_FILE, "a", encoding="utf-8") as out, \
+            open(MANIFEST_FILE, "a", encoding="utf-8") as manifest, \
+            ThreadPoolExecutor(max_workers=max(1, WORKERS)) as pool:
+        futures = {
+            pool.submit(generate_one, build_api_payload(garota, cliente, model_name, meta), limiter,
+                        garota.get("id") or garota.get("nome")):
+                (idx, garota, cliente, meta)
+            for idx, garota, cliente, meta in jobs
+        }
+        # grava cada diálogo assim que termina (só a thread principal escreve)
+        for future in as_completed(futures):
+            idx, garota, cliente, meta = futures[future]
             try:
-                raw = call_chat_api(payload)
-                obj = best_effort_json_parse(raw)
-                obj = validate_messages(obj) if obj else None
-                if not obj:
-                    raise ValueError("JSON inválido do modelo, usando fallback.")
-                output = {
-                    "dialog": obj,
-                    "garota": garota,
-                    "cliente": cliente,
-                    "meta": meta
-                }
-                out.write(json.dumps(output, ensure_ascii=False) + "\n")
-                print(f"[{idx}] salvo (garota={garota['nome']} x cliente={cliente['nome']}, meta={meta})")
+                obj = future.result()
+                status = "ok"
                 ok += 1
             except Exception as e:
                 print(f"[{idx}] Falha ({e}); usando fallback.")
                 obj = fallback_dialog(garota, cliente)
-                output = {
-                    "dialog": obj,
-                    "garota": garota,
-                    "cliente": cliente,
-                    "meta": meta
-                }
-                out.write(json.dumps(output, ensure_ascii=False) + "\n")
-                print(f"[{idx}] salvo (garota={garota['nome']} x cliente={cliente['nome']}, meta={meta})")
+                status = "fallback"
+                metrics.FALLBACKS.inc(kind="dialog", model=model_name, operation="dataset_gen",
+                                      persona=garota.get("id") or garota.get("nome"))
                 fail += 1
-    print(f"Concluído. Sucesso: {ok} | Fallbacks: {fail} | arquivo: {OUTPUT_FILE}")
+            output = {
+                "dialog": obj,
+                "garota": garota,
+                "cliente": cliente,
+                "meta": meta
+            }
+            out.write(json.dumps(output, ensure_ascii=False) + "\n")
+            out.flush()
+            manifest.write(json.dumps({"key": dialog_key(garota, cliente, meta), "status": status}, ensure_ascii=False) + "\n")
+            manifest.flush()
+            print(f"[{idx}] salvo (garota={garota['nome']} x cliente={cliente['nome']}, meta={meta})")
+    print(f"Concluído. Sucesso: {ok} | Fallbacks: {fail} | Pulados: {skipped} | arquivo: {OUTPUT_FILE}")
+    if STREAM_VALIDATE:
+        print(f"Streaming: abortados cedo: {_stream_stats['aborted']} "
+              f"({_stream_stats['chars_before_abort']} caracteres lidos antes de abortar) | "
+              f"parados no máximo de turnos: {_stream_stats['stopped_early']}")
+    metrics.REGISTRY.write_textfile(METRICS_FILE)
+    print(f"Métricas: {METRICS_FILE}")
 
 if __name__ == "__main__":
     generate_dialogs()
\ No newline at end of file
@@ -0,0 +1,265 @@
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app import metrics
+from app.ai_provider import ProviderClient, StreamStats
+from app.model_router import ModelRouter
+from app.persona import PersonaNotFound, get_store
+from app.provider_router import ProviderRouter, Route
+from app.services.chat_service import ChatService
+from app.services.intent_service import IntentAnalyzer
+from configs.config_loader import get_routing_config, settings_from_dict
+from scripts.mock_provider import MockConfig, MockProviderServer
+
+DIALOGS_FILE = PROJECT_ROOT / "data" / "dialogs" / "generated_dialogs.jsonl"
+ROUTE_MODELS = ("openai/gpt-4o", "meta-llama/llama-3-8b-instruct")  # (grande, pequeno) do mock com --route
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil por nearest-rank (q em 0..100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(q / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+class Recorder:
+    """Coleta latências e erros por caminho (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def ok(self, path: str, seconds: float):
+        with self._lock:
+            self.latencies.setdefault(path, []).append(seconds)
+
+    def error(self, path: str, exc: Exception):
+        name = type(exc).__name__
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+        key = f"{name}:{status}" if status else name
+        with self._lock:
+            bucket = self.errors.setdefault(path, {})
+            bucket[key] = bucket.get(key, 0) + 1
+
+
+def load_conversations(path: Path = DIALOGS_FILE) -> List[Dict[str, Any]]:
+    """Turnos do cliente + persona de cada diálogo gerado."""
+    conversations = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            turns = [m["content"] for m in record["dialog"]["messages"] if m.get("role") in ("human", "user")]
+            if turns:
+                conversations.append({"persona_id": (record.get("garota") or {}).get("id"), "turns": turns})
+    if not conversations:
+        raise ValueError(f"Nenhuma conversa em {path}")
+    return conversations
+
+
+def run_conversation(conv: Dict[str, Any], client: ProviderClient, paths: List[str], stream: bool,
+                     fast_path: bool, recorder: Recorder, router: Optional[ModelRouter] = None):
+    chat = ChatService(conv["persona_id"], client=client, router=router)
+    analyzer = IntentAnalyzer(conv["persona_id"], client=client, fast_path=fast_path, router=router)
+    known: Dict[str, str] = {}
+    for message in conv["turns"]:
+        reply = "ok"
+        if "reply" in paths:
+            start = time.perf_counter()
+            try:
+                if stream:
+                    stats = StreamStats()
+                    reply = " ".join(chat.reply_stream(message, stats, intents=known))
+                    if stats.ttft is not None:
+                        recorder.ok("reply_ttft", stats.ttft)
+                else:
+                    reply = chat.reply(message, intents=known)
+                recorder.ok("reply", time.perf_counter() - start)
+            except Exception as e:
+                recorder.error("reply", e)
+        if "intent" in paths:
+            start = time.perf_counter()
+            try:
+                fields = analyzer.analyze(message).get("intents") or {}
+                known.update({k: v for k, v in fields.items() if v})
+                recorder.ok("intent", time.perf_counter() - start)
+            except Exception as e:
+                recorder.error("intent", e)
+        chat.record(message, reply)
+
+
+def run_load_test(client: ProviderClient, conversations: int, concurrency: int, paths: List[str],
+                  stream: bool = False, fast_path: bool = True,
+                  dialogs_file: Path = DIALOGS_FILE, router: Optional[ModelRouter] = None) -> Dict[str, Any]:
+    store = get_store()
+    source = load_conversations(dialogs_file)
+    for conv in source:
+        try:
+            store.get(conv["persona_id"])
+        except PersonaNotFound:
+            conv["persona_id"] = store.ids()[0]
+    plan = [source[i % len(source)] for i in range(conversations)]
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda c: run_conversation(c, client, paths, stream, fast_path, recorder, router), plan))
+    wall = time.perf_counter() - started
+
+    messages = sum(len(c["turns"]) for c in plan)
+    return {
+        "conversations": conversations,
+        "concurrency": concurrency,
+        "messages": messages,
+        "wall_s": wall,
+        "throughput_msgs_s": messages / wall if wall else None,
+        "latency_s": {path: summarize(values) for path, values in recorder.latencies.items()},
+        "errors": recorder.errors,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"Conversas: {report['conversations']} | concorrência: {report['concurrency']} | "
+          f"mensagens: {report['messages']} | tempo: {report['wall_s']:.2f}s | "
+          f"throughput: {report['throughput_msgs_s']:.1f} msg/s")
+    for path, s in sorted(report["latency_s"].items()):
+        if not s["n"]:
+            continue
+        print(f"  {path:<11} n={s['n']:<5} p50={s['p50'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms "
+              f"p99={s['p99'] * 1000:.0f}ms max={s['max'] * 1000:.0f}ms")
+    for path, errs in report["errors"].items():
+        print(f"  erros {path}: {errs}")
+    if report.get("mock"):
+        print(f"  mock: {report['mock']}")
+    router = report.get("router")
+    if router:
+        saved = router.get("saved_s")
+        print(f"  roteador: {router['requests']} req | hedges {router['hedges']} ({(router['hedge_rate'] or 0) * 100:.1f}%) "
+              f"| hedge venceu {router['hedge_wins']} | failovers {router['failovers']} | canceladas {router['cancelled']} "
+              f"| vitórias {router['wins']}")
+        if saved:
+            print(f"  economia do hedge: p50={saved['p50'] * 1000:.0f}ms máx={saved['max'] * 1000:.0f}ms "
+                  f"total={saved['total']:.1f}s em {saved['n']} requisições")
+        for name, r in router["routes"].items():
+            print(f"  rota {name}: circuito {r['breaker']} (aberto {r['opens']}x)")
+    routing = report.get("routing")
+    if routing:
+        print(f"  modelos: grande em {(routing['large_share'] or 0) * 100:.0f}% das chamadas | custo US$ "
+              f"{routing['cost_usd']:.4f} (tudo no grande: US$ {routing['cost_all_large_usd']:.4f}) | "
+              f"motivos {routing['reasons']}")
+        for r in routing["routes"]:
+            p50 = f"{r['latency_p50_s'] * 1000:.0f}ms" if r["latency_p50_s"] is not None else "-"
+            p95 = f"{r['latency_p95_s'] * 1000:.0f}ms" if r["latency_p95_s"] is not None else "-"
+            print(f"  {r['operation']} -> {r['model']}: n={r['count']} p50={p50} p95={p95} "
+                  f"tokens {r['tokens_in']}/{r['tokens_out']} US$ {r['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga dos caminhos de resposta (IA 1) e intents (IA 2).")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--paths", default="reply,intent", help="reply,intent")
+    parser.add_argument("--stream", action="store_true", help="respostas em streaming (mede TTFT)")
+    parser.add_argument("--no-fast-path", action="store_true", help="manda toda mensagem de intent pro LLM")
+    parser.add_argument("--dialogs", type=Path, default=DIALOGS_FILE)
+    parser.add_argument("--url", default=None, help="endpoint externo em vez do mock local")
+    parser.add_argument("--latency", default="lognormal:0.3:0.5", help="distribuição do mock (ver mock_provider)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--reply-tokens", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--hedge", action="store_true",
+                        help="dois mocks atrás do ProviderRouter (hedge + failover); --error-rate vale só pro primário")
+    parser.add_argument("--secondary-latency", default=None, help="latência do mock secundário (padrão: a mesma)")
+    parser.add_argument("--hedge-percentile", type=float, default=95.0)
+    parser.add_argument("--measure-losers", action="store_true", help="deixa a perdedora terminar pra medir a economia")
+    parser.add_argument("--route", action="store_true",
+                        help="roteador de modelos: turnos rotineiros no pequeno, complexos no grande")
+    parser.add_argument("--small-speed", type=float, default=0.4,
+                        help="fator de latência/tempo por token do modelo pequeno no mock (com --route)")
+    parser.add_argument("--json", type=Path, default=None, help="grava o relatório em JSON")
+    parser.add_argument("--metrics-file", type=Path, default=None, help="grava as métricas (formato Prometheus) no fim")
+    parser.add_argument("--metrics-port", type=int, default=None, help="expõe GET /metrics durante o teste")
+    parser.add_argument("--trace", type=Path, default=None, help="grava os spans das chamadas em JSONL")
+    args = parser.parse_args()
+    if args.metrics_port:
+        metrics.REGISTRY.serve(args.metrics_port)
+        print(f"Métricas em http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.trace:
+        metrics.TRACER.enable(args.trace)
+
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    servers = []
+    pool_size = max(10, args.concurrency * 2)
+    if args.url:
+        settings = settings_from_dict("bench", {"api_key": "bench", "endpoint": args.url, "model": "bench/model"})
+    else:
+        large, small = ROUTE_MODELS
+        config = MockConfig(args.latency, args.error_rate, tokens_per_sec=args.tokens_per_sec,
+                            reply_tokens=args.reply_tokens, seed=args.seed,
+                            model_speed={small: args.small_speed} if args.route else None)
+        servers.append(MockProviderServer(config).start())
+        settings = servers[0].settings(large, small) if args.route else servers[0].settings()
+    client = ProviderClient(settings=settings, pool_size=pool_size)
+    if args.hedge:
+        secondary = MockConfig(args.secondary_latency or args.latency, tokens_per_sec=args.tokens_per_sec,
+                               reply_tokens=args.reply_tokens,
+                               seed=None if args.seed is None else args.seed + 1)
+        servers.append(MockProviderServer(secondary).start())
+        backup = ProviderClient(settings=servers[-1].settings(model="mock/backup"), pool_size=pool_size)
+        client = ProviderRouter([Route(client, name="primario"), Route(backup, name="secundario")],
+                                hedge_percentile=args.hedge_percentile, measure_losers=args.measure_losers,
+                                workers=args.concurrency * 4)
+    model_router = ModelRouter.from_client(client, get_routing_config()) if args.route else None
+    try:
+        report = run_load_test(client, args.conversations, args.concurrency, paths, args.stream,
+                               not args.no_fast_path, args.dialogs, model_router)
+        if model_router is not None:
+            report["routing"] = model_router.report()
+        if servers:
+            report["mock"] = [server.counters for server in servers]
+        if isinstance(client, ProviderRouter):
+            report["router"] = client.report()
+    finally:
+        client.close()
+        for server in servers:
+            server.stop()
+        metrics.TRACER.close()
+    print_report(report)
+    if args.metrics_file:
+        metrics.REGISTRY.write_textfile(args.metrics_file)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from configs.config_loader import ProviderSettings, settings_from_dict
+
+WORDS = (
+    "oi amor tudo bem sim atendo hoje à noite em Pinheiros no motel ou no meu apê "
+    "o valor é quatrocentos e cinquenta a hora aceito Pix ou dinheiro me avisa o horário "
+    "que eu confirmo com você beijo delícia fica tranquilo sou bem discreta"
+).split()
+
+
+class LatencyModel:
+    """
+    Distribuição do tempo até o primeiro token, no formato "tipo:param1:param2":
+      fixed:0.3 | uniform:0.1:0.8 | exponential:0.4 (média) | lognormal:0.3:0.5 (mediana, sigma)
+    """
+
+    def __init__(self, spec: str = "lognormal:0.3:0.5", seed: Optional[int] = None):
+        parts = spec.split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        if self.kind not in ("fixed", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Distribuição de latência desconhecida: {self.kind}")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(self.params[0], self.params[1])
+            if self.kind == "exponential":
+                return self._rng.expovariate(1.0 / self.params[0])
+            return self._rng.lognormvariate(math.log(self.params[0]), self.params[1])
+
+    def chance(self, p: float) -> bool:
+        with self._lock:
+            return self._rng.random() < p
+
+    def choice(self, options):
+        with self._lock:
+            return self._rng.choice(options)
+
+
+class MockConfig:
+    def __init__(self, latency: str = "lognormal:0.3:0.5", error_rate: float = 0.0,
+                 error_statuses: Tuple[int, ...] = (500, 429), tokens_per_sec: float = 60.0,
+                 reply_tokens: int = 30, seed: Optional[int] = None,
+                 model_speed: Optional[Dict[str, float]] = None):
+        self.latency = LatencyModel(latency, seed)
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        # fator por modelo sobre latência e tempo por token (ex.: {"meta-llama/llama-3-8b-instruct": 0.4})
+        self.model_speed = model_speed or {}
+
+
+def fake_content(payload: Dict[str, Any], n_tokens: int) -> str:
+    """Resposta plausível conforme o tipo de pedido (intents, geração de diálogo ou resposta)."""
+    system = " ".join(m.get("content", "") for m in payload.get("messages", []) if m.get("role") == "system")
+    if "analisa lotes" in system:
+        items = json.loads(payload["messages"][-1]["content"])
+        return json.dumps([{"id": item["id"], "intents": {"local": "", "data": "hoje à noite", "pagamento": "Pix",
+                                                          "fora_do_perfil": ""}} for item in items], ensure_ascii=False)
+    if "analisa mensagens" in system:
+        return json.dumps({"intents": {"local": "", "data": "hoje à noite", "pagamento": "Pix", "fora_do_perfil": ""}},
+                          ensure_ascii=False)
+    if "GERA diálogos" in system:
+        msgs = [{"role": "human" if i % 2 == 0 else "assistant", "content": " ".join(WORDS[i:i + 8])}
+                for i in range(8)]
+        return json.dumps({"messages": msgs}, ensure_ascii=False)
+    words = [WORDS[i % len(WORDS)] for i in range(n_tokens)]
+    return " ".join(words[:n_tokens // 2]) + ". " + " ".join(words[n_tokens // 2:]) + "."
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como os providers reais
+    server: "_MockHTTPServer"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        cfg = self.server.mock_config
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count("requests")
+        model = payload.get("model", "mock/model")
+        speed = cfg.model_speed.get(model, 1.0)
+        if cfg.model_speed:
+            self.server.count(f"model:{model}")
+
+        delay = cfg.latency.sample() * speed
+        if cfg.error_rate and cfg.latency.chance(cfg.error_rate):
+            time.sleep(delay)
+            status = cfg.latency.choice(cfg.error_statuses)
+            self.server.count(f"status_{status}")
+            self._send_json(status, {"error": {"message": "erro simulado", "code": status}})
+            return
+
+        n_tokens = min(int(payload.get("max_tokens") or cfg.reply_tokens), cfg.reply_tokens)
+        content = fake_content(payload, n_tokens)
+        per_token = speed / cfg.tokens_per_sec if cfg.tokens_per_sec > 0 else 0.0
+        pieces = content.split(" ")
+        usage = {"prompt_tokens": sum(len(m.get("content", "")) // 4 for m in payload.get("messages", [])),
+                 "completion_tokens": len(pieces)}
+
+        if not payload.get("stream"):
+            time.sleep(delay + per_token * len(pieces))
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+        # como os providers reais: cabeçalhos na hora, o tempo até o primeiro token vem no corpo
+        time.sleep(delay)
+
+        def emit(obj):
+            data = f"data: {obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(per_token)
+            text = piece if i == 0 else " " + piece
+            emit({"id": "mock", "model": model, "choices": [{"index": 0, "delta": {"content": text}}]})
+        emit({"id": "mock", "model": model, "choices": [], "usage": usage})
+        emit("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # backlog padrão (5) recusa conexões com muitas conversas simultâneas
+
+    def __init__(self, addr, mock_config: MockConfig):
+        super().__init__(addr, _Handler)
+        self.mock_config = mock_config
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def handle_error(self, request, client_address):
+        # cliente fechando conexão keep-alive ao terminar não é erro do teste
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockProviderServer:
+    """Servidor chat-completions (OpenAI-compatible) local, com latência/erros/taxa de tokens configuráveis."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self._server = _MockHTTPServer((host, port), self.config)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return dict(self._server.counters)
+
+    def settings(self, model: str = "mock/model", small_model: Optional[str] = None) -> ProviderSettings:
+        """small_model: vira o default_model_ia2 (o model vale pra IA 1 e, sem ele, pras duas)."""
+        block = {"api_key": "mock", "endpoint": self.url, "model": model}
+        if small_model:
+            block.update({"default_model_ia1": model, "default_model_ia2": small_model})
+        return settings_from_dict("mock", block)
+
+    def start(self) -> "MockProviderServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockProviderServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor mock OpenAI-compatible para testes de carga.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="lognormal:0.3:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--reply-tokens", type=int, default=30)
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.error_rate, tokens_per_sec=args.tokens_per_sec,
+                        reply_tokens=args.reply_tokens)
+    server = MockProviderServer(config, port=args.port)
+    print(f"Mock ouvindo em {server.url} (Ctrl+C pra sair)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+import sys
+import re
+import json
+import math
+import mmap
+import time
+import random
+import struct
+import zlib
+import hashlib
+import argparse
+from array import array
+from bisect import bisect_left, insort
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import yaml
+
+try:
+    import tiktoken
+except ImportError:  # sem tiktoken: estimativa por pedaços de palavra
+    tiktoken = None
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+ARCHITECTURE_FILE = PROJECT_ROOT / "configs" / "architecture.yaml"
+SPLITS = ("train_mix", "val_mix")  # saídas do prepare_dataset.py
+TEMPLATE = "chatml-v1"  # entra na chave do cache: mudou o formato renderizado, retokeniza
+LABEL_BIT = 1 << 31  # bit alto do token no cache: entra na loss (resposta da assistente)
+TOKEN_MASK = LABEL_BIT - 1
+IGNORE_INDEX = -100
+SEED = 251
+
+_INDEX = struct.Struct("<20sQI")  # hash do conteúdo, offset (em tokens), comprimento
+
+
+def load_architecture() -> Dict[str, Any]:
+    with open(ARCHITECTURE_FILE, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+class ApproxTokenizer:
+    """
+    Só pra medir sem o modelo no disco: BPE do tiktoken (o200k) se instalado, senão pedaços de
+    até 4 letras (~3.5 caracteres por token em português, mesma conta do context_window).
+    Os ids não batem com o Qwen; contagens e padding ficam na mesma ordem de grandeza.
+    """
+
+    PIECE = re.compile(r" ?[^\W\d_]{1,4}| ?\d{1,3}| ?[^\w\s]+|\s+")
+    VOCAB = 150000
+
+    def __init__(self):
+        self.enc = tiktoken.get_encoding("o200k_base") if tiktoken is not None else None
+        vocab = self.enc.n_vocab if self.enc is not None else self.VOCAB
+        self.specials = {"<|im_start|>": vocab, "<|im_end|>": vocab + 1, "<|endoftext|>": vocab + 2}
+        self.pad_id = vocab + 2
+        self.fingerprint = "approx-o200k" if self.enc is not None else "approx-chunks-v1"
+
+    def encode(self, text: str) -> List[int]:
+        if self.enc is not None:
+            return self.enc.encode_ordinary(text)
+        return [zlib.crc32(p.encode("utf-8")) % self.VOCAB for p in self.PIECE.findall(text)]
+
+    def special(self, token: str) -> int:
+        return self.specials[token]
+
+
+class HFTokenizer:
+    """Tokenizer do modelo base (Qwen2.5), com os tokens extras de architecture.yaml."""
+
+    def __init__(self, path: str, extra_special_tokens: Optional[List[str]] = None):
+        try:
+            from transformers import AutoTokenizer  # opcional
+        except ImportError as e:
+            raise RuntimeError("Pacote 'transformers' não instalado; use --tokenizer approx pra medir sem o modelo.") from e
+        self.tok = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+        if extra_special_tokens:
+            self.tok.add_special_tokens({"additional_special_tokens": list(extra_special_tokens)},
+                                        replace_additional_special_tokens=False)
+        self.pad_id = self.tok.pad_token_id if self.tok.pad_token_id is not None else self.tok.eos_token_id
+        # vocabulário inteiro no hash: trocar de tokenizer invalida o cache sozinho
+        vocab = json.dumps(sorted(self.tok.get_vocab().items()), ensure_ascii=False)
+        self.fingerprint = "hf-" + hashlib.sha1(vocab.encode("utf-8")).hexdigest()[:16]
+
+    def encode(self, text: str) -> List[int]:
+        return self.tok.encode(text, add_special_tokens=False)
+
+    def special(self, token: str) -> int:
+        return self.tok.convert_tokens_to_ids(token)
+
+
+def get_tokenizer(name: Optional[str], arch: Dict[str, Any]):
+    if name == "approx":
+        return ApproxTokenizer()
+    model = arch.get("model", {})
+    return HFTokenizer(name or model["base"], model.get("tokenizer_extra_special_tokens"))
+
+
+def encode_dialog(tok, record: Dict[str, Any], default_system: Optional[str]) -> array:
+    """
+    Renderiza no ChatML do Qwen e marca com LABEL_BIT só o texto da assistente + <|im_end|>
+    (cabeçalhos, system e falas do cliente ficam fora da loss).
+    """
+    start, end = tok.special("<|im_start|>"), tok.special("<|im_end|>")
+    newline = tok.encode("\n")
+    out = array("I")
+    system = record.get("system") or default_system
+    if system:
+        out.extend([start] + tok.encode("system\n" + system) + [end] + newline)
+    for t in record["messages"]:
+        if t["from"] == "assistant":
+            out.extend([start] + tok.encode("assistant\n"))
+            out.extend(i | LABEL_BIT for i in tok.encode(t["value"]) + [end])
+            out.extend(newline)
+        else:
+            out.extend([start] + tok.encode("user\n" + t["value"]) + [end] + newline)
+    return out
+
+
+def content_key(record: Dict[str, Any], fingerprint: str, default_system: Optional[str] = None) -> bytes:
+    # system efetivo (o mesmo que encode_dialog usa): trocar o prompt padrão retokeniza
+    system = record.get("system") or default_system
+    canonical = json.dumps({"system": system, "messages": record["messages"]}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(f"{fingerprint}|{TEMPLATE}|{canonical}".encode("utf-8")).digest()
+
+
+class TokenCache:
+    """
+    Diálogos tokenizados uma vez só: tokens.bin (uint32, bit alto = entra na loss) + index.bin
+    (hash do conteúdo -> offset/comprimento, registros de tamanho fixo). Só acrescenta; a leitura
+    é por mmap, sem carregar o arquivo. O hash inclui o tokenizer, então vários convivem.
+    readonly=True (treino, workers do dataloader): só lê o que está consistente, sem truncar nada.
+    """
+
+    def __init__(self, directory: Path, readonly: bool = False):
+        self.dir = Path(directory)
+        self.readonly = readonly
+        self.tokens_path = self.dir / "tokens.bin"
+        self.index_path = self.dir / "index.bin"
+        self.entries: List[Tuple[int, int]] = []
+        self.by_key: Dict[bytes, int] = {}
+        self.end = 0  # total de tokens válidos
+        self.hits = 0
+        self.misses = 0
+        self._tokens = self._index = None
+        if not readonly:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self.tokens_path.touch()
+            self.index_path.touch()
+        self._load()
+        if not readonly:
+            self._tokens = open(self.tokens_path, "ab")
+            self._index = open(self.index_path, "ab")
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+
+    def _load(self):
+        data = self.index_path.read_bytes()
+        token_bytes = self.tokens_path.stat().st_size
+        for i in range(len(data) // _INDEX.size):
+            key, offset, length = _INDEX.unpack_from(data, i * _INDEX.size)
+            if (offset + length) * 4 > token_bytes:  # queda entre gravar tokens e índice
+                break
+            self.by_key[key] = len(self.entries)
+            self.entries.append((offset, length))
+            self.end = offset + length
+        if self.readonly:
+            return
+        # descarta rabo incompleto de uma gravação interrompida
+        with open(self.index_path, "r+b") as f:
+            f.truncate(len(self.entries) * _INDEX.size)
+        with open(self.tokens_path, "r+b") as f:
+            f.truncate(self.end * 4)
+
+    def lookup(self, key: bytes) -> Optional[int]:
+        entry = self.by_key.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def add(self, key: bytes, ids: array) -> int:
+        if self.readonly:
+            raise RuntimeError("TokenCache aberto só pra leitura.")
+        self._tokens.write(ids.tobytes())
+        self._index.write(_INDEX.pack(key, self.end, len(ids)))
+        entry = len(self.entries)
+        self.by_key[key] = entry
+        self.entries.append((self.end, len(ids)))
+        self.end += len(ids)
+        return entry
+
+    def length(self, entry: int) -> int:
+        return self.entries[entry][1]
+
+    def _ensure_view(self):
+        if self._view is not None and len(self._view) >= self.end:
+            return
+        if not self.readonly:
+            self._tokens.flush()
+            self._index.flush()
+        self._release()
+        with open(self.tokens_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)[:self.end * 4].cast("I")  # ignora rabo de gravação em andamento
+
+    def get(self, entry: int, limit: Optional[int] = None) -> List[int]:
+        """Tokens do diálogo (com o bit de loss); `limit` trunca sem copiar o resto."""
+        offset, length = self.entries[entry]
+        if not length:
+            return []
+        self._ensure_view()
+        return self._view[offset:offset + min(length, limit or length)].tolist()
+
+    def _release(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def close(self):
+        self._release()
+        if not self.readonly:
+            self._tokens.close()
+            self._index.close()
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def tokenize_split(cache: TokenCache, tok, path: Path, default_system: Optional[str]) -> Tuple[List[int], float]:
+    """Uma entrada do cache por ocorrência (a mistura ponderada repete diálogos; tokeniza uma vez só)."""
+    entries = []
+    spent = 0.0
+    for record in read_records(path):
+        key = content_key(record, tok.fingerprint, default_system)
+        entry = cache.lookup(key)
+        if entry is None:
+            started = time.perf_counter()
+            entry = cache.add(key, encode_dialog(tok, record, default_system))
+            spent += time.perf_counter() - started
+        entries.append(entry)
+    return entries, spent
+
+
+def pack_best_fit(lengths: List[int], capacity: int) -> List[List[int]]:
+    """Best-fit decreasing: do maior pro menor, cada diálogo vai pro pack com menor sobra em que cabe."""
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    packs: List[List[int]] = []
+    free: List[Tuple[int, int]] = []  # (espaço livre, pack), ordenado
+    for i in order:
+        pos = bisect_left(free, (lengths[i], -1))
+        if pos < len(free):
+            room, p = free.pop(pos)
+        else:
+            room, p = capacity, len(packs)
+            packs.append([])
+        packs[p].append(i)
+        room -= lengths[i]
+        if room > 0:
+            insort(free, (room, p))
+    return packs
+
+
+def pack_none(lengths: List[int], capacity: int) -> List[List[int]]:
+    """Sem packing (training.packing.enabled: false): um diálogo por sequência."""
+    return [[i] for i in range(len(lengths))]
+
+
+STRATEGIES = {"best_fit_decreasing": pack_best_fit, "none": pack_none}
+
+
+def batch_slots(lengths: List[int], batch_size: int) -> int:
+    """Posições processadas com padding dinâmico (cada lote completa até o maior do lote)."""
+    return sum(max(lengths[i:i + batch_size]) * len(lengths[i:i + batch_size])
+               for i in range(0, len(lengths), batch_size))
+
+
+def padding_report(lengths: List[int], packs: List[List[int]], capacity: int, batch_size: int,
+                   grad_accum: int) -> Dict[str, Any]:
+    real = sum(lengths)
+    pack_lengths = [sum(lengths[i] for i in p) for p in packs]
+    per_step = batch_size * grad_accum
+    ratio = lambda slots: real / slots if slots else None
+    return {
+        "sequences": len(lengths),
+        "packs": len(packs),
+        "tokens": real,
+        "efficiency_unpacked_fixed": ratio(len(lengths) * capacity),
+        "efficiency_unpacked_dynamic": ratio(batch_slots(lengths, batch_size)),
+        "efficiency_packed": ratio(len(packs) * capacity),
+        "efficiency_packed_dynamic": ratio(batch_slots(pack_lengths, batch_size)),
+        "steps_per_epoch_unpacked": math.ceil(len(lengths) / per_step),
+        "steps_per_epoch_packed": math.ceil(len(packs) / per_step),
+    }
+
+
+def write_packs(out_dir: Path, split: str, packs: List[List[int]], entries: List[int], meta: Dict[str, Any]):
+    """{split}.packs.bin: ids do cache em sequência; {split}.packs.idx: onde começa cada pack."""
+    members = array("I")
+    offsets = array("Q", [0])
+    for p in packs:
+        members.extend(entries[i] for i in p)
+        offsets.append(len(members))
+    (out_dir / f"{split}.packs.bin").write_bytes(members.tobytes())
+    (out_dir / f"{split}.packs.idx").write_bytes(offsets.tobytes())
+    with open(out_dir / f"{split}.packs.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+class PackedDataset:
+    """
+    Leitura dos packs no treino: input_ids, labels (-100 fora das respostas) e position_ids.
+    Com attention_isolation (padrão), position_ids reiniciam a cada diálogo, pra atenção não
+    vazar entre diálogos (flash-attn varlen / neat_packing); sem, seguem contínuos no pack.
+    Sem padding: o collator completa até o maior do lote. O cache é aberto só pra leitura.
+    """
+
+    def __init__(self, directory: Path, split: str):
+        self.dir = Path(directory)
+        with open(self.dir / f"{split}.packs.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.max_seq_len = self.meta["max_seq_len"]
+        self.attention_isolation = self.meta.get("attention_isolation", True)
+        self.members = array("I")
+        self.members.frombytes((self.dir / f"{split}.packs.bin").read_bytes())
+        self.offsets = array("Q")
+        self.offsets.frombytes((self.dir / f"{split}.packs.idx").read_bytes())
+        self.cache = TokenCache(self.dir, readonly=True)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Dict[str, List[int]]:
+        input_ids: List[int] = []
+        labels: List[int] = []
+        position_ids: List[int] = []
+        for entry in self.members[self.offsets[i]:self.offsets[i + 1]]:
+            tokens = self.cache.get(entry, self.max_seq_len)
+            for t in tokens:
+                input_ids.append(t & TOKEN_MASK)
+                labels.append(t & TOKEN_MASK if t & LABEL_BIT else IGNORE_INDEX)
+            first = 0 if self.attention_isolation else len(position_ids)
+            position_ids.extend(range(first, first + len(tokens)))
+        return {"input_ids": input_ids, "labels": labels, "position_ids": position_ids}
+
+    def close(self):
+        self.cache.close()
+
+
+def pack_split(cache: TokenCache, tok, split: str, path: Path, default_system: Optional[str], capacity: int,
+               batch_size: int, grad_accum: int, seed: int, strategy: str = "best_fit_decreasing",
+               attention_isolation: bool = True) -> Dict[str, Any]:
+    hits, misses = cache.hits, cache.misses
+    started = time.perf_counter()
+    entries, tokenize_s = tokenize_split(cache, tok, path, default_system)
+    lengths = [min(cache.length(e), capacity) for e in entries]
+    trained = sum(sum(1 for t in cache.get(e, capacity) if t & LABEL_BIT) for e in set(entries))
+    packs = STRATEGIES[strategy](lengths, capacity)
+    random.Random(seed).shuffle(packs)  # BFD agrupa os longos; o treino não deve ver isso em ordem
+    report = padding_report(lengths, packs, capacity, batch_size, grad_accum)
+    report.update({
+        "split": split,
+        "source": str(path),
+        "strategy": strategy,
+        "unique_dialogs": len(set(entries)),
+        "trained_share": trained / sum(cache.length(e) for e in set(entries)) if entries else None,
+        "truncated": sum(1 for e in entries if cache.length(e) > capacity),
+        "cache_hits": cache.hits - hits,
+        "cache_misses": cache.misses - misses,
+        "tokenize_s": tokenize_s,
+        "elapsed_s": time.perf_counter() - started,
+    })
+    meta = {"max_seq_len": capacity, "tokenizer": tok.fingerprint, "pad_id": tok.pad_id, "template": TEMPLATE,
+            "strategy": strategy, "attention_isolation": attention_isolation, "report": report}
+    write_packs(cache.dir, split, packs, entries, meta)
+    return report
+
+
+def print_report(r: Dict[str, Any], capacity: int, batch_size: int, grad_accum: int):
+    pct = lambda v: f"{v * 100:.1f}%" if v is not None else "-"
+    print(f"[{r['split']}] {r['sequences']} diálogos ({r['unique_dialogs']} distintos) | {r['tokens']} tokens "
+          f"({pct(r['trained_share'])} na loss) | truncados: {r['truncated']}")
+    print(f"  cache: {r['cache_hits']} reaproveitados, {r['cache_misses']} tokenizados em {r['tokenize_s']:.2f}s "
+          f"| total {r['elapsed_s']:.2f}s")
+    print(f"  tokens úteis: padding até {capacity}: {pct(r['efficiency_unpacked_fixed'])} | "
+          f"padding dinâmico (lote {batch_size}): {pct(r['efficiency_unpacked_dynamic'])} | "
+          f"{r['strategy']}: {pct(r['efficiency_packed'])} ({r['packs']} sequências)")
+    print(f"  sequências/época: {r['sequences']} -> {r['packs']} | passos/época (lote {batch_size} x acum "
+          f"{grad_accum}): {r['steps_per_epoch_unpacked']} -> {r['steps_per_epoch_packed']}")
+
+
+def main():
+    arch = load_architecture()
+    batch = arch.get("training", {}).get("batch", {})
+    packing = arch.get("training", {}).get("packing", {})
+    processed_dir = PROJECT_ROOT / arch["data"]["processed_dir"]
+
+    parser = argparse.ArgumentParser(description="Tokeniza uma vez (cache mmap) e empacota os diálogos do SFT.")
+    parser.add_argument("--splits", nargs="+", default=list(SPLITS), help="arquivos <split>.jsonl em processed_dir")
+    parser.add_argument("--tokenizer", default=None, help="caminho/nome HF (padrão: model.base) ou 'approx' (sem o modelo)")
+    parser.add_argument("--max-seq-len", type=int, default=batch.get("max_seq_len", 2048))
+    parser.add_argument("--cache-dir", type=Path, default=PROJECT_ROOT / packing.get("cache_dir", "data/processed/tokens"))
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default=None,
+                        help="padrão: training.packing.strategy ('none' se packing.enabled for false)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--json", type=Path, default=None, help="grava o relatório em JSON")
+    args = parser.parse_args()
+
+    strategy = args.strategy or (packing.get("strategy", "best_fit_decreasing")
+                                 if packing.get("enabled", True) else "none")
+    if strategy not in STRATEGIES:
+        raise ValueError(f"training.packing.strategy desconhecida: {strategy} (use {', '.join(sorted(STRATEGIES))})")
+    attention_isolation = bool(packing.get("attention_isolation", True))
+    tok = get_tokenizer(args.tokenizer, arch)
+    default_system = " ".join((arch.get("inference", {}).get("system_prompt") or "").split()) or None
+    batch_size, grad_accum = batch.get("per_device_train", 1), batch.get("grad_accum", 1)
+    cache = TokenCache(args.cache_dir)
+    reports = []
+    try:
+        for split in args.splits:
+            path = processed_dir / f"{split}.jsonl"
+            if not path.exists():
+                print(f"[{split}] {path} não encontrado; rode scripts/prepare_dataset.py antes.")
+                continue
+            report = pack_split(cache, tok, split, path, default_system, args.max_seq_len, batch_size,
+                                grad_accum, args.seed, strategy, attention_isolation)
+            print_report(report, args.max_seq_len, batch_size, grad_accum)
+            reports.append(report)
+    finally:
+        cache.close()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
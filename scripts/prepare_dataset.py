@@ -0,0 +1,307 @@
+import sys
+import json
+import hashlib
+import argparse
+import unicodedata
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import yaml
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+ARCHITECTURE_FILE = PROJECT_ROOT / "configs" / "architecture.yaml"
+
+# Fonte bruta de cada dataset declarado em architecture.yaml (data.datasets[].name)
+# with_profile: injeta o perfil da garota no campo "system" entre <seller_profile> ... </seller_profile>
+SOURCES = {
+    "dialogs_style": {"path": "data/raw/dialogs_style.jsonl", "with_profile": False},
+    "dialogs_style_with_personality": {"path": "data/dialogs/generated_dialogs.jsonl", "with_profile": True},
+}
+
+WORKERS = 4  # processos de conversão/filtragem
+BATCH_LINES = 256  # linhas por tarefa enviada aos processos
+
+ROLE_MAP = {
+    "human": "human", "user": "human", "cliente": "human",
+    "assistant": "assistant", "gpt": "assistant", "garota": "assistant", "model": "assistant",
+    "system": "system",
+}
+
+# regras carregadas em cada processo (via initializer)
+_rules: Dict[str, Any] = {}
+
+
+def load_data_config() -> Dict[str, Any]:
+    with open(ARCHITECTURE_FILE, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)["data"]
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    lines = [" ".join(line.split()) for line in text.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def extract_turns(record: Dict[str, Any]) -> Optional[List[Dict[str, str]]]:
+    """Aceita role/content (gerador), from/value (sharegpt) e o envelope {"dialog": {...}}."""
+    if isinstance(record.get("dialog"), dict):
+        record = record["dialog"]
+    turns = record.get("messages") or record.get("conversations")
+    if not isinstance(turns, list):
+        return None
+    out = []
+    for t in turns:
+        if not isinstance(t, dict):
+            return None
+        role = t.get("role", t.get("from"))
+        content = t.get("content", t.get("value"))
+        if not isinstance(role, str) or not isinstance(content, str):
+            return None
+        out.append({"from": ROLE_MAP.get(role.strip().lower(), role.strip().lower()), "value": content})
+    return out
+
+
+def seller_profile(garota: Dict[str, Any]) -> str:
+    perfil = {
+        "nome": garota.get("nome"),
+        "idade": garota.get("idade"),
+        "bairro": (garota.get("localizacao") or {}).get("bairro"),
+        "descricao": (garota.get("personalidade") or {}).get("descricao"),
+        "tabus": (garota.get("personalidade") or {}).get("tabus"),
+        "locais_atendimento": (garota.get("localizacao") or {}).get("locais_atendimento"),
+        "formas_pagamento": (garota.get("profissional") or {}).get("formas_pagamento"),
+    }
+    perfil = {k: v for k, v in perfil.items() if v}
+    return "<seller_profile>" + json.dumps(perfil, ensure_ascii=False) + "</seller_profile>"
+
+
+def convert_record(record: Dict[str, Any], with_profile: bool) -> Tuple[Optional[Dict[str, Any]], str]:
+    """Converte + normaliza + aplica quality_rules. Devolve (registro, motivo)."""
+    turns = extract_turns(record)
+    if turns is None:
+        return None, "formato_invalido"
+
+    system = None
+    merged: List[Dict[str, str]] = []
+    for t in turns:
+        value = normalize_text(t["value"])
+        if t["from"] == "system":
+            system = value or system
+            continue
+        if not value:
+            continue
+        # turnos seguidos do mesmo papel viram um só
+        if merged and merged[-1]["from"] == t["from"]:
+            merged[-1]["value"] += "\n" + value
+        else:
+            merged.append({"from": t["from"], "value": value})
+    # o treino espera começar pelo cliente
+    while merged and merged[0]["from"] != "human":
+        merged.pop(0)
+
+    rules = _rules["quality_rules"]
+    roles_allowed = set(rules.get("roles_allowed", ["human", "assistant"]))
+    if any(t["from"] not in roles_allowed for t in merged):
+        return None, "papel_nao_permitido"
+    if len(merged) < rules.get("min_turns", 0):
+        return None, "poucos_turnos"
+    if len(merged) > rules.get("max_turns", 10 ** 9):
+        return None, "muitos_turnos"
+    blocked = rules.get("drop_if_contains", [])
+    if any(b in t["value"] for t in merged for b in blocked):
+        return None, "conteudo_bloqueado"
+
+    out: Dict[str, Any] = {"messages": merged}
+    if with_profile and isinstance(record.get("garota"), dict):
+        system = seller_profile(record["garota"])
+    if system:
+        out["system"] = system
+    return out, "ok"
+
+
+def split_bucket(record: Dict[str, Any]) -> float:
+    """Posição determinística em [0, 1) a partir do conteúdo (mesmo diálogo -> mesmo split)."""
+    canonical = json.dumps(record["messages"], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha1(canonical.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _init_worker(quality_rules: Dict[str, Any]):
+    _rules["quality_rules"] = quality_rules
+
+
+def _process_batch(args: Tuple[List[str], bool, float]) -> List[Tuple[Optional[str], str, str]]:
+    lines, with_profile, validation_split = args
+    results = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            results.append((None, "json_invalido", ""))
+            continue
+        out, reason = convert_record(record, with_profile)
+        if out is None:
+            results.append((None, reason, ""))
+            continue
+        split = "val" if split_bucket(out) < validation_split else "train"
+        results.append((json.dumps(out, ensure_ascii=False), reason, split))
+    return results
+
+
+def read_batches(path: Path, with_profile: bool, validation_split: float) -> Iterator[Tuple[List[str], bool, float]]:
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = list(islice(f, BATCH_LINES))
+            if not lines:
+                return
+            yield lines, with_profile, validation_split
+
+
+def processed_paths(dataset_path: Path) -> Dict[str, Path]:
+    stem = dataset_path.name[:-len(".jsonl")] if dataset_path.name.endswith(".jsonl") else dataset_path.stem
+    return {
+        "all": dataset_path,
+        "train": dataset_path.with_name(stem + ".train.jsonl"),
+        "val": dataset_path.with_name(stem + ".val.jsonl"),
+    }
+
+
+def process_dataset(pool: Pool, name: str, source: Path, dataset_path: Path, with_profile: bool,
+                    validation_split: float) -> Dict[str, Any]:
+    paths = processed_paths(dataset_path)
+    dataset_path.parent.mkdir(parents=True, exist_ok=True)
+    report: Dict[str, Any] = {"dataset": name, "source": str(source), "train": 0, "val": 0, "drops": {}}
+    with open(paths["all"], "w", encoding="utf-8") as f_all, \
+            open(paths["train"], "w", encoding="utf-8") as f_train, \
+            open(paths["val"], "w", encoding="utf-8") as f_val:
+        files = {"train": f_train, "val": f_val}
+        for results in pool.imap(_process_batch, read_batches(source, with_profile, validation_split)):
+            for line, reason, split in results:
+                if line is None:
+                    report["drops"][reason] = report["drops"].get(reason, 0) + 1
+                    continue
+                f_all.write(line + "\n")
+                files[split].write(line + "\n")
+                report[split] += 1
+    return report
+
+
+def repeats_for(index: int, count: int, target: int) -> int:
+    """Quantas vezes o registro `index` entra pra que `count` registros virem `target` (sub/superamostragem uniforme)."""
+    return (index + 1) * target // count - index * target // count
+
+
+def weighted_stream(path: Path, count: int, target: int) -> Iterator[str]:
+    """Relê o arquivo emitindo cada linha 0..n vezes, sem guardar nada em memória."""
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            for _ in range(repeats_for(i, count, target)):
+                yield line
+
+
+def mix_weighted(streams: Dict[str, Iterator[str]], weights: Dict[str, float], out_path: Path) -> int:
+    """Intercala os datasets por round-robin ponderado suave (ordem determinística)."""
+    current = {name: 0.0 for name in streams}
+    total_w = sum(weights[name] for name in streams)
+    written = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        while streams:
+            for name in streams:
+                current[name] += weights[name]
+            chosen = max(streams, key=lambda n: current[n])
+            current[chosen] -= total_w
+            line = next(streams[chosen], None)
+            if line is None:
+                del streams[chosen]
+                total_w -= weights[chosen]
+                del current[chosen]
+                continue
+            out.write(line)
+            written += 1
+    return written
+
+
+def write_dataset_info(processed_dir: Path, files: Dict[str, str]):
+    info = {
+        name: {
+            "file_name": file_name,
+            "formatting": "sharegpt",
+            "columns": {"messages": "messages", "system": "system"},
+            "tags": {"role_tag": "from", "content_tag": "value", "user_tag": "human", "assistant_tag": "assistant"},
+        }
+        for name, file_name in files.items()
+    }
+    with open(processed_dir / "dataset_info.json", "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+
+def prepare(workers: int = WORKERS):
+    cfg = load_data_config()
+    processed_dir = PROJECT_ROOT / cfg["processed_dir"]
+    for key in ("raw_dir", "interim_dir", "processed_dir"):
+        (PROJECT_ROOT / cfg[key]).mkdir(parents=True, exist_ok=True)
+    validation_split = float(cfg.get("validation_split", 0.0))
+    weights = cfg.get("sampling", {}).get("weights", {})
+
+    reports = []
+    with Pool(processes=max(1, workers), initializer=_init_worker, initargs=(cfg.get("quality_rules", {}),)) as pool:
+        for ds in cfg["datasets"]:
+            name = ds["name"]
+            if ds.get("format", "sharegpt") != "sharegpt":
+                print(f"[{name}] formato '{ds['format']}' não suportado; pulando.")
+                continue
+            source_cfg = SOURCES.get(name)
+            source = PROJECT_ROOT / source_cfg["path"] if source_cfg else None
+            if source is None or not source.exists():
+                print(f"[{name}] fonte bruta não encontrada ({source}); pulando.")
+                continue
+            report = process_dataset(pool, name, source, PROJECT_ROOT / ds["path"],
+                                     source_cfg["with_profile"], validation_split)
+            report["paths"] = processed_paths(PROJECT_ROOT / ds["path"])
+            reports.append(report)
+            print(f"[{name}] train: {report['train']} | val: {report['val']} | descartes: {report['drops']}")
+
+    if not reports:
+        print("Nenhum dataset processado.")
+        return
+
+    # mistura ponderada do treino: cada dataset vira weight * total registros
+    total_train = sum(r["train"] for r in reports)
+    active = [r for r in reports if r["train"] and weights.get(r["dataset"], 0) > 0]
+    w_sum = sum(weights[r["dataset"]] for r in active) or 1.0
+    streams, mix_weights = {}, {}
+    for r in active:
+        target = round(weights[r["dataset"]] / w_sum * total_train)
+        streams[r["dataset"]] = weighted_stream(r["paths"]["train"], r["train"], target)
+        mix_weights[r["dataset"]] = weights[r["dataset"]]
+    train_mix = processed_dir / "train_mix.jsonl"
+    n_train = mix_weighted(streams, mix_weights, train_mix)
+
+    # validação: concatenação simples (sem reamostrar)
+    val_mix = processed_dir / "val_mix.jsonl"
+    n_val = 0
+    with open(val_mix, "w", encoding="utf-8") as out:
+        for r in reports:
+            with open(r["paths"]["val"], "r", encoding="utf-8") as f:
+                for line in f:
+                    out.write(line)
+                    n_val += 1
+
+    write_dataset_info(processed_dir, {"train_mix": train_mix.name, "val_mix": val_mix.name})
+    print(f"Concluído. train_mix: {n_train} | val_mix: {n_val} | pasta: {processed_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prepara os datasets sharegpt definidos em architecture.yaml")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    prepare(args.workers)
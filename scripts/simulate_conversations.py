@@ -0,0 +1,198 @@
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app.ai_provider import ProviderClient, get_client
+from app.persona import PersonaNotFound, PersonaStore, get_store
+from app.services.conversation import Conversation
+from app.services.intent_batcher import IntentBatcher
+from app.services.orchestrator import MessageOrchestrator
+from scripts.load_test import DIALOGS_FILE, Recorder, load_conversations, summarize
+from scripts.mock_provider import LatencyModel, MockConfig, MockProviderServer
+
+
+def persona_script(garota: Dict[str, Any], rng: random.Random) -> List[str]:
+    """Roteiro sintético de cliente: saudação, preço, local, data, pagamento e confirmação."""
+    loc = garota.get("localizacao", {})
+    prof = garota.get("profissional", {})
+    locais = loc.get("locais_atendimento") or [loc.get("bairro", "centro")]
+    pagamentos = prof.get("formas_pagamento") or ["Pix"]
+    return [
+        rng.choice(["oi", "oi, tudo bem?", "boa noite", "olá, vi seu anúncio"]),
+        rng.choice(["quanto é a hora?", "qual o valor?", "quanto você cobra?"]),
+        f"pode ser no {rng.choice(locais)}?",
+        rng.choice(["hoje à noite", "amanhã às 20h", "sábado de tarde", "hoje às 22h"]),
+        f"pago no {rng.choice(pagamentos).lower()}",
+        rng.choice(["fechado então", "combinado, até lá", "ok, confirma pra mim?"]),
+    ]
+
+
+def build_plan(source: str, n: int, store: PersonaStore, dialogs_file: Path,
+               seed: Optional[int]) -> List[Dict[str, Any]]:
+    """N conversas (persona + turnos do cliente), de diálogos gerados ou roteiros por persona."""
+    rng = random.Random(seed)
+    ids = store.ids()
+    if source == "dialogs":
+        pool = load_conversations(dialogs_file)
+        plan = []
+        for i in range(n):
+            conv = dict(pool[i % len(pool)])
+            try:
+                store.get(conv["persona_id"])
+            except PersonaNotFound:
+                conv["persona_id"] = ids[i % len(ids)]
+            plan.append(conv)
+        return plan
+    return [{"persona_id": ids[i % len(ids)], "turns": persona_script(store.get(ids[i % len(ids)]), rng)}
+            for i in range(n)]
+
+
+def run_conversation(index: int, conv: Dict[str, Any], client: ProviderClient, store: PersonaStore,
+                     fast_path: bool, think: Optional[LatencyModel], recorder: Recorder,
+                     orchestrator: Optional[MessageOrchestrator] = None,
+                     batcher: Optional[IntentBatcher] = None) -> Dict[str, Any]:
+    conversation_id = f"sim-{index}"
+    if orchestrator is not None:
+        session = orchestrator.conversation(conversation_id, conv["persona_id"])
+    else:
+        session = Conversation(conv["persona_id"], conversation_id=conversation_id, client=client, store=store,
+                               fast_path=fast_path, intent_options={"batcher": batcher})
+    for message in conv["turns"]:
+        if think is not None:
+            time.sleep(think.sample())
+        try:
+            if orchestrator is not None:
+                result = orchestrator.process(conversation_id, conv["persona_id"], message)
+            else:
+                result = session.handle(message)
+        except Exception as e:
+            recorder.error("mensagem", e)
+            continue
+        recorder.ok("mensagem", result["total_s"])
+        recorder.ok("reply", result["reply_s"])
+        if "intent_s" in result:
+            recorder.ok("intent", result["intent_s"])
+    return {"id": conversation_id, "turns": session.turns, "booking_complete": session.booking_complete()}
+
+
+def simulate(client: ProviderClient, plan: List[Dict[str, Any]], fast_path: bool = True,
+             think: Optional[LatencyModel] = None, store: Optional[PersonaStore] = None,
+             parallel: bool = False, batch: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Roda todas as conversas do plano ao mesmo tempo (uma thread por conversa ativa).
+    parallel=True: resposta e intents de cada mensagem em paralelo (MessageOrchestrator).
+    batch: opções do IntentBatcher (max_batch, max_wait) pra mandar os intents em micro-lotes.
+    """
+    store = store or get_store()
+    recorder = Recorder()
+    batcher = IntentBatcher(client=client, store=store, fast_path=fast_path, **batch) if batch is not None else None
+    orchestrator = None
+    if parallel:
+        orchestrator = MessageOrchestrator(client=client, store=store, workers=max(1, len(plan)),
+                                           stream=False, fast_path=fast_path, intent_batcher=batcher)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(plan))) as pool:
+            results = list(pool.map(
+                lambda item: run_conversation(item[0], item[1], client, store, fast_path, think, recorder,
+                                              orchestrator, batcher),
+                enumerate(plan)))
+    finally:
+        if orchestrator is not None:
+            orchestrator.close()
+        if batcher is not None:
+            batcher.close()
+    wall = time.perf_counter() - started
+    messages = sum(r["turns"] for r in results)
+    report = {
+        "active_chats": len(plan),
+        "messages": messages,
+        "wall_s": wall,
+        "throughput_msgs_s": messages / wall if wall else None,
+        "bookings": sum(1 for r in results if r["booking_complete"]),
+        "latency_s": {path: summarize(values) for path, values in recorder.latencies.items()},
+        "errors": recorder.errors,
+    }
+    if batcher is not None:
+        report["intent_batches"] = batcher.stats.as_dict()
+    return report
+
+
+def print_level(report: Dict[str, Any]):
+    msg = report["latency_s"].get("mensagem", {"n": 0})
+    if msg["n"]:
+        lat = f"p50={msg['p50'] * 1000:.0f}ms p95={msg['p95'] * 1000:.0f}ms p99={msg['p99'] * 1000:.0f}ms"
+    else:
+        lat = "sem mensagens concluídas"
+    errors = sum(sum(e.values()) for e in report["errors"].values())
+    print(f"{report['active_chats']:>6} {report['messages']:>9} {report['wall_s']:>8.2f}s "
+          f"{report['throughput_msgs_s']:>8.1f} msg/s  {lat}  agendamentos={report['bookings']} erros={errors}")
+    b = report.get("intent_batches")
+    if b and b["batches"]:
+        print(f"{'':>6} lotes de intents: {b['batches']} (média {b['avg_batch_size']:.1f}, máx {b['max_batch_size']}) "
+              f"| atraso de fila p50={b['queue_delay_p50'] * 1000:.0f}ms p95={b['queue_delay_p95'] * 1000:.0f}ms "
+              f"| caminho rápido={b['fast']} refeitos={b['fallbacks']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula N conversas simultâneas passando por IA 1 (resposta) e IA 2 (intents).")
+    parser.add_argument("--chats", default="1,10,50", help="níveis de conversas ativas, ex.: 1,10,50,100")
+    parser.add_argument("--source", choices=["dialogs", "persona"], default="persona",
+                        help="turnos do cliente: diálogos gerados ou roteiro sintético por persona")
+    parser.add_argument("--dialogs", type=Path, default=DIALOGS_FILE)
+    parser.add_argument("--think", default=None, help="pausa do cliente entre mensagens (ex.: uniform:0.5:2)")
+    parser.add_argument("--no-fast-path", action="store_true")
+    parser.add_argument("--parallel", action="store_true", help="resposta e intents em paralelo por mensagem")
+    parser.add_argument("--batch-intents", action="store_true", help="intents em micro-lotes entre conversas")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait", type=float, default=0.05, help="espera máxima pra fechar um lote (s)")
+    parser.add_argument("--real", action="store_true", help="usa o provider do config.json em vez do mock local")
+    parser.add_argument("--latency", default="lognormal:0.3:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", type=Path, default=None, help="grava os relatórios em JSON")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.chats.split(",") if x.strip()]
+    store = get_store()
+    think = LatencyModel(args.think, args.seed) if args.think else None
+    server = None
+    if args.real:
+        client = get_client()
+    else:
+        server = MockProviderServer(MockConfig(args.latency, args.error_rate, tokens_per_sec=args.tokens_per_sec,
+                                               seed=args.seed)).start()
+        client = ProviderClient(settings=server.settings(), pool_size=max(10, max(levels) * 2))
+
+    reports = []
+    print(f"{'chats':>6} {'mensagens':>9} {'tempo':>9} {'vazão':>14}  latência por mensagem (resposta + intents)")
+    try:
+        for n in levels:
+            plan = build_plan(args.source, n, store, args.dialogs, args.seed)
+            report = simulate(client, plan, fast_path=not args.no_fast_path, think=think, store=store,
+                              parallel=args.parallel,
+                              batch={"max_batch": args.max_batch, "max_wait": args.max_wait} if args.batch_intents else None)
+            reports.append(report)
+            print_level(report)
+    finally:
+        if server is not None:
+            client.close()
+            server.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import sys
+import time
+import random
+import argparse
+import threading
+import socketserver
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Subconjunto do SMTP suficiente pro smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    server: "_SinkServer"
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        self.server.count("connections")
+        self.reply("220 smtp-sink pronto")
+        mail_from, rcpts = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            cmd = raw.decode("utf-8", "replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 smtp-sink")
+            elif verb == "MAIL":
+                mail_from, rcpts = cmd[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpts.append(cmd[8:].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 termine com <CRLF>.<CRLF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                if self.server.should_fail():
+                    self.server.count("rejected")
+                    self.reply("451 falha temporária simulada")
+                else:
+                    self.server.store(mail_from, rcpts, b"".join(lines))
+                    self.reply("250 OK enfileirado")
+            elif verb == "RSET":
+                mail_from, rcpts = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 tchau")
+                return
+            else:
+                self.reply("502 comando não suportado")
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, fail_rate: float, seed: Optional[int]):
+        super().__init__(addr, _SmtpHandler)
+        self.fail_rate = fail_rate
+        self.messages: List[Dict[str, object]] = []
+        self.counters: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.fail_rate > 0 and self._rng.random() < self.fail_rate
+
+    def store(self, mail_from: Optional[str], rcpts: List[str], data: bytes):
+        with self._lock:
+            self.messages.append({"from": mail_from, "to": rcpts, "data": data, "received": time.time()})
+            self.counters["messages"] = self.counters.get("messages", 0) + 1
+
+
+class SmtpSink:
+    """Servidor SMTP local que só guarda as mensagens (pra testar notificações sem mandar e-mail)."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, fail_rate: float = 0.0, seed: Optional[int] = None):
+        self._server = _SinkServer((host, port), fail_rate, seed)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def messages(self) -> List[EmailMessage]:
+        return [message_from_bytes(m["data"], policy=policy.default) for m in list(self._server.messages)]
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return dict(self._server.counters)
+
+    def start(self) -> "SmtpSink":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "SmtpSink":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sink SMTP local: recebe e imprime os e-mails, sem entregar.")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fração de DATA respondidos com 451")
+    args = parser.parse_args()
+    sink = SmtpSink(port=args.port, fail_rate=args.fail_rate).start()
+    print(f"Sink SMTP ouvindo em {sink.host}:{sink.port} (Ctrl+C pra sair)")
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for msg in sink.messages[seen:]:
+                print(f"Para: {msg['To']} | Assunto: {msg['Subject']}\n{msg.get_content().strip()}")
+                seen += 1
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,36 @@
 import requests
-from configs.config_loader import get_provider_config
+from app.ai_provider import ProviderClient
 
 
 def main():
-    # Carregar provider e settings do config.json
-    provider, settings = get_provider_config()
-    print(f"Usando provider: {provider}")
-
-    # Pegar chave de API e endpoint do provider
-    api_key = settings.get("api_key")
-    endpoint = settings.get("endpoint")
-    model = settings.get("model", "gpt-3.5-turbo")
-
-    if not api_key or not endpoint:
-        raise ValueError("Configuração inválida: api_key ou endpoint ausentes")
-
-    # Cabeçalhos da requisição
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-
-    # Payload para testar a requisição
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": "Você é uma IA de teste."},
-            {"role": "user", "content": "Olá, pode confirmar que está funcionando?"},
-        ],
-    }
+    # Carregar provider e settings do config.json (uma vez, via cliente compartilhado)
+    client = ProviderClient()
+    print(f"Usando provider: {client.provider}")
+    print(f"Endpoint: {client.endpoint}")
 
-    # Enviar requisição
-    response = requests.post(endpoint, headers=headers, json=payload)
+    # Modelo configurado no provider (ou fallback de teste)
+    model = client.settings.get("model", "gpt-3.5-turbo")
+
+    # Mensagens para testar a requisição
+    messages = [
+        {"role": "system", "content": "Você é uma IA de teste."},
+        {"role": "user", "content": "Olá, pode confirmar que está funcionando?"},
+    ]
 
-    # Mostrar saída bruta (debug)
-    print("Status code:", response.status_code)
-    print("Resposta bruta:", response.text)
+    # Enviar requisição
+    try:
+        data = client.chat_completion({"model": model, "messages": messages})
+    except requests.exceptions.HTTPError as e:
+        # Mostrar saída bruta (debug)
+        print("Status code:", e.response.status_code)
+        print("Resposta bruta:", e.response.text)
+        return
 
     try:
-        data = response.json()
         print("Resposta da AI:", data["choices"][0]["message"]["content"])
     except Exception as e:
         print("Erro ao processar resposta:", e)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
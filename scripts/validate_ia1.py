@@ -1,97 +1,95 @@
+import sys
 import requests
 import json
 from pathlib import Path
 
 # Caminho do projeto
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
 
-# Carregar personas de personas_gp.json
-def load_personas():
-    personas_file = PROJECT_ROOT / "data" / "personas" / "personas_gp.json"
-    with open(personas_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data["garotas"]
+from app.ai_provider import StreamStats, get_client
+from app.model_router import ModelRouter
+from app.persona import get_store
+from app.reply_cache import ReplyCache
+from app.services.chat_service import ChatService
+from configs.config_loader import get_routing_config
 
-# Carregar config de config.json
-def load_config():
-    config_file = PROJECT_ROOT / "configs" / "config.json"
-    with open(config_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Índice de personas (personas_gp.json), lidas sob demanda por id
+store = get_store()
 
-# Escolher garota (1 a 10)
-garota_num = int(input("Escolha o número da garota (1 a 10): ")) - 1
-if not 0 <= garota_num <= 9:
-    raise ValueError("Número da garota deve ser de 1 a 10.")
+# Escolher garota (id, ex.: gp003, ou número)
+persona_id = store.resolve(input(f"Escolha a garota (id ou número de 1 a {len(store)}): "))
+garota = store.get(persona_id)
 
-# Carregar personas e selecionar garota
-personas = load_personas()
-garota = personas[garota_num]
+# Cliente do provider (config carregada uma vez, conexões reaproveitadas)
+client = get_client()
+ROUTING = True  # True: turnos rotineiros no default_model_ia2, complexos/fechamento no default_model_ia1
+STREAM = True  # True: entrega frase a frase conforme o modelo gera (mede TTFT e tokens/s)
+CACHE = True  # True: reaproveita respostas de mensagens repetidas (sem chamar o provider)
+REPLY_CACHE_FILE = PROJECT_ROOT / "data" / "cache" / "replies.sqlite3"  # None = só memória
 
-# Carregar config
-config = load_config()
-API_KEY = config["settings"]["api_key"]
-ENDPOINT = config["settings"]["endpoint"]
-MODEL = "openai/gpt-4o"
+# Cache de respostas (LRU + TTL, persistido em disco)
+reply_cache = ReplyCache(max_entries=2000, ttl=6 * 3600, path=REPLY_CACHE_FILE, history_window=2) if CACHE else None
 
-# Histórico da conversa
-conversation_history = []
+PROMPT_BUDGET = 1200  # teto de tokens do prompt (system + resumo + histórico + mensagem)
+SUMMARIZE = True  # True: turnos que saem da janela viram um resumo curto
 
-# Prompt com perfil da garota
-system_prompt = (
-    f"Você é {garota['nome']}, {garota['idade']} anos, de {garota['localizacao']['cidade']}, {garota['localizacao']['bairro']}. "
-    f"Descrição: {garota['personalidade']['descricao']}. "
-    f"Limites: {', '.join(garota['personalidade']['tabus'])}. "
-    f"Preço: {garota['profissional']['preco_base']['valor']} BRL/h. "
-    f"Gostos: {', '.join(garota['personalidade']['gostos'])}. "
-    f"Fetiches: {', '.join(garota['personalidade']['fetiches'])}. "
-    f"Características físicas: {', '.join(garota['aparencia']['corpo']['caracteristicas'])}. "
-    f"Locais de atendimento: {', '.join(garota['localizacao']['locais_atendimento'])}. "
-    "Responda como ela, em português do Brasil, de forma realista e fiel ao perfil, usando tom definido pela descrição. "
-    "Seja breve, direto e use gírias ou tom sofisticado conforme a personalidade. "
-    "Respeite os limites estritamente, negando pedidos fora deles com charme. "
-    "Se explícito, use linguagem quente (pra garotas safadas) ou sensual (pra elegantes) após consentimento. "
-    "Inclua referências a São Paulo (ex: bairro, motel) se fizer sentido. "
-    "Responda só a mensagem, sem emojis ou texto extra."
-)
+# Roteador de modelos (pequeno x grande por turno, com latência/custo por rota)
+router = ModelRouter.from_client(client, get_routing_config()) if ROUTING else None
+
+# Conversa (histórico + janela de contexto por orçamento de tokens); sem roteador usa o default_model_ia1
+chat = ChatService(persona_id, client=client, store=store, cache=reply_cache,
+                   prompt_budget=PROMPT_BUDGET, summarize=SUMMARIZE, router=router)
 
 # Função pra gerar resposta com debug
 def get_response(client_message):
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ] + conversation_history[-5:] + [
-        {"role": "user", "content": client_message}
-    ]
-    payload = {
-        "model": MODEL,
-        "messages": messages,
-        "temperature": 0.8,
-        "max_tokens": 200
-    }
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/your-repo/whatsapp-autoresponder",
-        "X-Title": "whatsapp-autoresponder"
-    }
     try:
-        response = requests.post(ENDPOINT, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return chat.reply(client_message)
     except requests.exceptions.HTTPError as e:
         print(f"Erro HTTP: {e.response.text}")
-        print(f"Payload enviado: {json.dumps(payload, indent=2)}")
+        print(f"Payload enviado: {json.dumps(chat.payload(client_message), indent=2)}")
         raise
 
+# Variante em streaming: devolve frases completas assim que ficam prontas
+def get_response_stream(client_message, stats=None):
+    try:
+        yield from chat.reply_stream(client_message, stats)
+    except requests.exceptions.HTTPError as e:
+        print(f"Erro HTTP: {e.response.text}")
+        raise
+
+def format_stats(stats):
+    ttft = f"{stats.ttft:.2f}s" if stats.ttft is not None else "-"
+    tps = f"{stats.tokens_per_sec:.1f}" if stats.tokens_per_sec is not None else "-"
+    total = f"{stats.total:.2f}s" if stats.total is not None else "-"
+    return (f"[{stats.model}] TTFT: {ttft} | total: {total} | tokens: {stats.tokens} | tokens/s: {tps} "
+            f"| prompt: {chat.context.last_prompt_tokens} tokens")
+
 # Loop interativo
 print(f"Simulando conversa com {garota['nome']}. Digite 'sair' pra encerrar.")
 while True:
     client_message = input("Você (cliente): ")
     if client_message.lower() == "sair":
+        if CACHE:
+            print(f"Cache de respostas: {json.dumps(reply_cache.stats(), ensure_ascii=False)}")
+            reply_cache.close()
+        if router is not None:
+            print(f"Roteamento de modelos: {json.dumps(router.report(), ensure_ascii=False)}")
         break
     try:
-        response = get_response(client_message)
-        print(f"{garota['nome']}: {response}")
-        conversation_history.append({"role": "user", "content": client_message})
-        conversation_history.append({"role": "assistant", "content": response})
+        if STREAM:
+            stats = StreamStats()
+            sentences = []
+            for sentence in get_response_stream(client_message, stats):
+                # cada frase já pode ser entregue ao cliente
+                print(f"{garota['nome']}: {sentence}", flush=True)
+                sentences.append(sentence)
+            response = " ".join(sentences)
+            print(format_stats(stats))
+        else:
+            response = get_response(client_message)
+            print(f"{garota['nome']}: {response}")
+        chat.record(client_message, response)
     except Exception as e:
         print(f"Erro: {str(e)}")
\ No newline at end of file
@@ -1,116 +1,89 @@
+import sys
 import requests
 import json
 from pathlib import Path
 
 # Caminho do projeto
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
 
-# Carregar personas de personas_gp.json
-def load_personas():
-    personas_file = PROJECT_ROOT / "data" / "personas" / "personas_gp.json"
-    with open(personas_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data["garotas"]
+from app.ai_provider import get_client
+from app.conversation_state import ConversationStateStore, MemoryBackend
+from app.notifications import NotificationDispatcher, SmtpSender
+from app.persona import get_store
+from app.services.intent_service import IntentAnalyzer
+from configs.config_loader import get_email_config
+from scripts.smtp_sink import SmtpSink
 
-# Carregar config de config.json
-def load_config():
-    config_file = PROJECT_ROOT / "configs" / "config.json"
-    with open(config_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Índice de personas (personas_gp.json), lidas sob demanda por id
+store = get_store()
 
-# Escolher garota (1 a 10)
-garota_num = int(input("Escolha o número da garota (1 a 10): ")) - 1
-if not 0 <= garota_num <= 9:
-    raise ValueError("Número da garota deve ser de 1 a 10.")
+# Escolher garota (id, ex.: gp003, ou número)
+persona_id = store.resolve(input(f"Escolha a garota (id ou número de 1 a {len(store)}): "))
+garota = store.get(persona_id)
 
-# Carregar personas e selecionar garota
-personas = load_personas()
-garota = personas[garota_num]
+# Cliente do provider (config carregada uma vez, conexões reaproveitadas)
+client = get_client()
+MODEL = client.models.get("ia2") or client.default_model  # default_model_ia2 do config.json (modelo pequeno)
+FAST_PATH = True  # True: resolve casos óbvios com regras locais antes de chamar o LLM
 
-# Carregar config
-config = load_config()
-API_KEY = config["settings"]["api_key"]
-ENDPOINT = config["settings"]["endpoint"]
-MODEL = "openai/gpt-4o"
+# Análise de intents (regras pré-compiladas da garota + LLM)
+analyzer = IntentAnalyzer(persona_id, client=client, store=store, model=MODEL, fast_path=FAST_PATH)
 
-# Histórico de intents
-detected_intents = {"local": "", "data": "", "pagamento": "", "fora_do_perfil": ""}
-
-# Prompt pra análise de intents
-system_prompt = (
-    f"Você é uma IA que analisa mensagens de um cliente para uma acompanhante chamada {garota['nome']}. "
-    f"Limites da garota: {', '.join(garota['personalidade']['tabus'])}. "
-    f"Locais de atendimento: {', '.join(garota['localizacao']['locais_atendimento'])}. "
-    f"Detecte nas mensagens: "
-    f"- Local (ex.: 'motel X', 'Pinheiros'). "
-    f"- Data (ex.: 'amanhã às 20h', 'hoje à noite'). "
-    f"- Forma de pagamento (ex.: 'Pix', 'dinheiro'). "
-    f"- Pedidos fora do perfil (ex.: algo nos tabus ou não listado em locais/serviços). "
-    f"Responda com um JSON estrito contendo: "
-    f"{{\"intents\": {{\"local\": \"\", \"data\": \"\", \"pagamento\": \"\", \"fora_do_perfil\": \"\"}}}}. "
-    f"Se nada for detectado, deixe os campos vazios. Responda só o JSON."
-)
+# Estado de intents da conversa (conv:{id}:state); troque por RedisBackend(LocalRedis()) pra simular o Redis
+state_store = ConversationStateStore(MemoryBackend(max_entries=1000), ttl=24 * 3600)
+CONVERSATION_ID = f"repl-{persona_id}"
 
 # Função pra analisar intents
 def analyze_intents(client_message):
-    payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": client_message}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 150
-    }
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/your-repo/whatsapp-autoresponder",
-        "X-Title": "whatsapp-autoresponder-intent-analysis"
-    }
     try:
-        response = requests.post(ENDPOINT, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return json.loads(response.json()["choices"][0]["message"]["content"])
+        return analyzer.analyze(client_message)
     except requests.exceptions.HTTPError as e:
         print(f"Erro HTTP: {e.response.text}")
-        print(f"Payload enviado: {json.dumps(payload, indent=2)}")
+        print(f"Payload enviado: {json.dumps(analyzer.payload(client_message), indent=2)}")
         raise
     except json.JSONDecodeError:
         print("Erro: Resposta da API não é um JSON válido.")
         raise
 
-# Função pra simular envio de e-mail
-def simulate_email(garota, intents):
-    telefone = "123-456-7890"  # Placeholder, substitua por número real se disponível
-    if intents["intents"]["local"] and intents["intents"]["data"] and intents["intents"]["pagamento"]:
-        mensagem = (
-            f"O cliente de número de telefone {telefone} quer marcar com você no {intents['intents']['local']}, "
-            f"{intents['intents']['data']}, e o pagamento será {intents['intents']['pagamento']}. "
-            f"Por favor, entre em contato e confirme o agendamento."
-        )
-        print(f"Enviando e-mail para {garota['nome']} ({garota['localizacao']['cidade']}, {garota['localizacao']['bairro']}):")
-        print(f"Assunto: Confirmação de agendamento")
-        print(f"Corpo: {mensagem}")
-    elif intents["intents"]["fora_do_perfil"]:
-        mensagem = (
-            f"O cliente de número de telefone {telefone} está interessado em {intents['intents']['fora_do_perfil']}. "
-            f"Por favor, entre em contato e finalize o atendimento."
-        )
-        print(f"Enviando e-mail para {garota['nome']} ({garota['localizacao']['cidade']}, {garota['localizacao']['bairro']}):")
-        print(f"Assunto: Solicitação fora do perfil")
-        print(f"Corpo: {mensagem}")
+# Notificações (e-mail) em fila de background: não atrasam a conversa, sem duplicadas
+EMAIL_MODE = "sink"  # "sink": SMTP local que só guarda as mensagens; "smtp": servidor do config.json
+TELEFONE = "123-456-7890"  # Placeholder, substitua por número real se disponível
+sink = None
+if EMAIL_MODE == "sink":
+    sink = SmtpSink().start()
+    sender = SmtpSender(sink.host, sink.port, from_addr="atendimento@localhost")
+else:
+    sender = SmtpSender.from_config(get_email_config())
+dispatcher = NotificationDispatcher(sender)
+
+def notify(garota, intents):
+    queued = dispatcher.notify_intents(CONVERSATION_ID, garota, intents["intents"], telefone=TELEFONE)
+    if queued:
+        print(f"Notificação enfileirada para {garota['nome']} ({garota['localizacao']['cidade']}, {garota['localizacao']['bairro']})")
 
 # Loop interativo
 print(f"Analisando intents para {garota['nome']}. Digite 'sair' pra encerrar.")
 while True:
     client_message = input("Você (cliente): ")
     if client_message.lower() == "sair":
+        if FAST_PATH:
+            print(f"Caminho rápido: {json.dumps(analyzer.matcher.stats.as_dict(), ensure_ascii=False)}")
+        dispatcher.close()
+        print(f"Notificações: {json.dumps(dispatcher.stats, ensure_ascii=False)}")
+        if sink is not None:
+            for msg in sink.messages:
+                print(f"E-mail recebido no sink: {msg['Subject']} -> {msg.get_content().strip()}")
+            sink.stop()
         break
     try:
         intents = analyze_intents(client_message)
-        detected_intents.update(intents["intents"])
-        print(f"Intents detectados: {json.dumps(detected_intents, ensure_ascii=False)}")
-        simulate_email(garota, {"intents": detected_intents})
+        state, changed, completed = state_store.merge(CONVERSATION_ID, intents["intents"], persona_id)
+        if changed:
+            print(f"Intents detectados: {json.dumps(state.intents, ensure_ascii=False)}")
+        # e-mail só quando o agendamento fecha ou aparece pedido fora do perfil novo
+        if completed or "fora_do_perfil" in changed:
+            notify(garota, {"intents": state.intents})
     except Exception as e:
         print(f"Erro: {str(e)}")
\ No newline at end of file
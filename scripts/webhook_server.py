@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List
+
+import requests
+
+# Caminho do projeto
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from app.ai_provider import ProviderClient, get_client
+from app.analytics import AnalyticsStore
+from app.persona import get_store
+from app.provider_router import build_router
+from app.services.orchestrator import MessageOrchestrator
+from app.webhook import (DEBOUNCE, MAX_DELAY, WORKERS, InboundMessage, UltraMsgSender, WebhookIngestor,
+                         WebhookServer, conversation_handler)
+from configs.config_loader import load_config
+from scripts.load_test import summarize
+from scripts.mock_provider import MockConfig, MockProviderServer
+from scripts.simulate_conversations import persona_script
+
+
+class ReplyWaiter:
+    """Marca quais mensagens já foram respondidas e acorda o cliente que espera por elas."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.answered: set = set()
+
+    def mark(self, burst: List[InboundMessage]):
+        with self._cond:
+            self.answered.update(m.message_id for m in burst)
+            self._cond.notify_all()
+
+    def wait(self, message_id: str, timeout: float = 60) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while message_id not in self.answered:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+
+def meta_payload(phone: str, text: str, message_id: str, phone_number_id: str = "bench") -> Dict[str, Any]:
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {
+        "metadata": {"phone_number_id": phone_number_id},
+        "messages": [{"from": phone, "id": message_id, "timestamp": str(int(time.time())),
+                      "type": "text", "text": {"body": text}}]}}]}]}
+
+
+def run_client(index: int, url: str, turns: List[str], burst: int, gap: float, think: float,
+               waiter: ReplyWaiter, latencies: List[float], rng: random.Random):
+    """Manda os turnos em rajadas de `burst` mensagens e espera a resposta antes da próxima rajada."""
+    phone = f"55119{index:08d}"
+    session = requests.Session()
+    for start in range(0, len(turns), burst):
+        chunk = turns[start:start + burst]
+        for i, text in enumerate(chunk):
+            if i:
+                time.sleep(gap * rng.uniform(0.5, 1.5))
+            message_id = f"wamid.{index}.{start + i}"
+            resp = session.post(url, json=meta_payload(phone, text, message_id), timeout=10)
+            resp.raise_for_status()
+        sent_at = time.perf_counter()
+        # latência até a resposta que já leva em conta a última mensagem da rajada
+        if waiter.wait(message_id):
+            latencies.append(time.perf_counter() - sent_at)
+        time.sleep(think)
+    session.close()
+
+
+def simulate(args):
+    store = get_store()
+    ids = store.ids()
+    rng = random.Random(args.seed)
+    mock = MockProviderServer(MockConfig(args.latency, tokens_per_sec=args.tokens_per_sec, seed=args.seed)).start()
+    client = ProviderClient(settings=mock.settings(), pool_size=max(10, args.simulate * 2))
+    orchestrator = MessageOrchestrator(client, store, workers=args.workers, stream=True)
+    waiter = ReplyWaiter()
+    handle = conversation_handler(orchestrator, lambda msg: ids[int(msg.phone) % len(ids)], lambda phone, text: None)
+
+    def handler(phone: str, burst: List[InboundMessage]):
+        handle(phone, burst)
+        waiter.mark(burst)
+
+    ingestor = WebhookIngestor(handler, workers=args.workers, debounce=args.debounce, max_delay=args.max_delay)
+    latencies: List[float] = []
+    plans = [persona_script(store.get(ids[i % len(ids)]), rng) for i in range(args.simulate)]
+    with WebhookServer(ingestor, port=0) as server:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.simulate) as pool:
+            futures = [pool.submit(run_client, i, server.url, plans[i], args.burst, args.gap, args.think,
+                                   waiter, latencies, random.Random(rng.random())) for i in range(args.simulate)]
+            for f in futures:
+                f.result()
+        elapsed = time.perf_counter() - started
+        ingestor.close()
+    orchestrator.close()
+    client.close()
+    mock.stop()
+    report = {
+        "clients": args.simulate, "burst": args.burst, "debounce_s": args.debounce, "elapsed_s": elapsed,
+        "ingest": ingestor.report(), "orchestrator": dict(orchestrator.stats),
+        "provider_requests": mock.counters.get("requests", 0),
+        "ack": summarize(server.ack_times), "reply_after_burst": summarize(latencies),
+    }
+    ing = report["ingest"]
+    print(f"Clientes: {args.simulate} | mensagens: {ing['received']} | rajadas: {ing['bursts']} "
+          f"({ing['messages_per_burst'] or 0:.2f} msg/rajada) | debounce {args.debounce}s | tempo {elapsed:.1f}s")
+    print(f"  chamadas ao provider: {report['provider_requests']} | respostas: {report['orchestrator']['replies']} "
+          f"| reentregas descartadas: {ing['duplicates']} | erros: {ing['handler_errors']}")
+    for name in ("ack", "reply_after_burst"):
+        s = report[name]
+        if s["n"]:
+            print(f"  {name:<18} n={s['n']:<5} p50={s['p50'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms "
+                  f"p99={s['p99'] * 1000:.0f}ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def serve(args):
+    store = get_store()
+    persona_id = args.persona or store.ids()[0]
+    if args.dry_run:
+        send = lambda phone, text: print(f"-> {phone}: {text}")
+    else:
+        send = UltraMsgSender.from_config(load_config()["ultra_msg"])
+    analytics = AnalyticsStore()  # data/analytics: eventos + rollup do analytics_daily
+    # --routes openrouter,outro:modelo -> hedge/failover entre providers do config.json
+    client = build_router([s.strip() for s in args.routes.split(",") if s.strip()]) if args.routes else get_client()
+    orchestrator = MessageOrchestrator(client, store, workers=args.workers, stream=True, analytics=analytics)
+    ingestor = WebhookIngestor(conversation_handler(orchestrator, lambda msg: persona_id, send),
+                               workers=args.workers, debounce=args.debounce, max_delay=args.max_delay)
+    server = WebhookServer(ingestor, host=args.host, port=args.port,
+                           verify_token=os.getenv("WHATSAPP_VERIFY_TOKEN"),
+                           app_secret=os.getenv("WHATSAPP_APP_SECRET")).start()
+    print(f"Webhook ouvindo em {server.url} (persona {persona_id}, debounce {args.debounce}s; Ctrl+C pra sair)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        ingestor.close()
+        orchestrator.close()
+        analytics.close()
+        if args.routes:
+            print(json.dumps(client.report(), ensure_ascii=False))
+            client.close()
+        print(json.dumps(ingestor.report(), ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook do WhatsApp: responde na hora, agrupa rajadas por cliente.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--persona", default=None, help="garota que responde (padrão: a primeira do store)")
+    parser.add_argument("--dry-run", action="store_true", help="imprime as respostas em vez de enviar pelo UltraMsg")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--routes", default=None,
+                        help="providers em ordem de preferência (ex.: openrouter,runpod) com hedge e failover")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE, help="silêncio que fecha a rajada (s)")
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY, help="espera máxima desde a 1ª mensagem (s)")
+    parser.add_argument("--simulate", type=int, default=0, help="N clientes simulados contra o mock local")
+    parser.add_argument("--burst", type=int, default=3, help="mensagens por rajada na simulação")
+    parser.add_argument("--gap", type=float, default=0.3, help="intervalo médio entre mensagens da rajada (s)")
+    parser.add_argument("--think", type=float, default=0.5, help="pausa do cliente depois da resposta (s)")
+    parser.add_argument("--latency", default="lognormal:0.3:0.5", help="distribuição do mock (ver mock_provider)")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", type=Path, default=None, help="grava o relatório da simulação em JSON")
+    args = parser.parse_args()
+    if args.simulate:
+        simulate(args)
+    else:
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()